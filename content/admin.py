@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
-from .models import Comment, Content, Like
+from .models import Comment, CommentLike, Content, ContentLike
 
 
 def delete_selected(modeladmin, request, queryset):
@@ -38,6 +38,10 @@ class ContentAdmin(admin.ModelAdmin):
     
     image_tag.short_description = 'Content Image'
 
+    def get_queryset(self, request):
+        """Load the counters of the listed contents in one query."""
+        return super().get_queryset(request).with_stats()
+
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     """Admin interface for managing comments."""
@@ -50,13 +54,25 @@ class CommentAdmin(admin.ModelAdmin):
     actions = ['delete_selected']
 
 
-@admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
-    """Admin interface for managing likes on contents or comments."""
+@admin.register(ContentLike)
+class ContentLikeAdmin(admin.ModelAdmin):
+    """Admin interface for managing likes on contents."""
+
+    list_display = ('id', 'user', 'content', 'created_date',)
+    list_display_links = ('id',)
+    list_filter = ('created_date', 'user', 'content',)
+    search_fields = ('user__username', 'content__title',)
+    list_per_page = 20
+    actions = ['delete_selected']
+
+
+@admin.register(CommentLike)
+class CommentLikeAdmin(admin.ModelAdmin):
+    """Admin interface for managing likes on comments."""
 
-    list_display = ('id', 'user', 'content', 'comment', 'created_date',)
+    list_display = ('id', 'user', 'comment', 'created_date',)
     list_display_links = ('id',)
-    list_filter = ('created_date', 'user', 'content', 'comment',)
-    search_fields = ('user__username', 'content__title', 'comment__text',)
+    list_filter = ('created_date', 'user',)
+    search_fields = ('user__username', 'comment__text',)
     list_per_page = 20
     actions = ['delete_selected']
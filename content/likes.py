@@ -0,0 +1,293 @@
+"""
+Race-free like toggles for contents and comments.
+
+A toggle checks for the user's like, inserts or deletes it and adjusts
+the target's like_count in one transaction of at most two statements,
+so concurrent toggles (e.g. a double click) never let the counter drift
+away from the like rows:
+
+- PostgreSQL deletes the like and decrements the counter in a single
+  statement; when there was no like, a second one inserts it with
+  ON CONFLICT DO NOTHING and increments the counter by the rows added.
+- SQLite adjusts the counter first, which takes the database write lock,
+  then inserts or deletes the like.
+- Other databases lock the counter row and use the ORM.
+
+Content like counts are kept in the content's first ContentStats row,
+comment like counts on the comment itself. A toggle changes nothing
+while that row is missing; a content's row is then created, counting
+the content's likes, and the toggle run again.
+"""
+
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from user import notifications
+from user.models import Notification
+from .models import (
+    Comment,
+    CommentLike,
+    Content,
+    ContentLike,
+    ContentStats
+)
+from .signals import counts_changed
+
+# Result of a toggle: the new state and count, and the target's author
+# and content for notifications and redirects.
+LikeToggle = namedtuple(
+    'LikeToggle', ['liked', 'like_count', 'author_id', 'content_id']
+)
+
+# Target model, like model and the foreign key between them, and the
+# model and lookup of the row holding the target's like count, per kind.
+TARGETS = {
+    'content': (
+        Content, ContentLike, 'content',
+        ContentStats, lambda target_id: {'content_id': target_id, 'shard': 0},
+    ),
+    'comment': (
+        Comment, CommentLike, 'comment',
+        Comment, lambda target_id: {'pk': target_id},
+    ),
+}
+
+
+def _target(kind):
+    """Return the table names and SQL used by a toggle of kind."""
+
+    model, like_model, field, counter_model, _ = TARGETS[kind]
+    counter = counter_model._meta.db_table
+
+    names = {
+        'target': model._meta.db_table,
+        'like': like_model._meta.db_table,
+        'column': f'{field}_id',
+        'counter': counter,
+    }
+
+    if kind == 'content':
+        names['counter_row'] = 'content_id = %s AND shard = 0'
+        names['author'] = (
+            f'(SELECT author_id FROM {names["target"]} '
+            f'WHERE id = {counter}.content_id)'
+        )
+    else:
+        names['counter_row'] = 'id = %s'
+        names['author'] = 'author_id'
+
+    return names
+
+
+def _toggle_postgresql(cursor, names, user_id, target_id):
+    now = timezone.now()
+
+    cursor.execute(
+        f"""
+        WITH removed AS (
+            DELETE FROM {names['like']}
+            WHERE {names['column']} = %s AND user_id = %s
+                AND EXISTS (
+                    SELECT 1 FROM {names['counter']}
+                    WHERE {names['counter_row']}
+                )
+            RETURNING id
+        )
+        UPDATE {names['counter']}
+        SET like_count = GREATEST(
+            like_count - (SELECT COUNT(*) FROM removed), 0
+        )
+        WHERE {names['counter_row']} AND EXISTS (SELECT 1 FROM removed)
+        RETURNING like_count, {names['author']}, content_id
+        """,
+        [target_id, user_id, target_id, target_id],
+    )
+    row = cursor.fetchone()
+    if row is not None:
+        return False, row, False
+
+    # Nothing removed: add the like unless a concurrent toggle just did
+    cursor.execute(
+        f"""
+        WITH added AS (
+            INSERT INTO {names['like']}
+                ({names['column']}, user_id, created_date)
+            SELECT %s, %s, %s
+            WHERE EXISTS (
+                SELECT 1 FROM {names['counter']}
+                WHERE {names['counter_row']}
+            )
+            ON CONFLICT ({names['column']}, user_id) DO NOTHING
+            RETURNING id
+        )
+        UPDATE {names['counter']}
+        SET like_count = like_count + (SELECT COUNT(*) FROM added)
+        WHERE {names['counter_row']}
+        RETURNING like_count, {names['author']}, content_id,
+            EXISTS (SELECT 1 FROM added)
+        """,
+        [target_id, user_id, now, target_id, target_id],
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None, None, None
+
+    return True, row[:3], row[3]
+
+
+def _toggle_sqlite(cursor, names, user_id, target_id):
+    exists = f"""
+        EXISTS (
+            SELECT 1 FROM {names['like']}
+            WHERE {names['column']} = %s AND user_id = %s
+        )
+    """
+
+    # Writers are serialized from here to the end of the transaction
+    cursor.execute(
+        f"""
+        UPDATE {names['counter']}
+        SET like_count = MAX(
+            like_count + CASE WHEN {exists} THEN -1 ELSE 1 END, 0
+        )
+        WHERE {names['counter_row']}
+        RETURNING like_count, {names['author']}, content_id, {exists}
+        """,
+        [target_id, user_id, target_id, target_id, user_id],
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None, None, None
+
+    if row[3]:
+        cursor.execute(
+            f"""
+            DELETE FROM {names['like']}
+            WHERE {names['column']} = %s AND user_id = %s
+            """,
+            [target_id, user_id],
+        )
+        return False, row[:3], False
+
+    cursor.execute(
+        f"""
+        INSERT INTO {names['like']}
+            ({names['column']}, user_id, created_date)
+        VALUES (%s, %s, %s)
+        """,
+        [target_id, user_id, timezone.now()],
+    )
+    return True, row[:3], True
+
+
+def _toggle_orm(kind, user_id, target_id):
+    model, like_model, field, counter_model, counter_row = TARGETS[kind]
+
+    counter = counter_model.objects.select_for_update().filter(
+        **counter_row(target_id)
+    ).first()
+    if counter is None:
+        return None, None, None
+    target = counter if counter_model is model else (
+        model.objects.get(pk=target_id)
+    )
+
+    likes = like_model.objects.filter(
+        user_id=user_id, **{f'{field}_id': target_id}
+    )
+    content_id = target.pk if field == 'content' else target.content_id
+
+    removed = likes.delete()[0]
+    if removed:
+        like_count = max(counter.like_count - removed, 0)
+        added = False
+    else:
+        like_model.objects.create(user_id=user_id, **{field: target})
+        like_count = counter.like_count + 1
+        added = True
+    counter_model.objects.filter(pk=counter.pk).update(like_count=like_count)
+
+    return not removed, (like_count, target.author_id, content_id), added
+
+
+def _toggle(kind, user_id, target_id):
+    """Toggle the like with the statements of the database in use."""
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            return _toggle_postgresql(
+                cursor, _target(kind), user_id, target_id
+            )
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            return _toggle_sqlite(cursor, _target(kind), user_id, target_id)
+
+    return _toggle_orm(kind, user_id, target_id)
+
+
+def _create_stats(content_id):
+    """
+    Create the missing first stats row of a content, counting its likes.
+    Returns False if the content does not exist.
+    """
+
+    if not Content.objects.filter(pk=content_id).exists():
+        return False
+
+    # A concurrent toggle may create it first
+    ContentStats.objects.get_or_create(
+        content_id=content_id,
+        shard=0,
+        defaults={
+            'like_count': ContentLike.objects.filter(
+                content_id=content_id
+            ).count(),
+        },
+    )
+    return True
+
+
+def _notify(kind, liked, added, user_id, author_id, target_id):
+    """Add the like to, or take it back from, the author's notification."""
+
+    target = {f'{kind}_id': target_id}
+
+    if not liked:
+        notifications.retract(
+            author_id, Notification.NotificationType.LIKE, user_id, **target
+        )
+
+    # Not for a like added by a concurrent toggle
+    elif added:
+        notifications.notify(
+            author_id, Notification.NotificationType.LIKE, user_id, **target
+        )
+
+
+def toggle_like(user, kind, target_id):
+    """
+    Like or unlike a content or comment for user.
+
+    kind is 'content' or 'comment'. Returns a LikeToggle, or None if the
+    target does not exist.
+    """
+
+    with transaction.atomic():
+        liked, row, added = _toggle(kind, user.pk, target_id)
+        if row is None and kind == 'content' and _create_stats(target_id):
+            liked, row, added = _toggle(kind, user.pk, target_id)
+
+        if row is None:
+            return None
+
+        like_count, author_id, content_id = row
+        _notify(kind, liked, added, user.pk, author_id, target_id)
+
+        model = TARGETS[kind][0]
+        transaction.on_commit(
+            lambda: counts_changed.send(model, content_ids=[content_id])
+        )
+
+    return LikeToggle(liked, like_count, author_id, content_id)
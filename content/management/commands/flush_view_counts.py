@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from content.view_counter import request_flush, view_counter
+
+
+class Command(BaseCommand):
+    """
+    Command to force buffered content view counts to be written back.
+    """
+
+    help = ('Asks every worker sharing the cache to flush its buffered '
+            'view counts within a few seconds. Workers only see the '
+            'request through a shared cache backend.')
+
+    def handle(self, *args, **kwargs):
+        # Signal running workers through the shared cache.
+        request_flush()
+
+        # Flush anything buffered in this process as well.
+        flushed = view_counter.flush()
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'View count flush requested ({flushed} views flushed '
+                f'in this process).'
+            )
+        )
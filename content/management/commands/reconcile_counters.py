@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from content.models import (
+    Comment,
+    CommentLike,
+    Content,
+    ContentLike,
+    ContentStats
+)
+
+# Counted model, like model and the foreign key between them, and the
+# table and condition of the row holding the like count. That row also
+# holds the number of likes folded away by the retention policies.
+COUNTERS = (
+    (
+        Content, ContentLike, 'content_id',
+        ContentStats._meta.db_table, 'content_id', 'AND shard = 0',
+    ),
+    (Comment, CommentLike, 'comment_id', Comment._meta.db_table, 'id', ''),
+)
+
+
+class Command(BaseCommand):
+    """
+    Command to recompute the like counts of contents and comments from
+    their like rows.
+    """
+
+    help = ('Recomputes like_count of every content and comment from the '
+            'like tables and folded likes, in id-range chunks, and reports '
+            'the rows corrected.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Number of ids updated per transaction.',
+        )
+
+    def _reconcile_chunk(self, counter, first, last):
+        """Correct the counts of ids first..last, returning rows changed."""
+
+        model, like_model, field, counts_table, key, condition = counter
+        table = model._meta.db_table
+        likes = like_model._meta.db_table
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {counts_table}
+                SET like_count = counts.total + folded_like_count
+                FROM (
+                    SELECT target.id AS id, COUNT(liked.id) AS total
+                    FROM {table} AS target
+                    LEFT JOIN {likes} AS liked ON liked.{field} = target.id
+                    WHERE target.id BETWEEN %s AND %s
+                    GROUP BY target.id
+                ) AS counts
+                WHERE {counts_table}.{key} = counts.id {condition}
+                    AND {counts_table}.like_count
+                        <> counts.total + {counts_table}.folded_like_count
+                """,
+                [first, last],
+            )
+            return cursor.rowcount
+
+    def handle(self, *args, **kwargs):
+        chunk_size = kwargs['chunk_size']
+
+        for counter in COUNTERS:
+            model = counter[0]
+            bounds = model.objects.aggregate(first=Min('pk'), last=Max('pk'))
+            corrected = 0
+
+            # Short transactions, so writers are never blocked for long
+            if bounds['first'] is not None:
+                for first in range(
+                    bounds['first'], bounds['last'] + 1, chunk_size
+                ):
+                    corrected += self._reconcile_chunk(
+                        counter, first, first + chunk_size - 1
+                    )
+
+            # Log the result to the console.
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{model._meta.verbose_name_plural.capitalize()}: '
+                    f'{corrected} like counts corrected.'
+                )
+            )
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from content.models import CommentLike, ContentLike, Like
+
+
+class Command(BaseCommand):
+    """
+    Command to move the rows of the former Like table into the
+    ContentLike and CommentLike tables.
+    """
+
+    help = ('Copies likes from the former combined Like table into the '
+            'content and comment like tables, dropping duplicates, and '
+            'empties the former table.')
+
+    def _copy(self, cursor, like_model, field):
+        """Copy one kind of like, returning the number of rows added."""
+
+        table = like_model._meta.db_table
+        old = Like._meta.db_table
+        other = 'comment_id' if field == 'content_id' else 'content_id'
+
+        # Likes of a known user, the first one of any duplicates
+        cursor.execute(
+            f"""
+            INSERT INTO {table} ({field}, user_id, created_date)
+            SELECT {field}, user_id, MIN(created_date) FROM {old}
+            WHERE {field} IS NOT NULL AND {other} IS NULL
+                AND user_id IS NOT NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM {table} AS existing
+                    WHERE existing.{field} = {old}.{field}
+                        AND existing.user_id = {old}.user_id
+                )
+            GROUP BY {field}, user_id
+            """
+        )
+        added = cursor.rowcount
+
+        # Likes of deleted users still count
+        cursor.execute(
+            f"""
+            INSERT INTO {table} ({field}, user_id, created_date)
+            SELECT {field}, NULL, created_date FROM {old}
+            WHERE {field} IS NOT NULL AND {other} IS NULL
+                AND user_id IS NULL
+            """
+        )
+
+        return added + cursor.rowcount
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic(), connection.cursor() as cursor:
+            content_likes = self._copy(cursor, ContentLike, 'content_id')
+            comment_likes = self._copy(cursor, CommentLike, 'comment_id')
+
+            # Copied rows are removed so that the command can run again
+            cursor.execute(f'DELETE FROM {Like._meta.db_table}')
+            deleted = cursor.rowcount
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Copied {content_likes} content likes and {comment_likes} '
+                f'comment likes; removed {deleted} former likes.'
+            )
+        )
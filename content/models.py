@@ -1,11 +1,25 @@
 from django.contrib.auth.models import User
-from django.core.exceptions import ValidationError
 from django.db import models
 
 from cloudinary.models import CloudinaryField
 from django_ckeditor_5.fields import CKEditor5Field
 
 
+class ContentQuerySet(models.QuerySet):
+    """QuerySet with projections for the content listing pages."""
+
+    def for_listing(self):
+        """
+        Load what content cards render in a single query: the author and
+        profile are joined, while the full text is left unloaded.
+        """
+        return self.select_related('author__profile').defer('text')
+
+    def with_stats(self):
+        """Load the view and like counts with one query per page."""
+        return self.prefetch_related('stats')
+
+
 class Content(models.Model):
     """Model for different types of contents with metadata."""
 
@@ -75,24 +89,22 @@ class Content(models.Model):
         auto_now_add=True,
         verbose_name='Created Date',
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Updated At',
+    )
     is_published = models.BooleanField(
         default=True,
         verbose_name='Is Published',   
     )
-    like_count = models.PositiveIntegerField(
-        default=0,
-        verbose_name='Like Count',
-    )
-    views_count = models.PositiveIntegerField(
-        default=0,
-        verbose_name='Views Count',
-    )
     content_image = CloudinaryField(
         'content_image',
         null=True,
         blank=True,
     )
 
+    objects = ContentQuerySet.as_manager()
+
     def __str__(self):
         """String of content with author if available."""
 
@@ -121,6 +133,20 @@ class Content(models.Model):
         # Return default image based on content type
         return image_mapping.get(self.content_type, 'img/default.jpg')
 
+    def _stats_total(self, field):
+        """Sum a counter over the content's stats rows."""
+        return sum(getattr(stats, field) for stats in self.stats.all())
+
+    @property
+    def views_count(self):
+        """Get the view count, kept in ContentStats."""
+        return self._stats_total('views_count')
+
+    @property
+    def like_count(self):
+        """Get the like count, kept in ContentStats."""
+        return self._stats_total('like_count')
+
     @property
     def total_likes(self):
         """Get total likes for this content."""
@@ -135,6 +161,56 @@ class Content(models.Model):
         ]
 
 
+class ContentStats(models.Model):
+    """
+    Model for the view and like counts of a content.
+
+    The counters are kept apart from the wide Content row so increments
+    rewrite a narrow row only. Every content has a row with shard 0,
+    which holds the like count; the view counts of the most viewed
+    contents are spread over more shards. A counter's value is the sum
+    over its content's rows.
+
+    The like count includes folded_like_count, the likes of deleted
+    users whose rows the retention policies removed.
+    """
+
+    content = models.ForeignKey(
+        Content,
+        related_name='stats',
+        on_delete=models.CASCADE,   # Delete stats if content is deleted
+        db_index=False,             # Leading column of the unique index
+    )
+    shard = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Shard',
+    )
+    views_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Views Count',
+    )
+    like_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Like Count',
+    )
+    folded_like_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Folded Like Count',  # Likes of deleted users, removed
+    )
+
+    class Meta:
+        verbose_name_plural = "Content stats"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content', 'shard'], name='unique_content_stats',
+            ),
+        ]
+
+    def __str__(self):
+        """String of the stats row with its content and shard."""
+        return f"Stats of content {self.content_id} (shard {self.shard})"
+
+
 class Comment(models.Model):
     """Model for comments made on contents."""
 
@@ -162,6 +238,10 @@ class Comment(models.Model):
         default=0,
         verbose_name='Like Count',
     )
+    folded_like_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Folded Like Count',  # Likes of deleted users, removed
+    )
 
     @property
     def total_likes(self):
@@ -185,25 +265,103 @@ class Comment(models.Model):
         return f'Comment by {author_username} on {self.content.title}'
 
 
+class ContentLike(models.Model):
+    """Model for a user's like on a content."""
+
+    content = models.ForeignKey(
+        Content,
+        related_name='likes',
+        on_delete=models.CASCADE,   # Delete likes if content is deleted
+        db_index=False,             # Leading column of the unique index
+    )
+    user = models.ForeignKey(
+        User,
+        related_name='content_likes',
+        on_delete=models.SET_NULL,  # Keep like if user is deleted
+        null=True,                  # Allow user to be NULL
+        blank=True,                 # Allow user field to be blank in forms
+    )
+    created_date = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Created Date',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content', 'user'], name='unique_content_like',
+            ),
+        ]
+
+    def __str__(self):
+        """String of like, showing user and content."""
+
+        username = self.user.username if self.user else "Deleted User"
+
+        return f"Like by {username} on {self.content}"
+
+
+class CommentLike(models.Model):
+    """Model for a user's like on a comment."""
+
+    comment = models.ForeignKey(
+        Comment,
+        related_name='likes',
+        on_delete=models.CASCADE,   # Delete likes if comment is deleted
+        db_index=False,             # Leading column of the unique index
+    )
+    user = models.ForeignKey(
+        User,
+        related_name='comment_likes',
+        on_delete=models.SET_NULL,  # Keep like if user is deleted
+        null=True,                  # Allow user to be NULL
+        blank=True,                 # Allow user field to be blank in forms
+    )
+    created_date = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Created Date',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['comment', 'user'], name='unique_comment_like',
+            ),
+        ]
+
+    def __str__(self):
+        """String of like, showing user and comment."""
+
+        username = self.user.username if self.user else "Deleted User"
+
+        return f"Like by {username} on {self.comment}"
+
+
 class Like(models.Model):
-    """Model for likes on contents or comments."""
+    """
+    Former model for likes on contents or comments.
+
+    Superseded by ContentLike and CommentLike; its rows are copied over
+    by the split_likes command. Kept until every deployment has run it.
+    """
 
     user = models.ForeignKey(
         User,
+        related_name='+',
         on_delete=models.SET_NULL,  # Keep like if user is deleted
         null=True,                  # Allow user to be NULL
         blank=True,                 # Allow user field to be blank in forms
     )
     content = models.ForeignKey(
         Content,
-        related_name='likes',
+        related_name='+',
         on_delete=models.CASCADE,   # Delete likes if content is deleted
         null=True,                  # Allow content to be NULL
         blank=True,                 # Allow content field to be blank in forms
     )
     comment = models.ForeignKey(
         Comment,
-        related_name='likes',
+        related_name='+',
         on_delete=models.CASCADE,   # Delete likes if comment is deleted
         null=True,                  # Allow comment to be NULL
         blank=True,                 # Allow comment field to be blank in forms
@@ -221,24 +379,6 @@ class Like(models.Model):
             models.Index(fields=['comment']),
         ]
 
-    def clean(self):
-        """Validate like is for content or comment, not both."""
-
-        if self.content and self.comment:
-            raise ValidationError(
-                'A like cannot be associated with both content and comment.'
-            )
-
-        if not self.content and not self.comment:
-            raise ValidationError(
-                'A like must be associated with either content or comment.'
-            )
-
-    def save(self, *args, **kwargs):
-        """Save the like after validating with clean method."""
-        self.clean()
-        super().save(*args, **kwargs)
-
     def __str__(self):
         """String of like, showing user and target."""
 
@@ -1,12 +1,32 @@
 import cloudinary
 
 from django.contrib.auth.models import User
-from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
-from django.dispatch import receiver
-
-from content.models import Comment, Content, Like
+from django.db import connections
+from django.db.models.signals import (
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_migrate,
+    pre_save
+)
+from django.dispatch import Signal, receiver
+
+from content.models import (
+    Comment,
+    CommentLike,
+    Content,
+    ContentLike,
+    ContentStats
+)
+from user import notifications
 from user.models import Notification
 
+# Sent once the like or view counts of contents or comments changed, with
+# the ids of the contents whose pages show them as content_ids. The sender
+# is the model whose counts changed, Content or Comment.
+counts_changed = Signal()
+
 
 @receiver(pre_delete, sender=User)
 def update_content_related_models_on_user_delete(sender, instance, **kwargs):
@@ -14,42 +34,115 @@ def update_content_related_models_on_user_delete(sender, instance, **kwargs):
 
     Content.objects.filter(author=instance).update(author=None)
     Comment.objects.filter(author=instance).update(author=None)
-    Like.objects.filter(user=instance).update(user=None)
+    ContentLike.objects.filter(user=instance).update(user=None)
+    CommentLike.objects.filter(user=instance).update(user=None)
 
 
 @receiver(post_save, sender=Comment)
 def create_notification_on_comment(sender, instance, created, **kwargs):
-    """Create a Notification when a Comment is added to a Content."""
-
-    # Only create notification for newly created comments
-    # if content has an author
-    if created and instance.content.author:
-        Notification.objects.create(
-            user=instance.content.author,
-            notification_type=Notification.NotificationType.COMMENT,
-            content=instance.content,
-            comment=instance,
-            from_user=instance.author
+    """Notify the author of a Content of a Comment added to it."""
+
+    # Only notify of newly created comments, gathered per content
+    if created:
+        notifications.notify(
+            instance.content.author_id,
+            Notification.NotificationType.COMMENT,
+            instance.author_id,
+            content_id=instance.content_id,
+        )
+
+
+@receiver(post_save, sender=Content)
+def create_content_stats(sender, instance, created, **kwargs):
+    """Create the stats row holding a new Content's counters."""
+
+    if created:
+        ContentStats.objects.create(content=instance, shard=0)
+
+
+# Table keeping the counters of the former Content columns during migrate.
+LEGACY_COUNTERS_TABLE = 'content_legacy_counters'
+
+
+@receiver(pre_migrate)
+def stash_legacy_counters(sender, using, **kwargs):
+    """
+    Copy the view and like counts aside before the migration that drops
+    them from the Content table runs.
+    """
+
+    if sender.label != 'content':
+        return
+
+    connection = connections[using]
+    table = Content._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return
+
+        columns = {
+            column.name for column in
+            connection.introspection.get_table_description(cursor, table)
+        }
+        if 'views_count' not in columns:
+            return
+
+        cursor.execute(f'DROP TABLE IF EXISTS {LEGACY_COUNTERS_TABLE}')
+        cursor.execute(
+            f'CREATE TABLE {LEGACY_COUNTERS_TABLE} AS '
+            f'SELECT id, views_count, like_count FROM {table}'
         )
 
 
-@receiver(post_save, sender=Like)
-def create_notification_on_like(sender, instance, created, **kwargs):
-    """Create Notification when Like is added to Content or Comment."""
+@receiver(post_migrate)
+def create_missing_content_stats(sender, using, **kwargs):
+    """
+    Give every Content its stats row once migrated, with the counts
+    stashed by stash_legacy_counters if any.
+    """
 
-    # Target of the Like: either Content or Comment
-    target = instance.content or instance.comment
+    if sender.label != 'content':
+        return
 
-    # Only create notification if new Like is created,
-    # target exists, and has an author
-    if created and target and target.author:
-        Notification.objects.create(
-            user=target.author,
-            notification_type=Notification.NotificationType.LIKE,
-            content=instance.content,
-            comment=instance.comment,
-            like=instance,
-            from_user=instance.user
+    connection = connections[using]
+    stats = ContentStats._meta.db_table
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if stats not in tables:
+            return
+
+        if LEGACY_COUNTERS_TABLE in tables:
+            cursor.execute(
+                f"""
+                INSERT INTO {stats} (
+                    content_id, shard, views_count, like_count,
+                    folded_like_count
+                )
+                SELECT legacy.id, 0, legacy.views_count, legacy.like_count, 0
+                FROM {LEGACY_COUNTERS_TABLE} AS legacy
+                WHERE EXISTS (
+                    SELECT 1 FROM {Content._meta.db_table}
+                    WHERE id = legacy.id
+                ) AND NOT EXISTS (
+                    SELECT 1 FROM {stats}
+                    WHERE content_id = legacy.id AND shard = 0
+                )
+                """
+            )
+            cursor.execute(f'DROP TABLE {LEGACY_COUNTERS_TABLE}')
+
+        cursor.execute(
+            f"""
+            INSERT INTO {stats} (
+                content_id, shard, views_count, like_count, folded_like_count
+            )
+            SELECT content.id, 0, 0, 0, 0
+            FROM {Content._meta.db_table} AS content
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {stats}
+                WHERE content_id = content.id AND shard = 0
+            )
+            """
         )
 
 
@@ -1 +1,236 @@
+from django.contrib.auth.models import User
+from django.db import transaction
 from django.test import TestCase
+
+from user.models import Notification
+from .likes import _toggle_orm, toggle_like
+from .models import Comment, CommentLike, Content, ContentLike, ContentStats
+from .view_counter import ViewCountBuffer
+
+
+def create_content(author, title='Title'):
+    return Content.objects.create(
+        title=title,
+        introduction='Introduction',
+        text='Text',
+        topic='history',
+        content_type='academic_article',
+        author=author,
+    )
+
+
+class ViewCountBufferTests(TestCase):
+    """Buffered views are written back to the contents' stats rows."""
+
+    def setUp(self):
+        author = User.objects.create_user('author', 'author@example.com')
+        self.content = create_content(author)
+
+    def create_buffer(self, flush_interval=3600, **kwargs):
+        buffer = ViewCountBuffer(
+            flush_interval=flush_interval, max_pending=100, **kwargs
+        )
+        self.addCleanup(buffer.stop)
+        return buffer
+
+    def test_flush(self):
+        buffer = self.create_buffer()
+        buffer.increment(self.content.pk)
+        buffer.increment(self.content.pk)
+
+        self.assertEqual(buffer.pending(), {self.content.pk: 2})
+        self.assertEqual(self.content.views_count, 0)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(), {})
+        self.assertEqual(self.content.views_count, 2)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_stop(self):
+        buffer = self.create_buffer()
+        buffer.increment(self.content.pk)
+        self.assertIsNotNone(buffer._thread)
+
+        buffer.stop()
+
+        self.assertIsNone(buffer._thread)
+        self.assertEqual(buffer.pending(), {})
+        self.assertEqual(self.content.views_count, 1)
+
+    def test_write_through(self):
+        buffer = self.create_buffer(flush_interval=0)
+        buffer.increment(self.content.pk)
+
+        self.assertIsNone(buffer._thread)
+        self.assertEqual(buffer.pending(), {})
+        self.assertEqual(self.content.views_count, 1)
+
+    def test_hot_content(self):
+        buffer = self.create_buffer(shards=4, hot_views=5)
+        buffer.increment(self.content.pk, 5)
+        buffer.flush()
+
+        # Written to an extra row, the content's total is the same
+        stats = ContentStats.objects.filter(content=self.content)
+        self.assertEqual(stats.get(shard=0).views_count, 0)
+        self.assertEqual(stats.count(), 2)
+        self.assertEqual(self.content.views_count, 5)
+
+    def test_deleted_content(self):
+        buffer = self.create_buffer()
+        buffer.increment(0)
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.pending(), {})
+
+
+class ToggleLikeTests(TestCase):
+    """Like toggles keep the like count in step with the like rows."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        self.content = create_content(self.author)
+        self.comment = Comment.objects.create(
+            content=self.content, author=self.author, text='Comment'
+        )
+
+    def toggle(self, user, kind='content', target_id=None):
+        if target_id is None:
+            target = self.content if kind == 'content' else self.comment
+            target_id = target.pk
+
+        # Notifications are written once the toggle's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return toggle_like(user, kind, target_id)
+
+    def test_like_and_unlike(self):
+        result = self.toggle(self.reader)
+        self.assertTrue(result.liked)
+        self.assertEqual(result.like_count, 1)
+        self.assertEqual(result.author_id, self.author.pk)
+        self.assertEqual(result.content_id, self.content.pk)
+        self.assertEqual(ContentLike.objects.count(), 1)
+
+        result = self.toggle(self.reader)
+        self.assertFalse(result.liked)
+        self.assertEqual(result.like_count, 0)
+        self.assertFalse(ContentLike.objects.exists())
+        self.assertEqual(self.content.like_count, 0)
+
+    def test_double_click(self):
+        # Two toggles of the same user in a row cancel out
+        self.toggle(self.reader)
+        self.toggle(self.reader)
+        self.toggle(self.reader)
+        self.toggle(self.reader)
+
+        self.assertFalse(ContentLike.objects.exists())
+        self.assertEqual(self.content.like_count, 0)
+
+    def test_count_matches_likes(self):
+        readers = [
+            User.objects.create_user(f'reader{i}', f'reader{i}@example.com')
+            for i in range(5)
+        ]
+        for reader in readers:
+            self.toggle(reader)
+        self.toggle(readers[0])
+
+        self.assertEqual(ContentLike.objects.count(), 4)
+        self.assertEqual(self.content.like_count, 4)
+
+    def test_like_added_concurrently(self):
+        # A like committed by a concurrent toggle, not counted yet
+        ContentLike.objects.create(content=self.content, user=self.reader)
+
+        result = self.toggle(self.reader)
+        self.assertFalse(result.liked)
+        self.assertFalse(ContentLike.objects.exists())
+        # The counter never goes below zero
+        self.assertEqual(result.like_count, 0)
+        self.assertEqual(self.content.like_count, 0)
+
+    def test_orm_fallback(self):
+        ContentLike.objects.create(content=self.content, user=self.reader)
+
+        # Databases without vendor SQL lock the counter row instead
+        with transaction.atomic():
+            liked, row, added = _toggle_orm(
+                'content', self.reader.pk, self.content.pk
+            )
+        self.assertEqual((liked, row[0], added), (False, 0, False))
+        self.assertFalse(ContentLike.objects.exists())
+
+        with transaction.atomic():
+            liked, row, added = _toggle_orm(
+                'content', self.reader.pk, self.content.pk
+            )
+        self.assertEqual(
+            (liked, row, added),
+            (True, (1, self.author.pk, self.content.pk), True),
+        )
+        self.assertEqual(ContentLike.objects.count(), 1)
+        self.assertEqual(self.content.like_count, 1)
+
+        with transaction.atomic():
+            self.assertEqual(
+                _toggle_orm('content', self.reader.pk, 0), (None, None, None)
+            )
+
+    def test_comment_like(self):
+        result = self.toggle(self.reader, 'comment')
+        self.assertTrue(result.liked)
+        self.assertEqual(result.content_id, self.content.pk)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.like_count, 1)
+        self.assertEqual(CommentLike.objects.count(), 1)
+
+        self.toggle(self.reader, 'comment')
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.like_count, 0)
+        self.assertFalse(CommentLike.objects.exists())
+
+    def test_missing_target(self):
+        self.assertIsNone(self.toggle(self.reader, 'content', 0))
+        self.assertIsNone(self.toggle(self.reader, 'comment', 0))
+        self.assertFalse(ContentLike.objects.exists())
+        self.assertFalse(CommentLike.objects.exists())
+
+    def test_content_without_stats(self):
+        ContentLike.objects.create(content=self.content, user=self.author)
+        ContentStats.objects.filter(content=self.content).delete()
+
+        # The row is created with the likes counted, then toggled
+        result = self.toggle(self.reader)
+        self.assertTrue(result.liked)
+        self.assertEqual(result.like_count, 2)
+        self.assertEqual(ContentLike.objects.count(), 2)
+        self.assertEqual(self.content.like_count, 2)
+
+        ContentStats.objects.filter(content=self.content).delete()
+
+        with transaction.atomic():
+            self.assertEqual(
+                _toggle_orm('content', self.reader.pk, self.content.pk),
+                (None, None, None),
+            )
+        result = self.toggle(self.reader)
+        self.assertFalse(result.liked)
+        self.assertEqual(result.like_count, 1)
+        self.assertEqual(ContentLike.objects.count(), 1)
+
+    def test_notification(self):
+        self.toggle(self.reader)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.user, self.author)
+        self.assertEqual(notification.from_user, self.reader)
+        self.assertEqual(notification.content, self.content)
+
+        # Unliking takes the notification back
+        self.toggle(self.reader)
+        self.assertFalse(Notification.objects.exists())
+
+        # Liking one's own content notifies nobody
+        self.toggle(self.author)
+        self.assertFalse(Notification.objects.exists())
@@ -9,6 +9,9 @@ urlpatterns = [
     path('<int:content_id>/', views.content_detail,
          name='content_detail'),  # Path to view content details
 
+    path('<int:content_id>/fragments/', views.content_fragments,
+         name='content_fragments'),  # Path to per-user parts of the page
+
     path('add_content/', views.add_content,
          name='add_content'),  # Path to add new content
 
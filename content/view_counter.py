@@ -0,0 +1,269 @@
+import atexit
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.db.models import Case, F, Value, When
+
+logger = logging.getLogger(__name__)
+
+# Cache key used by `flush_view_counts` to ask running workers to flush.
+# Only workers sharing the cache see it, so it needs a shared backend
+# (e.g. Redis or Memcached); with the per-process LocMemCache a request
+# only reaches the process that made it.
+FLUSH_REQUEST_CACHE_KEY = 'content:view_counter:flush_requested'
+
+# Maximum seconds between two checks for a requested flush.
+FLUSH_REQUEST_POLL_INTERVAL = 5
+
+# Cookie marking the redirect that follows a like or comment, so the
+# same reader landing back on the content is not counted twice.
+SKIP_VIEW_COOKIE = 'skip_view_count'
+SKIP_VIEW_COOKIE_MAX_AGE = 60
+
+# Maximum number of rows touched by a single UPDATE statement.
+FLUSH_BATCH_SIZE = 500
+
+
+class ViewCountBuffer:
+    """
+    In-process, write-behind accumulator for Content view counts.
+
+    Increments are kept in memory per content id and written back as
+    multi-row UPDATE statements by a background thread, started with
+    the first increment, once the flush interval has elapsed, too many
+    distinct ids are pending, a flush has been requested through the
+    cache, or the buffer is stopped, which the thread arranges for when
+    the worker process exits. Requests never wait on a flush, and a
+    killed worker loses at most one interval of views. With a flush
+    interval of 0 every view is written through immediately and no
+    thread is started, as in the tests.
+
+    Counts go to the contents' ContentStats rows. A content with at
+    least hot_views buffered views is written to one of shards - 1
+    extra rows at random instead of its main row.
+    """
+
+    def __init__(self, flush_interval, max_pending, shards=1, hot_views=50):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.shards = shards
+        self.hot_views = hot_views
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_flush_at = time.time()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+
+    def increment(self, content_id, amount=1):
+        """Buffer a view for the content."""
+
+        with self._lock:
+            self._pending[content_id] = (
+                self._pending.get(content_id, 0) + amount
+            )
+            full = len(self._pending) >= self.max_pending
+
+        if self.flush_interval <= 0:
+            self.flush()
+            return
+
+        self.start()
+        if full:
+            self._wakeup.set()
+
+    def start(self):
+        """Start the background thread flushing the buffer, once."""
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._thread is None:
+                # Flush what is left when the worker shuts down
+                atexit.register(self._stop_at_exit)
+            self._thread = threading.Thread(
+                target=self._run, name='view-count-flush', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and flush the remaining increments."""
+
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+
+        atexit.unregister(self._stop_at_exit)
+        self._stopping = True
+        self._wakeup.set()
+        thread.join()
+        self._stopping = False
+        self.flush()
+
+    def _stop_at_exit(self):
+        """Stop the buffer when the worker shuts down."""
+
+        try:
+            self.stop()
+        except Exception:
+            logger.exception('Error flushing view counts at shutdown.')
+
+    def _run(self):
+        """Flush whenever one is due, until the buffer is stopped."""
+
+        poll_interval = min(self.flush_interval, FLUSH_REQUEST_POLL_INTERVAL)
+        while True:
+            woken = self._wakeup.wait(poll_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                # stop() flushes from its own thread
+                return
+            try:
+                due = (
+                    woken
+                    or time.monotonic() - self._last_flush
+                    >= self.flush_interval
+                    or self._flush_requested()
+                )
+                if due:
+                    self.flush()
+            except Exception:
+                logger.exception('Error flushing buffered view counts.')
+            finally:
+                # The thread has its own connections; do not keep them open
+                connections.close_all()
+
+    def pending(self):
+        """Return a copy of the increments not yet written back."""
+
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Write buffered increments back and return the number of views."""
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            self._last_flush_at = time.time()
+
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            try:
+                self._write(batch)
+            except DatabaseError:
+                # Put the unwritten increments back for the next flush
+                self._restore(items[start:])
+                logger.exception('Error flushing buffered view counts.')
+                break
+
+        return sum(pending.values())
+
+    def _write(self, batch):
+        """Add a batch of (content_id, amount) to the stats rows."""
+
+        # Imported here to keep the module importable before apps load
+        from .models import Content, ContentStats
+        from .signals import counts_changed
+
+        # Spread the views of hot contents over more rows, so workers
+        # flushing at the same time do not wait on the same row
+        shards = {}
+        for content_id, amount in batch:
+            shard = 0
+            if self.shards > 1 and amount >= self.hot_views:
+                shard = random.randrange(1, self.shards)
+            shards.setdefault(shard, []).append((content_id, amount))
+
+        hot = [
+            (shard, content_id) for shard, rows in shards.items() if shard
+            for content_id, _ in rows
+        ]
+        if hot:
+            existing = set(Content.objects.filter(
+                pk__in=[content_id for _, content_id in hot]
+            ).values_list('pk', flat=True))
+            ContentStats.objects.bulk_create(
+                [
+                    ContentStats(content_id=content_id, shard=shard)
+                    for shard, content_id in hot if content_id in existing
+                ],
+                ignore_conflicts=True,
+            )
+
+        for shard, rows in shards.items():
+            ContentStats.objects.filter(
+                shard=shard,
+                content_id__in=[content_id for content_id, _ in rows],
+            ).update(
+                views_count=F('views_count') + Case(
+                    *[
+                        When(content_id=content_id, then=Value(amount))
+                        for content_id, amount in rows
+                    ],
+                    default=Value(0),
+                )
+            )
+
+        # The batch is written: errors of receivers are logged, not raised,
+        # so it is not restored and written twice
+        counts_changed.send_robust(
+            Content, content_ids=[content_id for content_id, _ in batch]
+        )
+
+    def _restore(self, items):
+        """Merge increments that could not be written back into the buffer."""
+
+        with self._lock:
+            for content_id, amount in items:
+                self._pending[content_id] = (
+                    self._pending.get(content_id, 0) + amount
+                )
+
+    def _flush_requested(self):
+        """Check whether a flush was requested after the last one."""
+
+        requested_at = cache.get(FLUSH_REQUEST_CACHE_KEY)
+        return requested_at is not None and requested_at > self._last_flush_at
+
+
+def request_flush():
+    """Ask every worker sharing the cache to flush within a few seconds."""
+    cache.set(FLUSH_REQUEST_CACHE_KEY, time.time(), None)
+
+
+def skip_next_view(response, content_id):
+    """Mark the redirect back to a content so it is not counted again."""
+
+    response.set_cookie(
+        SKIP_VIEW_COOKIE,
+        str(content_id),
+        max_age=SKIP_VIEW_COOKIE_MAX_AGE,
+        httponly=True,
+        samesite='Lax',
+    )
+    return response
+
+
+def is_skipped_view(request, content_id):
+    """Check whether this request is a redirect marked by skip_next_view."""
+    return request.COOKIES.get(SKIP_VIEW_COOKIE) == str(content_id)
+
+
+view_counter = ViewCountBuffer(
+    flush_interval=getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 30),
+    max_pending=getattr(settings, 'VIEW_COUNT_MAX_PENDING', 1000),
+    shards=getattr(settings, 'CONTENT_STATS_SHARDS', 4),
+    hot_views=getattr(settings, 'CONTENT_STATS_HOT_VIEWS', 50),
+)
@@ -1,39 +1,88 @@
+import functools
+
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import F
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+
+from pages.fragments import fragment_response, render_navbar_user
+from pages.freshness import conditional_page, content_fingerprint
+from pages.page_cache import cached_page, is_public_page
+from pages.pagination import paginate
 from .forms import CommentForm, ContentForm
-from .models import Comment, Content, Like
-
-
+from .likes import toggle_like
+from .models import Comment, CommentLike, Content, ContentLike
+from .view_counter import (
+    SKIP_VIEW_COOKIE,
+    is_skipped_view,
+    skip_next_view,
+    view_counter
+)
+
+
+def count_view(view_func):
+    """
+    Buffer a view of the content for each GET answered with the page or
+    with 304 Not Modified, which the view body never runs for. Views of
+    hole-punched pages are counted by content_fragments instead, and
+    the redirect that follows the reader's own like or comment is not
+    counted.
+    """
+
+    @functools.wraps(view_func)
+    def wrapper(request, content_id):
+        public_page = is_public_page(request, shared_only=True)
+        response = view_func(request, content_id=content_id)
+
+        if (
+            request.method == 'GET'
+            and not public_page
+            and response.status_code in (200, 304)
+        ):
+            if is_skipped_view(request, content_id):
+                # The redirect has been handled, count later visits again
+                response.delete_cookie(SKIP_VIEW_COOKIE)
+            else:
+                view_counter.increment(content_id)
+        return response
+
+    return wrapper
+
+
+@count_view
+@conditional_page(content_fingerprint)
+@cached_page(lambda content_id: f'content:{content_id}', shared_only=True)
 def content_detail(request, content_id):
     """Displays content and comments with pagination."""
 
-    # Retrieve content or return 404 if not found
-    content = get_object_or_404(Content, pk=content_id)
-
-    # Increment views count
-    Content.objects.filter(pk=content_id).update(
-        views_count=F('views_count') + 1
+    # Retrieve content with its author's profile or return 404 if not found
+    content = get_object_or_404(
+        Content.objects.select_related('author__profile').with_stats(),
+        pk=content_id
     )
 
+    # On hole-punched pages the user's parts are handled by
+    # content_fragments.
+    public_page = getattr(request, 'public_page', False)
+
     # Fetch comments and paginate them
-    comments_list = content.comments.order_by('-created_date')
-    paginator = Paginator(comments_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    comments_list = content.comments.select_related(
+        'author__profile'
+    ).order_by('-created_date')
+    page_obj = paginate(request, comments_list, 10)
 
     # Track user likes for content and comments if authenticated
     existing_content_like = None
     existing_comment_likes = []
-    if request.user.is_authenticated:
-        existing_content_like = Like.objects.filter(
+    if not public_page and request.user.is_authenticated:
+        existing_content_like = ContentLike.objects.filter(
             user=request.user, content=content
         ).exists()
-        comment_ids = page_obj.object_list.values_list('id', flat=True)
-        existing_comment_likes = Like.objects.filter(
+        comment_ids = [comment.id for comment in page_obj]
+        existing_comment_likes = CommentLike.objects.filter(
             user=request.user, comment_id__in=comment_ids
         ).values_list('comment_id', flat=True)
 
@@ -51,7 +100,9 @@ def content_detail(request, content_id):
             messages.success(
                 request, 'Your comment has been added successfully.'
             )
-            return redirect('content_detail', content_id=content.id)
+            return skip_next_view(
+                redirect('content_detail', content_id=content.id), content.id
+            )
     else:
         comment_form = CommentForm()
 
@@ -63,9 +114,78 @@ def content_detail(request, content_id):
         'existing_content_like': existing_content_like,
         'existing_comment_likes': existing_comment_likes,
     }
+    if public_page:
+        comment_ids = ','.join(str(comment.id) for comment in page_obj)
+        context['fragment_src'] = (
+            f"{reverse('content_fragments', args=[content.id])}"
+            f"?comments={comment_ids}"
+        )
     return render(request, 'content/content_detail.html', context)
 
 
+def content_fragments(request, content_id):
+    """
+    Returns the current user's parts of a hole-punched content page:
+    like buttons, comment actions, comment form and navbar items.
+    """
+
+    content = get_object_or_404(Content.objects.only('id'), pk=content_id)
+
+    # Count the view of the cached page here, except for the redirect
+    # that follows the reader's own like or comment
+    skipped_view = is_skipped_view(request, content.id)
+    if not skipped_view:
+        view_counter.increment(content.id)
+
+    # Comments shown on the page, as listed by the page itself
+    comment_ids = [
+        int(pk) for pk in request.GET.get('comments', '').split(',')[:50]
+        if pk.isdigit()
+    ]
+    comments = Comment.objects.filter(
+        content=content, pk__in=comment_ids
+    ).only('id', 'author_id', 'content_id')
+
+    # Track user likes for content and comments if authenticated
+    existing_content_like = None
+    existing_comment_likes = []
+    if request.user.is_authenticated:
+        existing_content_like = ContentLike.objects.filter(
+            user=request.user, content=content
+        ).exists()
+        existing_comment_likes = list(CommentLike.objects.filter(
+            user=request.user, comment_id__in=comment_ids
+        ).values_list('comment_id', flat=True))
+
+    context = {
+        'content': content,
+        'comment_form': CommentForm(),
+        'existing_content_like': existing_content_like,
+        'existing_comment_likes': existing_comment_likes,
+    }
+    fragments = {
+        'navbar_user': render_navbar_user(request),
+        'content_like': render_to_string(
+            'partials/_content_like_button.html', context, request
+        ),
+        'comment_form': render_to_string(
+            'partials/_comment_form.html', context, request
+        ),
+    }
+    for comment in comments:
+        fragments[f'comment_actions_{comment.id}'] = render_to_string(
+            'partials/_comment_actions.html',
+            {**context, 'comment': comment}, request,
+        )
+
+    response = fragment_response(request, fragments)
+
+    # The redirect has been handled, count later visits again
+    if skipped_view:
+        response.delete_cookie(SKIP_VIEW_COOKIE)
+    return response
+
+
 @login_required
 def add_content(request):
     """Allows authenticated users to submit new content."""
@@ -153,63 +273,44 @@ def delete_comment(request, comment_id):
     return render(request, 'content/delete_comment.html', context)
 
 
+def _like_response(request, result, kind):
+    """Answer a like toggle with JSON for fetch requests, or redirect."""
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'liked': result.liked, 'like_count': result.like_count,
+        })
+
+    action = 'liked' if result.liked else 'unliked'
+    messages.success(request, f'You {action} this {kind}.')
+
+    return skip_next_view(
+        redirect('content_detail', content_id=result.content_id),
+        result.content_id
+    )
+
+
 @login_required
+@require_POST
 def like_content(request, content_id):
     """Handles liking/unliking content by authenticated users."""
 
-    content = get_object_or_404(Content, pk=content_id)
-
-    if request.method == 'POST':
-        existing_content_like = Like.objects.filter(
-            user=request.user, content=content
-        ).first()
-
-        # Toggle like status
-        if existing_content_like:
-            action = 'unliked'
-            existing_content_like.delete()
-            update_count = -1
-        else:
-            action = 'liked'
-            like = Like(user=request.user, content=content)
-            like.save()
-            update_count = 1
-
-        # Update like count
-        Content.objects.filter(pk=content_id).update(
-            like_count=F('like_count') + update_count
-        )
-        messages.success(request, f'You {action} this content.')
+    # Toggle the like and its count in a single transaction
+    result = toggle_like(request.user, 'content', content_id)
+    if result is None:
+        raise Http404('No Content matches the given query.')
 
-    return redirect('content_detail', content_id=content.id)
+    return _like_response(request, result, 'content')
 
 
 @login_required
+@require_POST
 def like_comment(request, comment_id):
     """Handles liking/unliking comments by authenticated users."""
 
-    comment = get_object_or_404(Comment, pk=comment_id)
-
-    if request.method == 'POST':
-        existing_comment_like = Like.objects.filter(
-            user=request.user, comment=comment
-        ).first()
-
-        # Toggle like status
-        if existing_comment_like:
-            action = 'unliked'
-            existing_comment_like.delete()
-            update_count = -1
-        else:
-            action = 'liked'
-            like = Like(user=request.user, comment=comment)
-            like.save()
-            update_count = 1
-
-        # Update like count
-        Comment.objects.filter(pk=comment_id).update(
-            like_count=F('like_count') + update_count
-        )
-        messages.success(request, f'You {action} this comment.')
+    # Toggle the like and its count in a single transaction
+    result = toggle_like(request.user, 'comment', comment_id)
+    if result is None:
+        raise Http404('No Comment matches the given query.')
 
-    return redirect('content_detail', content_id=comment.content.id)
+    return _like_response(request, result, 'comment')
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/.
 
 import dj_database_url
 import os
+import sys
 from pathlib import Path
 
 from django.contrib.messages import constants as messages
@@ -75,6 +76,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     # Django default middleware
     'django.middleware.security.SecurityMiddleware',
+    'pages.middleware.PublicPageMiddleware',  # Must precede sessions
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -138,6 +140,45 @@ else:
         }
     }
 
+# -----------------------------------------------------------------------------
+# Cache Configuration
+# -----------------------------------------------------------------------------
+
+# Local memory cache by default. Point CACHES at a shared backend
+# (e.g. Redis or Memcached) in production so that cache entries and
+# cross-worker signals are visible to every worker process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'everything-about-sufism',
+    }
+}
+
+# Pages shown to anonymous visitors (home, about and the topic listings) are
+# cached for PAGE_CACHE_TIMEOUT seconds, then served stale for up to
+# PAGE_CACHE_STALE_TIMEOUT more seconds while being re-rendered. Saving a
+# Content evicts its topic's listings. Set PAGE_CACHE_TIMEOUT to 0 to disable.
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', 60))
+PAGE_CACHE_STALE_TIMEOUT = int(os.getenv('PAGE_CACHE_STALE_TIMEOUT', 300))
+
+# Hole punching: render cached pages without their per-user parts (navbar
+# badges, like buttons, comment forms), which the browser then loads from
+# small fragment endpoints. The pages are shared with logged-in users too
+# and sent with `Cache-Control: public` for reverse proxies.
+HOLE_PUNCHING = os.getenv('HOLE_PUNCHING', 'False') == 'True'
+
+# Comments, likes and follows on the same target within this many seconds
+# are gathered in one notification, which lists the ids of the latest
+# NOTIFICATION_RECENT_ACTORS actors.
+NOTIFICATION_BUCKET_SECONDS = int(
+    os.getenv('NOTIFICATION_BUCKET_SECONDS', 86400)
+)
+NOTIFICATION_RECENT_ACTORS = int(os.getenv('NOTIFICATION_RECENT_ACTORS', 3))
+
+# Maximum number of users suggested by the recipient lookup of the send
+# message form, followed users first.
+RECIPIENT_LOOKUP_LIMIT = int(os.getenv('RECIPIENT_LOOKUP_LIMIT', 10))
+
 # -----------------------------------------------------------------------------
 # Password Validation for ensuring strong passwords in user authentication
 # -----------------------------------------------------------------------------
@@ -307,6 +348,73 @@ CKEDITOR_5_CONFIGS = {
     },
 }
 
+# -----------------------------------------------------------------------------
+# Content View Counter
+# -----------------------------------------------------------------------------
+
+# Content views are buffered in each worker and written back in batches by
+# a background thread. Seconds between flushes; 0 writes every view through
+# immediately. `flush_view_counts` reaches other workers only through a
+# shared cache backend (see CACHES).
+VIEW_COUNT_FLUSH_INTERVAL = int(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', 30))
+
+# Tests write views through, so no flush outlives the test database.
+if sys.argv[1:2] == ['test']:
+    VIEW_COUNT_FLUSH_INTERVAL = 0
+
+# Flush early once this many distinct contents have pending views.
+VIEW_COUNT_MAX_PENDING = int(os.getenv('VIEW_COUNT_MAX_PENDING', 1000))
+
+# Views of contents with at least CONTENT_STATS_HOT_VIEWS buffered views
+# are spread over CONTENT_STATS_SHARDS - 1 extra counter rows.
+CONTENT_STATS_SHARDS = int(os.getenv('CONTENT_STATS_SHARDS', 4))
+CONTENT_STATS_HOT_VIEWS = int(os.getenv('CONTENT_STATS_HOT_VIEWS', 50))
+
+# -----------------------------------------------------------------------------
+# Data Retention
+# -----------------------------------------------------------------------------
+
+# Days after which the apply_retention command removes read notifications
+# and messages deleted by both sides; 0 keeps them. It also folds the likes
+# of deleted users into the like counters.
+NOTIFICATION_RETENTION_DAYS = int(
+    os.getenv('NOTIFICATION_RETENTION_DAYS', 90)
+)
+MESSAGE_RETENTION_DAYS = int(os.getenv('MESSAGE_RETENTION_DAYS', 30))
+
+# -----------------------------------------------------------------------------
+# Pagination
+# -----------------------------------------------------------------------------
+
+# Serve the content, search, comment, message and notification feeds with
+# newer/older cursor links instead of numbered pages. Cursor pages cost the
+# same at any depth since they need neither OFFSET nor COUNT(*).
+CURSOR_PAGINATION = os.getenv('CURSOR_PAGINATION', 'False') == 'True'
+
+# -----------------------------------------------------------------------------
+# Full-Text Search
+# -----------------------------------------------------------------------------
+
+# Contents are searched through a full-text index (PostgreSQL tsvector/GIN,
+# or SQLite FTS5). Build it with `python manage.py rebuild_search_index`.
+# Maximum number of ranked results returned for a search query.
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 1000))
+
+# Messages are searched through a per-user mailbox index, updated as they
+# are sent and deleted. Build it for existing messages with
+# `python manage.py rebuild_message_index`. Maximum number of ranked
+# results returned for a mailbox search.
+MESSAGE_SEARCH_MAX_RESULTS = int(os.getenv('MESSAGE_SEARCH_MAX_RESULTS', 500))
+
+# Search suggestions are answered from an in-memory prefix index in each
+# worker, built in the background as the worker starts. Seconds between
+# background rebuilds, which pick up other workers' edits; 0 builds it once.
+SUGGEST_INDEX_MAX_AGE = int(os.getenv('SUGGEST_INDEX_MAX_AGE', 300))
+
+# Seconds to cache the topic, content type and language facet counts of a
+# listing or search. Cached counts are dropped whenever a Content changes.
+FACET_CACHE_TIMEOUT = int(os.getenv('FACET_CACHE_TIMEOUT', 300))
+
 # -----------------------------------------------------------------------------
 # Authentication Backends, including a custom email-based backend
 # -----------------------------------------------------------------------------
@@ -17,3 +17,8 @@ os.environ.setdefault(
 )
 
 application = get_wsgi_application()
+
+# Build the search suggestion index in the background as the worker starts.
+from pages import suggestions  # noqa: E402
+
+suggestions.start()
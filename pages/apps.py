@@ -6,3 +6,7 @@ class PagesConfig(AppConfig):
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pages'
+
+    def ready(self):
+        """Import pages signals when the app is ready."""
+        import pages.signals
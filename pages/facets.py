@@ -0,0 +1,109 @@
+"""
+Facet counts for the topic, content type and language filters.
+
+All counts of a filter set come from a single GROUP BY over the three
+facet fields. The grouped rows are cached per filter signature, and
+every cached entry is invalidated at once when a Content is saved or
+deleted, by bumping a generation number that is part of the cache keys.
+"""
+
+import hashlib
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from content.models import Content
+
+# Facet fields and their choices, in display order.
+FACETS = {
+    'topic': Content.TOPIC_CHOICES,
+    'content_type': Content.CONTENT_TYPE_CHOICES,
+    'language': Content.LANGUAGE_CHOICES,
+}
+
+GENERATION_KEY = 'facets:generation'
+
+
+def _generation():
+    """Return the current cache generation."""
+
+    # Start from the clock so that an evicted generation never reuses keys
+    return cache.get_or_set(GENERATION_KEY, time.time_ns(), None)
+
+
+def invalidate():
+    """Invalidate all cached facet counts."""
+
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def _grouped_rows(queryset):
+    """Count the rows of queryset per (topic, content_type, language)."""
+
+    return list(
+        queryset.order_by()
+        .values(*FACETS)
+        .annotate(count=Count('pk'))
+        .values_list(*FACETS, 'count')
+    )
+
+
+def facet_counts(queryset, selected, signature=None):
+    """
+    Return the facet values of a filter set with their counts.
+
+    queryset holds the filter set before any facet filter is applied; it
+    may also be a callable returning the queryset, called only when the
+    counts are not cached. Each facet's counts honour the values selected
+    in the other facets, so a selected value can still be switched for
+    another one. Counts are cached under signature unless it is None.
+
+    Returns a dict mapping each facet field to a list of dicts with the
+    value, label, count and whether the value is selected.
+    """
+
+    rows = None
+    if signature is not None:
+        digest = hashlib.md5(signature.encode()).hexdigest()
+        key = f'facets:{_generation()}:{digest}'
+        rows = cache.get(key)
+
+    if rows is None:
+        if callable(queryset):
+            queryset = queryset()
+        rows = _grouped_rows(queryset)
+        if signature is not None:
+            cache.set(
+                key, rows, getattr(settings, 'FACET_CACHE_TIMEOUT', 300)
+            )
+
+    fields = list(FACETS)
+    facets = {}
+
+    for position, field in enumerate(fields):
+        # Apply the selections of the other facets
+        totals = Counter()
+        for row in rows:
+            if all(
+                not selected.get(other) or row[index] == selected[other]
+                for index, other in enumerate(fields) if other != field
+            ):
+                totals[row[position]] += row[-1]
+
+        facets[field] = [
+            {
+                'value': value,
+                'label': label,
+                'count': totals[value],
+                'selected': selected.get(field) == value,
+            }
+            for value, label in FACETS[field]
+        ]
+
+    return facets
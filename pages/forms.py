@@ -6,7 +6,11 @@ class ContentSearchForm(forms.Form):
 
     search_query = forms.CharField(
         label='Search Query', max_length=255, required=False,
-        widget=forms.TextInput(attrs={'placeholder': 'Search...'}),
+        widget=forms.TextInput(attrs={
+            'placeholder': 'Search...',
+            'autocomplete': 'off',
+            'list': 'search-suggestions',
+        }),
     )
     search_fields = forms.MultipleChoiceField(
         choices=[
@@ -45,6 +49,17 @@ class ContentSearchForm(forms.Form):
         label='Search in content types',
         required=False,
     )
+    content_language = forms.ChoiceField(
+        choices=[
+            ('', 'All Languages'),
+            ('en', 'English'),
+            ('nl', 'Dutch'),
+            ('ku', 'Kurdish'),
+            ('tr', 'Turkish'),
+        ],
+        label='Search in languages',
+        required=False,
+    )
 
 
 class ContactForm(forms.Form):
@@ -0,0 +1,33 @@
+"""
+Per-user parts of hole-punched pages.
+
+Pages shared between visitors are rendered with placeholders where the
+current user's navbar items, like buttons or forms belong. Fragment
+endpoints answer with the user and the HTML of those parts, and
+static/js/fragments.js puts them in place.
+"""
+
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.utils.cache import add_never_cache_headers
+
+
+def render_navbar_user(request):
+    """Render the navbar items of the current user."""
+    return render_to_string('partials/_navbar_user.html', request=request)
+
+
+def fragment_response(request, fragments):
+    """Return fragments, keyed by placeholder name, with the current user."""
+
+    response = JsonResponse({
+        'user': {
+            'authenticated': request.user.is_authenticated,
+            'id': request.user.pk,
+        },
+        'fragments': fragments,
+    })
+
+    # Fragments are per user and must never be shared
+    add_never_cache_headers(response)
+    return response
@@ -0,0 +1,148 @@
+"""
+Freshness stamps for conditional GET on content and listing pages.
+
+Each content page and topic listing has a stamp in the cache: the time
+it last changed and a token unique to that change. touch() replaces the
+stamps of the pages a change shows on, from the signals of Content and
+Comment writes, like toggles and view count flushes. The ETag is derived
+from the stamp, so answering a conditional request is one cache lookup,
+with no query and no template rendering. A missing stamp, e.g. after an
+eviction, is replaced by a new one, so ETags issued before it never
+match again.
+
+Only the ETag answers 304 Not Modified; Last-Modified is sent for
+information. Every worker must see the same stamps, so production needs
+a shared cache backend, as for the page cache (see CACHES).
+"""
+
+import functools
+import hashlib
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+from content.models import Content
+
+Fingerprint = namedtuple('Fingerprint', ['last_modified', 'signature'])
+
+
+def _cache_key(key):
+    return f'freshness:{key}'
+
+
+def _new_stamp():
+    return Fingerprint(timezone.now(), time.time_ns())
+
+
+def touch(*keys):
+    """Mark the pages behind keys as modified now."""
+
+    if keys:
+        stamp = _new_stamp()
+        cache.set_many({_cache_key(key): stamp for key in keys}, None)
+
+
+def get_stamp(key):
+    """Return the stamp of the page behind key, adding one if missing."""
+
+    stamp = cache.get(_cache_key(key))
+    if stamp is None:
+        # Another worker may add one at the same time; keep the first
+        cache.add(_cache_key(key), _new_stamp(), None)
+        stamp = cache.get(_cache_key(key))
+
+    return stamp
+
+
+def content_fingerprint(content_id):
+    """Fingerprint of a content page: its content, counts and comments."""
+    return get_stamp(f'content:{content_id}')
+
+
+def topic_fingerprint(topic):
+    """
+    Fingerprint of a topic listing: its published contents and their
+    counts. None if the topic does not exist.
+    """
+
+    if topic != 'all_contents' and topic not in dict(Content.TOPIC_CHOICES):
+        return None
+
+    return get_stamp(f'topic:{topic}')
+
+
+def _is_shared(request, private_params):
+    """
+    Only pages rendered the same way for every visitor get validators:
+    those of anonymous visitors, or all of them in hole punching mode,
+    and never those asked for with one of private_params.
+    """
+
+    return (
+        (
+            not request.user.is_authenticated
+            or getattr(settings, 'HOLE_PUNCHING', False)
+        )
+        and not any(
+            request.GET.get(name, '') not in ('', 'false')
+            for name in private_params
+        )
+        and not len(messages.get_messages(request))
+    )
+
+
+def conditional_page(fingerprint_func, private_params=()):
+    """
+    Answer conditional GET requests with 304 Not Modified using the
+    page's fingerprint.
+
+    fingerprint_func takes the view's keyword arguments and returns the
+    page's Fingerprint, or None if it has none. private_params are the
+    query parameters that make the page depend on the user, as given to
+    cached_page.
+    """
+
+    def fingerprint(request, **kwargs):
+        # Looked up once per request
+        if not hasattr(request, '_page_fingerprint'):
+            request._page_fingerprint = (
+                fingerprint_func(**kwargs)
+                if _is_shared(request, private_params) else None
+            )
+        return request._page_fingerprint
+
+    def etag(request, *args, **kwargs):
+        entry = fingerprint(request, **kwargs)
+        if entry is None:
+            return None
+
+        digest = hashlib.md5(repr(entry).encode()).hexdigest()
+        return f'"{digest}"'
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag)(view_func)
+
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+
+            entry = getattr(request, '_page_fingerprint', None)
+            if (
+                entry is not None
+                and response.status_code == 200
+                and not response.has_header('Last-Modified')
+            ):
+                response['Last-Modified'] = http_date(
+                    entry.last_modified.timestamp()
+                )
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,100 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from pages import retention
+
+
+class Command(BaseCommand):
+    """
+    Command to remove the rows the retention policies mark as due, in
+    small throttled batches within a time budget.
+    """
+
+    help = ('Removes old read notifications, likes of deleted users and '
+            'messages deleted by both sides, in batches, and reports the '
+            'rows removed per policy.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--policy',
+            action='append',
+            choices=[policy.name for policy in retention.POLICIES],
+            help='Run only this policy; may be repeated.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows removed per transaction.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches.',
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            default=600,
+            help='Stop once this many seconds are spent; 0 for no limit.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rows that are due.',
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        max_seconds = kwargs['max_seconds']
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        now = timezone.now()
+
+        for policy in retention.get_policies(kwargs['policy']):
+            due = policy.due(now)
+
+            if kwargs['dry_run']:
+                self.stdout.write(
+                    f'{policy.description()}: {due.count()} rows due.'
+                )
+                continue
+
+            removed = 0
+            last_id = 0
+            finished = False
+            while deadline is None or time.monotonic() < deadline:
+                pks = list(
+                    due.filter(pk__gt=last_id).order_by('pk').values_list(
+                        'pk', flat=True
+                    )[:batch_size]
+                )
+                if not pks:
+                    finished = True
+                    break
+                last_id = pks[-1]
+
+                with transaction.atomic():
+                    removed += policy.apply(pks)
+
+                # Let other writers through between batches
+                if kwargs['sleep']:
+                    time.sleep(kwargs['sleep'])
+
+            # Log the result to the console.
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{policy.description()}: {removed} rows removed.'
+                )
+            )
+
+            if not finished:
+                self.stdout.write(
+                    self.style.WARNING(
+                        'Time budget spent; the next run resumes here.'
+                    )
+                )
+                break
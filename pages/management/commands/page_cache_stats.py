@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from pages.page_cache import get_counters, reset_counters
+
+
+class Command(BaseCommand):
+    """
+    Command to report the hit rate of the anonymous page cache.
+    """
+
+    help = 'Shows the page cache hit/miss counters and hit rate.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Reset the counters after reporting them.',
+        )
+
+    def handle(self, *args, **kwargs):
+        counters = get_counters()
+
+        # Stale responses are served from the cache as well.
+        cached = counters['hit'] + counters['stale']
+        total = cached + counters['miss']
+        hit_rate = cached / total * 100 if total else 0
+
+        for name, value in counters.items():
+            self.stdout.write(f'{name}: {value}')
+
+        if kwargs['reset']:
+            reset_counters()
+
+        # Log the hit rate to the console.
+        self.stdout.write(
+            self.style.SUCCESS(f'Page cache hit rate: {hit_rate:.1f}%')
+        )
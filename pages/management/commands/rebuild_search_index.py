@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pages import search_index
+from pages.search_index.backends import create_schema
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the full-text search index from scratch.
+    """
+
+    help = ('Drops and rebuilds the full-text search index for all '
+            'contents in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of contents indexed per batch (default: 500).',
+        )
+
+    def handle(self, *args, **options):
+        backend = create_schema()
+        if backend is None:
+            raise CommandError(
+                'The database has no supported full-text search engine.'
+            )
+
+        # Recreate the index table so that stale entries are dropped.
+        backend.drop_schema()
+        backend.ensure_schema()
+
+        indexed = search_index.index_all(options['batch_size'])
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(f'Search index rebuilt for {indexed} contents.')
+        )
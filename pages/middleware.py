@@ -0,0 +1,36 @@
+from django.utils.cache import patch_cache_control
+
+
+class PublicPageMiddleware:
+    """
+    Middleware to keep hole-punched pages shareable.
+
+    Pages marked public by the page cache are the same for every
+    visitor, so the `Vary: Cookie` added when the session was read is
+    dropped. A page that ends up setting a cookie is made private again.
+    Must come before SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if not getattr(response, 'public_page', False):
+            return response
+
+        if response.cookies:
+            patch_cache_control(response, private=True)
+            return response
+
+        vary = [
+            header.strip() for header in response.get('Vary', '').split(',')
+            if header.strip() and header.strip().lower() != 'cookie'
+        ]
+        if vary:
+            response['Vary'] = ', '.join(vary)
+        elif response.has_header('Vary'):
+            del response['Vary']
+
+        return response
@@ -0,0 +1,210 @@
+"""
+Full-page cache for pages rendered the same way for every visitor.
+
+Pages are cached for anonymous visitors, per path and normalized query
+parameters, within a group such as a topic. Saving or deleting a Content
+evicts only the groups it appears in, by bumping the group's generation
+number that is part of the cache keys. Entries past their fresh period
+are served stale while a single request renders the replacement.
+
+With HOLE_PUNCHING enabled, pages are rendered without their per-user
+parts, which the browser loads from fragment endpoints instead. Such
+pages are shared with logged-in users as well and marked public, so a
+reverse proxy can cache them too.
+"""
+
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+
+# Query parameters that change the rendered page; others are ignored.
+CACHED_PARAMS = ('page', 'cursor', 'content_type', 'language')
+
+# Counter names, read by the page_cache_stats command.
+COUNTERS = ('hit', 'stale', 'miss')
+
+
+def _count(name):
+    """Increment a hit/miss counter."""
+
+    key = f'page_cache:count:{name}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_counters():
+    """Return the hit/miss counters as a dict."""
+
+    values = cache.get_many([f'page_cache:count:{name}' for name in COUNTERS])
+    return {
+        name: values.get(f'page_cache:count:{name}', 0) for name in COUNTERS
+    }
+
+
+def reset_counters():
+    """Reset the hit/miss counters to zero."""
+    cache.delete_many([f'page_cache:count:{name}' for name in COUNTERS])
+
+
+def _generation(group):
+    """Return the current generation of a page group."""
+
+    # Start from the clock so that an evicted generation never reuses keys
+    return cache.get_or_set(f'page_cache:gen:{group}', time.time_ns(), None)
+
+
+def invalidate(*groups):
+    """Evict every cached page of the given groups."""
+
+    for group in groups:
+        try:
+            cache.incr(f'page_cache:gen:{group}')
+        except ValueError:
+            cache.set(f'page_cache:gen:{group}', time.time_ns(), None)
+
+
+def cache_key(request, group):
+    """Return the cache key of a request's page within group."""
+
+    params = sorted(
+        (name, value)
+        for name in CACHED_PARAMS
+        for value in request.GET.getlist(name) if value
+    )
+    signature = f'{request.path}?{params}'
+    digest = hashlib.md5(signature.encode()).hexdigest()
+
+    return f'page_cache:{group}:{_generation(group)}:{digest}'
+
+
+def _is_cacheable(request, shared_only, private_params):
+    """
+    Tell whether a request may be answered with a shared page.
+
+    Only GET requests with no pending messages are cached, from
+    anonymous visitors unless hole punching is enabled. Pages of
+    shared_only views are cached in hole punching mode only.
+    """
+
+    hole_punching = getattr(settings, 'HOLE_PUNCHING', False)
+
+    if (
+        request.method not in ('GET', 'HEAD')
+        or (shared_only and not hole_punching)
+        or len(messages.get_messages(request))
+    ):
+        return False
+
+    if not request.user.is_authenticated:
+        return True
+
+    # Parameters that make the page depend on the user
+    return hole_punching and not any(
+        request.GET.get(name, '') not in ('', 'false')
+        for name in private_params
+    )
+
+
+def is_public_page(request, shared_only=False, private_params=()):
+    """
+    Tell whether cached_page serves the request a page rendered without
+    its per-user parts, which fragment endpoints then load.
+    """
+
+    return bool(
+        getattr(settings, 'HOLE_PUNCHING', False)
+        and getattr(settings, 'PAGE_CACHE_TIMEOUT', 60)
+        and _is_cacheable(request, shared_only, private_params)
+    )
+
+
+def _mark_public(response, timeout):
+    """Let browsers and proxies share a hole-punched page."""
+
+    patch_cache_control(response, public=True, max_age=timeout)
+
+    # Read by PublicPageMiddleware once the session is saved
+    response.public_page = True
+
+
+def cached_page(group, shared_only=False, private_params=()):
+    """
+    Cache a view's responses to anonymous visitors.
+
+    group is the page group name, or a callable returning it from the
+    view's keyword arguments. Responses are fresh for PAGE_CACHE_TIMEOUT
+    seconds and served stale for PAGE_CACHE_STALE_TIMEOUT more seconds
+    while they are re-rendered.
+
+    In hole punching mode the view renders the page without per-user
+    parts (request.public_page is set) and the page is shared with every
+    visitor, except when one of private_params is given by a logged-in
+    user. shared_only views are cached in hole punching mode only.
+    """
+
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60)
+            stale_timeout = getattr(settings, 'PAGE_CACHE_STALE_TIMEOUT', 300)
+
+            if not timeout or not _is_cacheable(
+                request, shared_only, private_params
+            ):
+                return view_func(request, *args, **kwargs)
+
+            hole_punching = getattr(settings, 'HOLE_PUNCHING', False)
+            request.public_page = hole_punching
+
+            page_group = group(**kwargs) if callable(group) else group
+            key = cache_key(request, page_group)
+            entry = cache.get(key)
+            now = time.time()
+
+            if entry is not None:
+                response, expires = entry
+                status = 'HIT'
+                if now >= expires:
+                    # Let one request re-render, serve the others stale
+                    status = 'STALE'
+                    if cache.add(f'{key}:lock', 1, 30):
+                        entry = None
+
+            if entry is not None:
+                _count(status.lower())
+            else:
+                _count('miss')
+                status = 'MISS'
+                response = view_func(request, *args, **kwargs)
+
+                if (
+                    response.status_code != 200
+                    or response.cookies
+                    or getattr(response, 'streaming', False)
+                ):
+                    cache.delete(f'{key}:lock')
+                    return response
+
+                if hasattr(response, 'render'):
+                    response.render()
+                cache.set(
+                    key, (response, now + timeout), timeout + stale_timeout
+                )
+                cache.delete(f'{key}:lock')
+
+            response['X-Page-Cache'] = status
+            if hole_punching:
+                _mark_public(response, timeout)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,207 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+# GET parameter carrying the opaque cursor token
+CURSOR_PARAM = 'cursor'
+
+# Cursor directions: towards older or newer items
+OLDER = 'o'
+NEWER = 'n'
+
+
+def encode_cursor(direction, created_date, pk):
+    """Encode a position in a feed as an opaque, URL-safe token."""
+
+    payload = json.dumps([direction, created_date.isoformat(), pk])
+    token = base64.urlsafe_b64encode(payload.encode())
+
+    return token.decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor token into (direction, created_date, pk).
+
+    Returns None for missing or malformed tokens, so a tampered link
+    falls back to the first page instead of failing.
+    """
+
+    if not token:
+        return None
+
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, created_date, pk = json.loads(
+            base64.urlsafe_b64decode(padded.encode())
+        )
+        if direction not in (OLDER, NEWER):
+            return None
+        return direction, datetime.fromisoformat(created_date), int(pk)
+    except (binascii.Error, TypeError, ValueError):
+        return None
+
+
+class CursorPage(Sequence):
+    """A single page of a feed paginated by CursorPaginator."""
+
+    # Lets templates tell cursor pages from numbered pages
+    is_cursor_page = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+        # Preserved GET parameters, set by paginate()
+        self.querystring = ''
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        """Token for the page of older items, if there is one."""
+
+        if not self._has_next:
+            return ''
+
+        return self.paginator.cursor_for(OLDER, self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        """Token for the page of newer items, if there is one."""
+
+        if not self._has_previous:
+            return ''
+
+        return self.paginator.cursor_for(NEWER, self.object_list[0])
+
+
+class CursorPaginator:
+    """
+    Keyset paginator for feeds ordered newest first.
+
+    Pages are addressed by the (created_date, id) of their edge rows
+    instead of an OFFSET, and no COUNT is run, so every page costs the
+    same single indexed range query as the first one.
+    """
+
+    def __init__(self, object_list, per_page, date_field='created_date'):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.date_field = date_field
+
+    def cursor_for(self, direction, obj):
+        """Return the token pointing past obj in the given direction."""
+        return encode_cursor(direction, getattr(obj, self.date_field), obj.pk)
+
+    def get_page(self, token):
+        """Return the page addressed by token, or the first page."""
+
+        cursor = decode_cursor(token)
+        date_field = self.date_field
+        queryset = self.object_list
+
+        if cursor is None:
+            rows = list(
+                queryset.order_by(f'-{date_field}', '-pk')[:self.per_page + 1]
+            )
+            has_more = len(rows) > self.per_page
+            return CursorPage(rows[:self.per_page], self, has_more, False)
+
+        direction, created_date, pk = cursor
+
+        if direction == OLDER:
+            # Rows strictly after the cursor in newest-first order
+            rows = list(
+                queryset.filter(
+                    Q(**{f'{date_field}__lt': created_date})
+                    | Q(**{date_field: created_date, 'pk__lt': pk})
+                ).order_by(f'-{date_field}', '-pk')[:self.per_page + 1]
+            )
+            has_more = len(rows) > self.per_page
+            return CursorPage(rows[:self.per_page], self, has_more, True)
+
+        # Rows strictly before the cursor, read in reverse and flipped back
+        rows = list(
+            queryset.filter(
+                Q(**{f'{date_field}__gt': created_date})
+                | Q(**{date_field: created_date, 'pk__gt': pk})
+            ).order_by(date_field, 'pk')[:self.per_page + 1]
+        )
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(rows, self, True, has_more)
+
+
+def paginate(request, object_list, per_page=10, date_field='created_date'):
+    """
+    Paginate a feed for the request.
+
+    Uses numbered pages by default. Cursor pagination is used when
+    CURSOR_PAGINATION is enabled or the request already carries a
+    cursor, so links handed out in cursor mode keep working. date_field
+    is the field the feed is ordered by, newest first.
+    """
+
+    use_cursor = (
+        getattr(settings, 'CURSOR_PAGINATION', False)
+        or CURSOR_PARAM in request.GET
+    )
+
+    if not use_cursor:
+        paginator = Paginator(object_list, per_page)
+        return paginator.get_page(request.GET.get('page'))
+
+    paginator = CursorPaginator(object_list, per_page, date_field)
+    page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
+
+    # Keep filters and search terms on the older/newer links
+    query = request.GET.copy()
+    query.pop(CURSOR_PARAM, None)
+    query.pop('page', None)
+    page_obj.querystring = query.urlencode()
+
+    return page_obj
+
+
+def paginate_ranked(request, ranked_ids, queryset, per_page=10):
+    """
+    Paginate a ranked list of ids with numbered pages.
+
+    Only the objects of the requested page are loaded from queryset,
+    in the order of ranked_ids.
+    """
+
+    paginator = Paginator(ranked_ids, per_page)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    objects = queryset.in_bulk(page_obj.object_list)
+    page_obj.object_list = [
+        objects[pk] for pk in page_obj.object_list if pk in objects
+    ]
+
+    return page_obj
@@ -0,0 +1,181 @@
+"""
+Retention policies for rows that are no longer needed.
+
+Each policy selects the rows of one model that are due and removes a
+batch of them by primary key. The apply_retention command runs the
+policies in small batches of one transaction each, sleeping between
+batches and stopping when its time budget is spent, so the notification,
+like and message tables stay small without long locks. A batch always
+takes the lowest due primary keys, so a stopped run resumes where it
+left off on the next one.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db.models import Case, Count, F, Value, When
+
+from content.models import Comment, CommentLike, ContentLike, ContentStats
+from user.models import Message, Notification
+
+
+class RetentionPolicy:
+    """Rows of a model that are removed once due."""
+
+    # Name used to select the policy on the command line
+    name = None
+    model = None
+
+    def description(self):
+        """Describe the rows the policy removes."""
+        raise NotImplementedError
+
+    def is_enabled(self):
+        return True
+
+    def due(self, now):
+        """Return the queryset of the rows due at now."""
+        raise NotImplementedError
+
+    def apply(self, pks):
+        """Remove the due rows with primary keys pks, returning how many."""
+
+        deleted = self.model.objects.filter(pk__in=pks).delete()[1]
+        return deleted.get(self.model._meta.label, 0)
+
+
+class AgePolicy(RetentionPolicy):
+    """Rows older than a number of days set in the settings."""
+
+    # Setting holding the number of days, 0 keeping the rows forever
+    setting = None
+    default_days = None
+
+    def __init__(self, days=None):
+        # Overrides the setting when given
+        self._days = days
+
+    def days(self):
+        if self._days is not None:
+            return self._days
+        return getattr(settings, self.setting, self.default_days)
+
+    def is_enabled(self):
+        return self.days() > 0
+
+    def cutoff(self, now):
+        return now - datetime.timedelta(days=self.days())
+
+
+class ReadNotificationsPolicy(AgePolicy):
+    name = 'notifications'
+    model = Notification
+    setting = 'NOTIFICATION_RETENTION_DAYS'
+    default_days = 90
+
+    def description(self):
+        return f'Read notifications older than {self.days()} days'
+
+    def due(self, now):
+        return Notification.objects.filter(
+            is_read=True, updated_date__lt=self.cutoff(now)
+        )
+
+
+class DeadMessagesPolicy(AgePolicy):
+    name = 'messages'
+    model = Message
+    setting = 'MESSAGE_RETENTION_DAYS'
+    default_days = 30
+
+    def description(self):
+        return (
+            f'Messages deleted by both sides older than {self.days()} days'
+        )
+
+    def due(self, now):
+        return Message.objects.filter(
+            is_deleted_by_sender=True,
+            is_deleted_by_recipient=True,
+            created_date__lt=self.cutoff(now),
+        )
+
+
+class OrphanLikesPolicy(RetentionPolicy):
+    """
+    Likes of deleted users, added to the folded_like_count of their
+    target's counter row before they are removed, so that like counts
+    and reconcile_counters are unchanged.
+    """
+
+    # Foreign key of the like to its target; the counter model, its
+    # field matching the target and the condition of the counter row
+    field = None
+    counter_model = None
+    counter_key = None
+    counter_row = {}
+
+    def description(self):
+        plural = self.model._meta.verbose_name_plural
+        return f'{plural.capitalize()} of deleted users'
+
+    def due(self, now):
+        return self.model.objects.filter(user__isnull=True)
+
+    def apply(self, pks):
+        likes = self.model.objects.filter(pk__in=pks)
+        folded = list(
+            likes.order_by().values_list(self.field).annotate(
+                total=Count('pk')
+            )
+        )
+
+        self.counter_model.objects.filter(
+            **self.counter_row,
+            **{f'{self.counter_key}__in': [target for target, _ in folded]},
+        ).update(
+            folded_like_count=F('folded_like_count') + Case(
+                *[
+                    When(**{self.counter_key: target}, then=Value(total))
+                    for target, total in folded
+                ],
+                default=Value(0),
+            )
+        )
+
+        return likes.delete()[0]
+
+
+class OrphanContentLikesPolicy(OrphanLikesPolicy):
+    name = 'content-likes'
+    model = ContentLike
+    field = 'content_id'
+    counter_model = ContentStats
+    counter_key = 'content_id'
+    counter_row = {'shard': 0}
+
+
+class OrphanCommentLikesPolicy(OrphanLikesPolicy):
+    name = 'comment-likes'
+    model = CommentLike
+    field = 'comment_id'
+    counter_model = Comment
+    counter_key = 'pk'
+
+
+# Policies in the order they run.
+POLICIES = [
+    ReadNotificationsPolicy(),
+    OrphanContentLikesPolicy(),
+    OrphanCommentLikesPolicy(),
+    DeadMessagesPolicy(),
+]
+
+
+def get_policies(names=None):
+    """Return the enabled policies, or those named if names are given."""
+
+    return [
+        policy for policy in POLICIES
+        if policy.is_enabled() and (not names or policy.name in names)
+    ]
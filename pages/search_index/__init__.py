@@ -0,0 +1,212 @@
+"""
+Full-text search index for contents.
+
+Each content has one index entry holding the analyzed terms of its
+title, introduction and text and its author's username, and each of its
+comments one entry of its own with the comment's text and author, so
+writing a comment only touches that comment's entry. Searches match
+entries and return their contents, best ranked first. Entries are kept
+up to date from the Content and Comment signals, built for existing
+contents on migrate when the index is empty, and can be rebuilt in bulk
+with the `rebuild_search_index` management command.
+"""
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .analyzers import (
+    MIN_TOKEN_LENGTH,
+    TOKEN_PATTERN,
+    fold,
+    get_analyzer,
+    query_terms
+)
+from .backends import INDEX_FIELDS, get_backend
+
+# Kinds of index entries. An entry's id is derived from the id of its
+# content or comment and its kind, so entries are replaced and removed
+# by key.
+CONTENT_ENTRY = 0
+COMMENT_ENTRY = 1
+
+
+def entry_id(kind, pk):
+    """Return the id of the index entry of a content or comment."""
+    return pk * 2 + kind
+
+
+def username_terms(usernames):
+    """
+    Return the index terms for a list of usernames: every prefix of each
+    of their words, so that e.g. 'auth' finds the contents of 'author'.
+    """
+
+    return ' '.join(
+        token[:length]
+        for username in usernames if username
+        for token in map(fold, TOKEN_PATTERN.findall(username.lower()))
+        for length in range(MIN_TOKEN_LENGTH, len(token) + 1)
+    )
+
+
+def content_entry(content):
+    """Build the index entry of a content."""
+
+    analyzer = get_analyzer(content.language)
+
+    return {
+        'entry_id': entry_id(CONTENT_ENTRY, content.pk),
+        'content_id': content.pk,
+        'title': analyzer.analyze(content.title),
+        'introduction': analyzer.analyze(content.introduction),
+        'text': analyzer.analyze(content.text),
+        'comment': '',
+        'username': username_terms(
+            [content.author.username if content.author else '']
+        ),
+    }
+
+
+def comment_entry(comment, language):
+    """Build the index entry of a comment on a content in language."""
+
+    return {
+        'entry_id': entry_id(COMMENT_ENTRY, comment.pk),
+        'content_id': comment.content_id,
+        'title': '',
+        'introduction': '',
+        'text': '',
+        'comment': get_analyzer(language).analyze(comment.text),
+        'username': username_terms(
+            [comment.author.username if comment.author else '']
+        ),
+    }
+
+
+def index_content(content, with_comments=False):
+    """
+    Add or refresh the index entry of a content, and those of its
+    comments when with_comments is set, e.g. after a language change.
+    """
+
+    backend = get_backend()
+    if backend is None:
+        return
+
+    entries = [content_entry(content)]
+    if with_comments:
+        entries += [
+            comment_entry(comment, content.language)
+            for comment in content.comments.select_related('author')
+        ]
+    backend.upsert(entries)
+
+
+def index_contents(contents):
+    """
+    Add or refresh the entries of several contents and their comments
+    in one batch.
+    """
+
+    backend = get_backend()
+    if backend is not None:
+        backend.upsert([
+            entry
+            for content in contents
+            for entry in [content_entry(content)] + [
+                comment_entry(comment, content.language)
+                for comment in content.comments.all()
+            ]
+        ])
+
+
+def index_comment(comment):
+    """Add or refresh the index entry of a comment."""
+
+    backend = get_backend()
+    if backend is not None:
+        backend.upsert([comment_entry(comment, comment.content.language)])
+
+
+def index_all(batch_size=500):
+    """
+    Index every content in batches, one transaction per batch.
+
+    Returns the number of contents indexed.
+    """
+
+    # Imported here to keep the package importable before apps load
+    from content.models import Content
+
+    contents = (
+        Content.objects.select_related('author')
+        .prefetch_related('comments__author')
+        .order_by('pk')
+    )
+
+    indexed = 0
+    batch = []
+    for content in contents.iterator(chunk_size=batch_size):
+        batch.append(content)
+        if len(batch) >= batch_size:
+            with transaction.atomic():
+                index_contents(batch)
+            indexed += len(batch)
+            batch = []
+
+    if batch:
+        with transaction.atomic():
+            index_contents(batch)
+        indexed += len(batch)
+
+    return indexed
+
+
+def remove_content(content_id):
+    """Remove the index entry of a content."""
+
+    backend = get_backend()
+    if backend is not None:
+        backend.delete([entry_id(CONTENT_ENTRY, content_id)])
+
+
+def remove_comment(comment_id):
+    """Remove the index entry of a comment."""
+
+    backend = get_backend()
+    if backend is not None:
+        backend.delete([entry_id(COMMENT_ENTRY, comment_id)])
+
+
+def search(query, fields, topic='', content_type=''):
+    """
+    Return the ids of contents matching query in the given fields,
+    best ranked first.
+
+    Returns None when no index is available for the database, so the
+    caller can fall back to a plain query.
+    """
+
+    backend = get_backend()
+    if backend is None:
+        return None
+
+    fields = [field for field in INDEX_FIELDS if field in fields]
+    term_groups = query_terms(query)
+    if not fields or not term_groups:
+        return []
+
+    try:
+        # In a savepoint, so a failed query leaves the transaction usable
+        with transaction.atomic():
+            ranked_ids = backend.search(
+                term_groups, fields, topic=topic, content_type=content_type,
+                limit=getattr(settings, 'SEARCH_MAX_RESULTS', 1000),
+            )
+            # The index is being rebuilt: nothing is searchable yet
+            if not ranked_ids and backend.is_empty():
+                return None
+    except DatabaseError:
+        return None
+
+    return ranked_ids
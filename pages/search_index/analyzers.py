@@ -0,0 +1,169 @@
+import html
+import re
+import unicodedata
+
+from django.utils.html import strip_tags
+
+# Word characters, including letters with diacritics.
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Tokens shorter than this are not indexed.
+MIN_TOKEN_LENGTH = 2
+
+# Stems shorter than this are left unstripped.
+MIN_STEM_LENGTH = 3
+
+STOPWORDS = {
+    'en': frozenset({
+        'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for',
+        'from', 'has', 'have', 'he', 'her', 'his', 'in', 'into', 'is', 'it',
+        'its', 'of', 'on', 'or', 'our', 'she', 'that', 'the', 'their',
+        'them', 'there', 'they', 'this', 'to', 'was', 'were', 'which',
+        'who', 'will', 'with', 'you', 'your',
+    }),
+    'nl': frozenset({
+        'aan', 'al', 'als', 'bij', 'dan', 'dat', 'de', 'die', 'dit', 'een',
+        'en', 'er', 'het', 'hij', 'hun', 'ik', 'in', 'is', 'je', 'maar',
+        'met', 'naar', 'niet', 'nog', 'of', 'om', 'ook', 'op', 'over',
+        'te', 'tot', 'uit', 'van', 'voor', 'was', 'wat', 'wel', 'werd',
+        'ze', 'zich', 'zijn', 'zo',
+    }),
+    'ku': frozenset({
+        'an', 'bi', 'bo', 'da', 'de', 'di', 'du', 'em', 'ev', 'ew', 'heta',
+        'her', 'hin', 'ji', 'jî', 'ku', 'li', 'lê', 'na', 'ne', 'ta', 'tu',
+        'û', 'wî', 'wê', 'ya', 'yê', 'ye', 'yên', 'bû', 'dê',
+    }),
+    'tr': frozenset({
+        'acaba', 'ama', 'ancak', 'bazı', 'belki', 'ben', 'bir', 'biz', 'bu',
+        'da', 'daha', 'de', 'diye', 'en', 'gibi', 'hem', 'her', 'için',
+        'ile', 'ise', 'ki', 'mi', 'mu', 'mı', 'mü', 'na', 'ne', 'o', 'olan',
+        'olarak', 'sen', 'siz', 'şu', 've', 'veya', 'ya', 'yani',
+    }),
+}
+
+# Inflectional suffixes stripped by the light stemmers, longest first.
+SUFFIXES = {
+    'en': (
+        'ations', 'ation', 'ings', 'ing', 'edly', 'ies', 'ied', 'ness',
+        'ed', 'es', 'ly', 's',
+    ),
+    'nl': (
+        'heden', 'heid', 'ingen', 'ing', 'lijk', 'tjes', 'tje', 'en',
+        'er', 'es', 'e', 's',
+    ),
+    'ku': (
+        'ekanî', 'ekan', 'yên', 'ên', 'iyê', 'ê', 'an', 'ek', 'î',
+    ),
+    'tr': (
+        'ların', 'lerin', 'ları', 'leri', 'lar', 'ler', 'dan', 'den', 'tan',
+        'ten', 'nın', 'nin', 'nun', 'nün', 'ın', 'in', 'un', 'ün', 'da',
+        'de', 'ta', 'te', 'yı', 'yi', 'yu', 'yü', 'ı', 'i', 'u', 'ü',
+    ),
+}
+
+
+class Analyzer:
+    """
+    Turns text in one language into normalized index terms.
+
+    Text is stripped of HTML, lowercased with the language's casing
+    rules, split into words, filtered for stopwords, reduced by a light
+    suffix-stripping stemmer and finally folded to ASCII-like letters,
+    so queries typed without diacritics still match.
+    """
+
+    def __init__(self, language):
+        self.language = language
+        self.stopwords = STOPWORDS.get(language, frozenset())
+        self.suffixes = SUFFIXES.get(language, ())
+
+    def lower(self, text):
+        """Lowercase text, keeping the Turkish dotted and dotless i apart."""
+
+        if self.language == 'tr':
+            text = text.replace('I', 'ı').replace('İ', 'i')
+
+        return text.lower()
+
+    def stem(self, token):
+        """Strip the longest known suffix that leaves a long enough stem."""
+
+        for suffix in self.suffixes:
+            if (
+                token.endswith(suffix)
+                and len(token) - len(suffix) >= MIN_STEM_LENGTH
+            ):
+                return token[:-len(suffix)]
+
+        return token
+
+    def terms(self, text):
+        """Return the index terms of text, in order."""
+
+        if not text:
+            return []
+
+        text = self.lower(html.unescape(strip_tags(text)))
+        terms = []
+
+        for token in TOKEN_PATTERN.findall(text):
+            if len(token) < MIN_TOKEN_LENGTH or token in self.stopwords:
+                continue
+            terms.append(fold(self.stem(token)))
+
+        return terms
+
+    def analyze(self, text):
+        """Return the index terms of text as a space separated string."""
+        return ' '.join(self.terms(text))
+
+
+def fold(term):
+    """Remove diacritics so that e.g. 'şeyh' and 'seyh' match."""
+
+    term = term.replace('ı', 'i')
+    decomposed = unicodedata.normalize('NFKD', term)
+
+    return ''.join(
+        char for char in decomposed if not unicodedata.combining(char)
+    )
+
+
+# One analyzer per Content.LANGUAGE_CHOICES entry.
+ANALYZERS = {
+    language: Analyzer(language) for language in ('en', 'nl', 'ku', 'tr')
+}
+
+
+def get_analyzer(language):
+    """Return the analyzer for a language, defaulting to English."""
+    return ANALYZERS.get(language, ANALYZERS['en'])
+
+
+def query_terms(query):
+    """
+    Analyze a search query whose language is unknown.
+
+    Returns one set of alternative terms per query word: the word as
+    each language's analyzer would index it. Words that are stopwords
+    in some languages only are left out when the query has other words,
+    since documents in those languages do not contain them; a query made
+    of such words alone, e.g. 'Ben' (a Turkish stopword and an English
+    name), keeps them with the terms of the analyzers that index them.
+    Words every analyzer drops are always left out.
+    """
+
+    groups = []
+    partial_groups = []
+
+    for word in TOKEN_PATTERN.findall(query):
+        alternatives = [
+            analyzer.terms(word) for analyzer in ANALYZERS.values()
+        ]
+        terms = {term for analyzed in alternatives for term in analyzed}
+        if all(alternatives):
+            groups.append(terms)
+        elif terms:
+            partial_groups.append(terms)
+
+    return groups or partial_groups
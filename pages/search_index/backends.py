@@ -0,0 +1,339 @@
+"""
+Database specific storage of the full-text search index.
+
+The index lives in a table of its own, with one row per content or
+comment entry keyed by the entry id and holding the entry's content id.
+Searches match entries, join them to their contents for the topic and
+content type filters and the date, and rank each content by its best
+entry. The table is created on migrate by create_schema() so that
+writes never run DDL: PostgreSQL takes a lock on the table for CREATE
+INDEX even when the index exists, and SQLite must not create the FTS5
+table inside a transaction that may roll back. Backends are only used
+once the table exists.
+
+Ranking differs between the engines. SQLite ranks with FTS5's BM25
+function. PostgreSQL has no BM25, so matches are ranked with
+ts_rank_cd over the weighted field vectors, normalized by document
+length (cover density rather than BM25's term saturation); scores are
+comparable within one engine only.
+"""
+
+import time
+
+from django.db import DatabaseError, connection
+
+# Name of the table holding the inverted index.
+INDEX_TABLE = 'pages_search_index'
+
+# Indexed fields, matching the choices of ContentSearchForm.search_fields.
+INDEX_FIELDS = ('title', 'introduction', 'text', 'comment', 'username')
+
+# Table of the indexed contents, joined for filters and ordering.
+CONTENT_TABLE = 'content_content'
+
+
+class SearchBackend:
+    """Base class for database specific full-text index backends."""
+
+    # Relative weight of each field when ranking matches
+    weights = {
+        'title': 10.0,
+        'introduction': 5.0,
+        'text': 1.0,
+        'comment': 1.0,
+        'username': 2.0,
+    }
+
+    def ensure_schema(self):
+        """Create the index table and its indexes if they are missing."""
+
+        with connection.cursor() as cursor:
+            for statement in self.schema_statements():
+                cursor.execute(statement)
+
+    def drop_schema(self):
+        """Drop the index table so that it can be rebuilt from scratch."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+    def schema_statements(self):
+        raise NotImplementedError
+
+    def is_empty(self):
+        """Check whether the index holds no entry yet."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {INDEX_TABLE} LIMIT 1')
+            return cursor.fetchone() is None
+
+    def upsert(self, entries):
+        """Insert or replace index entries, given as dicts."""
+        raise NotImplementedError
+
+    def delete(self, entry_ids):
+        """Remove the entries with the given ids."""
+
+        if not entry_ids:
+            return
+
+        placeholders = ', '.join(['%s'] * len(entry_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {INDEX_TABLE} '
+                f'WHERE {self.key_column} IN ({placeholders})',
+                list(entry_ids),
+            )
+
+    def filters(self, topic, content_type):
+        """Return the SQL conditions on the contents and their parameters."""
+
+        conditions = []
+        params = []
+        if topic:
+            conditions.append(f'{CONTENT_TABLE}.topic = %s')
+            params.append(topic)
+        if content_type:
+            conditions.append(f'{CONTENT_TABLE}.content_type = %s')
+            params.append(content_type)
+
+        return conditions, params
+
+    def search(self, term_groups, fields, topic='', content_type='',
+               limit=1000):
+        """
+        Return ids of the contents with matching entries, best ranked
+        first.
+        """
+        raise NotImplementedError
+
+
+class PostgresBackend(SearchBackend):
+    """
+    Index stored as one tsvector column per field, each with a GIN index.
+
+    Terms are produced by the project's analyzers, so the 'simple'
+    configuration is used to store them as they are. Matches are ranked
+    with ts_rank_cd over the weighted field vectors, in place of BM25
+    which PostgreSQL does not provide.
+    """
+
+    key_column = 'entry_id'
+
+    # Postgres only has four weight classes
+    weight_classes = {
+        'title': 'A',
+        'introduction': 'B',
+        'username': 'B',
+        'text': 'C',
+        'comment': 'D',
+    }
+
+    def schema_statements(self):
+        columns = ', '.join(f'{field} tsvector' for field in INDEX_FIELDS)
+        statements = [
+            f'CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ('
+            f'entry_id bigint PRIMARY KEY, '
+            f'content_id bigint NOT NULL '
+            f'REFERENCES {CONTENT_TABLE} (id) ON DELETE CASCADE, '
+            f'{columns})',
+            f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_content_id '
+            f'ON {INDEX_TABLE} (content_id)',
+        ]
+        statements += [
+            f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_{field}_gin '
+            f'ON {INDEX_TABLE} USING gin ({field})'
+            for field in INDEX_FIELDS
+        ]
+        return statements
+
+    def upsert(self, entries):
+        if not entries:
+            return
+
+        vectors = ', '.join(
+            f"to_tsvector('simple', %s)" for _ in INDEX_FIELDS
+        )
+        updates = ', '.join(
+            f'{column} = EXCLUDED.{column}'
+            for column in ('content_id',) + INDEX_FIELDS
+        )
+        sql = (
+            f'INSERT INTO {INDEX_TABLE} (entry_id, content_id, '
+            f'{", ".join(INDEX_FIELDS)}) '
+            f'VALUES (%s, %s, {vectors}) '
+            f'ON CONFLICT (entry_id) DO UPDATE SET {updates}'
+        )
+        rows = [
+            [entry['entry_id'], entry['content_id']]
+            + [entry[field] for field in INDEX_FIELDS]
+            for entry in entries
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def search(self, term_groups, fields, topic='', content_type='',
+               limit=1000):
+        # Terms are plain word characters, safe to use as tsquery lexemes
+        tsquery = ' & '.join(
+            '(' + ' | '.join(sorted(group)) + ')' for group in term_groups
+        )
+        match = ' OR '.join(f'entries.{field} @@ query' for field in fields)
+        weighted = ' || '.join(
+            f"setweight(entries.{field}, '{self.weight_classes[field]}')"
+            for field in fields
+        )
+        conditions, params = self.filters(topic, content_type)
+        where = ' AND '.join([f'({match})'] + conditions)
+
+        sql = (
+            f'SELECT entries.content_id FROM {INDEX_TABLE} entries '
+            f'JOIN {CONTENT_TABLE} '
+            f'ON {CONTENT_TABLE}.id = entries.content_id, '
+            f"to_tsquery('simple', %s) query WHERE {where} "
+            f'GROUP BY entries.content_id, {CONTENT_TABLE}.created_date '
+            f'ORDER BY MAX(ts_rank_cd({weighted}, query, 32)) DESC, '
+            f'{CONTENT_TABLE}.created_date DESC LIMIT %s'
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, *params, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteBackend(SearchBackend):
+    """
+    Index stored in an FTS5 virtual table keyed by the entry id.
+
+    Matches are ranked with FTS5's built-in BM25 function, weighting
+    each field column separately.
+    """
+
+    key_column = 'rowid'
+
+    def schema_statements(self):
+        return [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+            f'{", ".join(INDEX_FIELDS)}, content_id UNINDEXED, '
+            f"tokenize = 'unicode61 remove_diacritics 2')"
+        ]
+
+    def upsert(self, entries):
+        if not entries:
+            return
+
+        self.delete([entry['entry_id'] for entry in entries])
+        placeholders = ', '.join(['%s'] * (len(INDEX_FIELDS) + 2))
+        sql = (
+            f'INSERT INTO {INDEX_TABLE} (rowid, {", ".join(INDEX_FIELDS)}, '
+            f'content_id) VALUES ({placeholders})'
+        )
+        rows = [
+            [entry['entry_id']]
+            + [entry[field] for field in INDEX_FIELDS]
+            + [entry['content_id']]
+            for entry in entries
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def search(self, term_groups, fields, topic='', content_type='',
+               limit=1000):
+        expression = ' AND '.join(
+            '(' + ' OR '.join(f'"{term}"' for term in sorted(group)) + ')'
+            for group in term_groups
+        )
+        match = f'{{{" ".join(fields)}}} : ({expression})'
+        weights = ', '.join(str(self.weights[field]) for field in INDEX_FIELDS)
+        conditions, params = self.filters(topic, content_type)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+        # bm25() is lower for better matches. It cannot run inside the
+        # aggregate, and the subquery's LIMIT keeps SQLite from
+        # flattening it there.
+        sql = (
+            f'SELECT entries.content_id FROM ('
+            f'SELECT content_id, bm25({INDEX_TABLE}, {weights}) AS score '
+            f'FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s '
+            f'LIMIT -1) entries '
+            f'JOIN {CONTENT_TABLE} '
+            f'ON {CONTENT_TABLE}.id = entries.content_id{where} '
+            f'GROUP BY entries.content_id '
+            f'ORDER BY MIN(entries.score), '
+            f'MAX({CONTENT_TABLE}.created_date) DESC LIMIT %s'
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, *params, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+# Seconds before looking again for an index table that was missing,
+# e.g. in a worker started before migrate.
+MISSING_TABLE_RECHECK_INTERVAL = 60
+
+_backend = None
+_checked_at = 0
+
+
+def _vendor_backend():
+    """Return a backend for the default database's engine, or None."""
+
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteBackend()
+    return None
+
+
+def create_schema():
+    """
+    Create the index table if it is missing and return its backend.
+
+    Called on migrate and by `rebuild_search_index`, outside the
+    transactions writing to the index. Returns None when the database
+    has no supported full-text engine.
+    """
+
+    global _backend
+
+    backend = _vendor_backend()
+    if backend is not None:
+        try:
+            backend.ensure_schema()
+        except DatabaseError:
+            # E.g. SQLite compiled without FTS5
+            backend = None
+
+    # Look the table up again on next use
+    _backend = None
+    return backend
+
+
+def get_backend():
+    """
+    Return the index backend for the default database.
+
+    Returns None when the database has no supported full-text engine or
+    the index table has not been created, in which case callers fall
+    back to plain queries. A missing table is looked up again once
+    MISSING_TABLE_RECHECK_INTERVAL seconds have passed.
+    """
+
+    global _backend, _checked_at
+
+    if _backend is None or (
+        _backend is False
+        and time.monotonic() - _checked_at >= MISSING_TABLE_RECHECK_INTERVAL
+    ):
+        _checked_at = time.monotonic()
+        backend = _vendor_backend()
+        if (
+            backend is not None
+            and INDEX_TABLE in connection.introspection.table_names()
+        ):
+            _backend = backend
+        else:
+            _backend = False
+
+    return _backend or None
@@ -0,0 +1,159 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import (
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from content.models import Comment, Content
+from content.signals import counts_changed
+from pages import (
+    facets,
+    freshness,
+    page_cache,
+    search_index,
+    suggestions
+)
+from pages.search_index.backends import create_schema
+
+
+@receiver(post_save, sender=Content)
+def index_content_on_save(sender, instance, **kwargs):
+    """
+    Refresh the search index entry when a Content is saved, and those of
+    its comments when its language, which they are analyzed in, changed.
+    """
+
+    previous_language = getattr(instance, '_previous_language', None)
+    search_index.index_content(
+        instance,
+        with_comments=(
+            previous_language is not None
+            and previous_language != instance.language
+        ),
+    )
+
+
+@receiver(post_delete, sender=Content)
+def remove_content_from_index(sender, instance, **kwargs):
+    """Remove the search index entry when a Content is deleted."""
+    search_index.remove_content(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment_on_save(sender, instance, **kwargs):
+    """Refresh the comment's own search index entry."""
+    search_index.index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_from_index(sender, instance, **kwargs):
+    """Remove the comment's search index entry."""
+    search_index.remove_comment(instance.pk)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    """
+    Create the search index table on migrate, outside the transactions
+    that write to it, and index the existing contents while it is empty.
+    """
+
+    if sender.label != 'pages':
+        return
+
+    backend = create_schema()
+    if backend is not None and backend.is_empty():
+        search_index.index_all()
+
+
+@receiver(post_save, sender=Content)
+def update_suggestions_on_content_save(sender, instance, **kwargs):
+    """Refresh the content's title in the suggestion index."""
+    suggestions.update_content(instance)
+
+
+@receiver(post_delete, sender=Content)
+def remove_content_from_suggestions(sender, instance, **kwargs):
+    """Drop a deleted content's title from the suggestion index."""
+    suggestions.remove_content(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def update_suggestions_on_user_save(sender, instance, **kwargs):
+    """Refresh a renamed or deactivated author in the suggestion index."""
+    suggestions.update_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def remove_user_from_suggestions(sender, instance, **kwargs):
+    """Drop a deleted author from the suggestion index."""
+    suggestions.remove_user(instance.pk)
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def invalidate_facet_counts(sender, instance, **kwargs):
+    """Invalidate cached facet counts when a Content changes."""
+    facets.invalidate()
+
+
+@receiver(pre_save, sender=Content)
+def remember_previous_values(sender, instance, **kwargs):
+    """
+    Remember the stored topic and language, so a topic change evicts
+    both listings and a language change reindexes the comments.
+    """
+
+    previous = (
+        Content.objects.filter(pk=instance.pk)
+        .values_list('topic', 'language').first()
+        if instance.pk else None
+    )
+    instance._previous_topic, instance._previous_language = (
+        previous or (None, None)
+    )
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def invalidate_cached_pages(sender, instance, **kwargs):
+    """Evict and touch the pages a Content appears in."""
+
+    topics = {instance.topic, getattr(instance, '_previous_topic', None)}
+    groups = [
+        f'content:{instance.pk}',
+        'topic:all_contents',
+        *(f'topic:{topic}' for topic in topics if topic),
+    ]
+    page_cache.invalidate(*groups)
+    freshness.touch(*groups)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_cached_content_page(sender, instance, **kwargs):
+    """Evict and touch the page of the commented Content."""
+
+    page_cache.invalidate(f'content:{instance.content_id}')
+    freshness.touch(f'content:{instance.content_id}')
+
+
+@receiver(counts_changed)
+def touch_counted_pages(sender, content_ids, **kwargs):
+    """
+    Touch the pages showing counts that changed: the contents' pages,
+    and for content counts the listings they appear in. Cached pages are
+    left to expire, as their counts may lag by PAGE_CACHE_TIMEOUT.
+    """
+
+    keys = [f'content:{content_id}' for content_id in content_ids]
+    if sender is Content:
+        topics = set(
+            Content.objects.filter(pk__in=content_ids)
+            .values_list('topic', flat=True)
+        )
+        keys += ['topic:all_contents', *(f'topic:{topic}' for topic in topics)]
+    freshness.touch(*keys)
@@ -0,0 +1,277 @@
+"""
+In-memory prefix index behind the search suggestions endpoint.
+
+Published content titles, topics and the usernames of their authors
+are kept in sorted arrays of normalized keys, one per kind, so a prefix
+lookup is a binary search followed by at most a few entries per kind,
+and never touches the database. The index is built by a background
+thread started with the WSGI or ASGI worker, kept current from Content
+and User signals, and rebuilt by the same thread every
+SUGGEST_INDEX_MAX_AGE seconds to pick up changes made by other workers.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.urls import reverse
+
+from content.models import Content
+from .search_index.analyzers import TOKEN_PATTERN, fold
+
+logger = logging.getLogger(__name__)
+
+# Kinds of suggestions, in the order they are listed.
+KINDS = ('topic', 'title', 'author')
+
+def normalize(text):
+    """Lowercase and fold text so that lookups ignore case and diacritics."""
+    return fold(' '.join(TOKEN_PATTERN.findall(text.lower())))
+
+
+class PrefixIndex:
+    """
+    Sorted arrays of (key, id) entries per kind, for prefix lookups.
+
+    Titles get one key per word, so 'love' finds 'Divine Love' as well
+    as 'Love and Longing'.
+    """
+
+    def __init__(self):
+        self.keys = {kind: [] for kind in KINDS}
+        self.entries = {}  # (kind, id) -> (label, url, keys)
+
+    def add(self, kind, item_id, label, url, keys):
+        """Add an entry, replacing a previous entry with the same id."""
+
+        self.remove(kind, item_id)
+        keys = [key for key in keys if key]
+        self.entries[(kind, item_id)] = (label, url, keys)
+        for key in keys:
+            insort(self.keys[kind], (key, item_id))
+
+    def remove(self, kind, item_id):
+        """Remove an entry if present."""
+
+        entry = self.entries.pop((kind, item_id), None)
+        if entry is None:
+            return
+
+        keys = self.keys[kind]
+        for key in entry[2]:
+            position = bisect_left(keys, (key, item_id))
+            if position < len(keys) and keys[position] == (key, item_id):
+                del keys[position]
+
+    def lookup(self, prefix, limit):
+        """Return up to limit suggestion dicts per kind for a prefix."""
+
+        suggestions = []
+        for kind in KINDS:
+            keys = self.keys[kind]
+            found = []
+            position = bisect_left(keys, (prefix,))
+            # Stop at the first key past the prefix or once limit is found
+            while position < len(keys) and len(found) < limit:
+                key, item_id = keys[position]
+                if not key.startswith(prefix):
+                    break
+                if item_id not in found:
+                    found.append(item_id)
+                position += 1
+
+            for item_id in found:
+                label, url, _ = self.entries[(kind, item_id)]
+                suggestions.append({'type': kind, 'label': label, 'url': url})
+
+        return suggestions
+
+
+def _add_author(index, user_id, username):
+    index.add(
+        'author', user_id, username,
+        reverse('profile_view', args=[username]), [normalize(username)],
+    )
+
+
+def title_keys(title):
+    """Return one key per word start of a title."""
+
+    words = normalize(title).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+_index = None
+_lock = threading.Lock()
+
+# Signal updates made while a build is running, replayed on the new index
+_replay = None
+
+_refresher = None
+
+
+def _build():
+    """Build a fresh index from the database."""
+
+    index = PrefixIndex()
+
+    for value, label in Content.TOPIC_CHOICES:
+        url = reverse('content_topic_list', args=[value])
+        index.add('topic', value, label, url, title_keys(label))
+
+    contents = Content.objects.filter(is_published=True).values_list(
+        'pk', 'title'
+    )
+    for pk, title in contents.iterator():
+        index.add(
+            'title', pk, title, reverse('content_detail', args=[pk]),
+            title_keys(title),
+        )
+
+    authors = User.objects.filter(
+        is_active=True, content__is_published=True
+    ).values_list('pk', 'username').distinct()
+    for pk, username in authors.iterator():
+        _add_author(index, pk, username)
+
+    return index
+
+
+def rebuild():
+    """
+    Build a fresh index and swap it in.
+
+    Lookups keep using the previous index while the database is read;
+    changes signalled meanwhile are replayed on the new one.
+    """
+
+    global _index, _replay
+
+    with _lock:
+        _replay = []
+    try:
+        index = _build()
+    except Exception:
+        with _lock:
+            _replay = None
+        raise
+
+    with _lock:
+        for change in _replay:
+            change(index)
+        _replay = None
+        _index = index
+
+
+def _refresh():
+    """Rebuild the index now and then every SUGGEST_INDEX_MAX_AGE seconds."""
+
+    max_age = getattr(settings, 'SUGGEST_INDEX_MAX_AGE', 300)
+    while True:
+        try:
+            rebuild()
+        except Exception:
+            logger.exception('Error building the search suggestion index.')
+        finally:
+            # The thread has its own connections; do not keep them open
+            connections.close_all()
+
+        if max_age <= 0:
+            return
+        time.sleep(max_age)
+
+
+def start():
+    """Start the thread building and refreshing the index, once."""
+
+    global _refresher
+
+    if _refresher is not None:
+        return
+
+    with _lock:
+        if _refresher is not None:
+            return
+        _refresher = threading.Thread(
+            target=_refresh, name='search-suggestions', daemon=True
+        )
+        _refresher.start()
+
+
+def _apply(change):
+    """Apply a change to the index, and to the one being built if any."""
+
+    with _lock:
+        if _index is not None:
+            change(_index)
+        if _replay is not None:
+            _replay.append(change)
+
+
+def suggest(query, limit=5):
+    """
+    Return suggestions for the beginning of a query.
+
+    Returns no suggestions until the worker's index has been built.
+    """
+
+    prefix = normalize(query)
+    if not prefix or _index is None:
+        return []
+
+    with _lock:
+        return _index.lookup(prefix, limit)
+
+
+def update_content(content):
+    """Add, refresh or drop a content's title after it is saved."""
+
+    if content.is_published:
+        title = (
+            content.pk, content.title,
+            reverse('content_detail', args=[content.pk]),
+            title_keys(content.title),
+        )
+        author = content.author
+        if author is None or not author.is_active:
+            author = None
+
+        def change(index):
+            index.add('title', *title)
+            if author is not None:
+                _add_author(index, author.pk, author.username)
+    else:
+        def change(index):
+            index.remove('title', content.pk)
+
+    _apply(change)
+
+
+def remove_content(content_id):
+    """Drop a deleted content's title."""
+    _apply(lambda index: index.remove('title', content_id))
+
+
+def update_user(user):
+    """Refresh or drop an indexed author's username after a save."""
+
+    user_id, username, is_active = user.pk, user.username, user.is_active
+
+    def change(index):
+        if ('author', user_id) not in index.entries:
+            return
+        if is_active:
+            _add_author(index, user_id, username)
+        else:
+            index.remove('author', user_id)
+
+    _apply(change)
+
+
+def remove_user(user_id):
+    """Drop a deleted author's username."""
+    _apply(lambda index: index.remove('author', user_id))
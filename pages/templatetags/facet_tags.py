@@ -0,0 +1,37 @@
+from django import template
+from django.urls import reverse
+
+register = template.Library()
+
+
+@register.inclusion_tag('partials/_facets.html', takes_context=True)
+def facet_badges(context, facet, param='', url_name=''):
+    """
+    Render the values of a facet as count badges linking to the filter.
+
+    Links set the GET parameter param to the value, or clear it for the
+    selected value, keeping the other GET parameters apart from the page.
+    With url_name, values are path arguments of that URL instead.
+    """
+
+    query = context['request'].GET.copy()
+    for key in ('page', 'cursor', param):
+        query.pop(key, None)
+
+    items = []
+    for item in facet:
+        if url_name:
+            url = reverse(url_name, args=[item['value']])
+            values = query
+        else:
+            values = query.copy()
+            if not item['selected']:
+                values[param] = item['value']
+            url = ''
+        querystring = values.urlencode()
+        items.append({
+            **item,
+            'url': f'{url}?{querystring}' if querystring else url or '?',
+        })
+
+    return {'items': items}
@@ -0,0 +1,34 @@
+from django import template
+
+register = template.Library()
+
+
+@register.inclusion_tag('partials/_pagination.html', takes_context=True)
+def pagination(context, page_obj, on_each_side=2):
+    """
+    Render navigation for page_obj.
+
+    Numbered pages show the first and last page plus a window of
+    on_each_side pages around the current one, so the markup stays
+    the same size however many pages there are. Cursor pages show
+    newer/older links. The current GET parameters, apart from the page
+    number, are encoded once and kept on every link.
+    """
+
+    if getattr(page_obj, 'is_cursor_page', False):
+        return {'page_obj': page_obj}
+
+    query = context['request'].GET.copy()
+    query.pop('page', None)
+
+    paginator = page_obj.paginator
+    page_range = paginator.get_elided_page_range(
+        page_obj.number, on_each_side=on_each_side, on_ends=1
+    )
+
+    return {
+        'page_obj': page_obj,
+        'page_range': page_range,
+        'ellipsis': paginator.ELLIPSIS,
+        'querystring': query.urlencode(),
+    }
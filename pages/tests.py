@@ -1 +1,411 @@
-from django.test import TestCase
+import datetime
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from content.likes import toggle_like
+from content.models import Comment, CommentLike, Content, ContentLike
+from content.view_counter import view_counter
+from user.models import EmailVerification, Message, Notification
+from . import search_index
+from .search_index import backends
+from .pagination import CursorPaginator, encode_cursor, paginate
+
+
+def create_content(author, title='Title', topic='history'):
+    return Content.objects.create(
+        title=title,
+        introduction='Introduction',
+        text='Text',
+        topic=topic,
+        content_type='academic_article',
+        author=author,
+    )
+
+
+class CursorPaginatorTests(TestCase):
+    """Keyset pages of a feed ordered newest first."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+
+    def create_feed(self, count, created_date=None):
+        contents = [
+            create_content(self.author, f'Content {i}') for i in range(count)
+        ]
+        if created_date is not None:
+            Content.objects.update(created_date=created_date)
+        return contents
+
+    def walk(self, paginator):
+        """Return the titles of every page, following the next cursors."""
+
+        pages = []
+        page = paginator.get_page(None)
+        pages.append([content.title for content in page])
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append([content.title for content in page])
+        return pages
+
+    def test_empty_feed(self):
+        page = CursorPaginator(Content.objects.all(), 2).get_page(None)
+
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_other_pages())
+        self.assertEqual(page.next_cursor, '')
+        self.assertEqual(page.previous_cursor, '')
+
+    def test_exact_multiple(self):
+        self.create_feed(4)
+
+        pages = self.walk(CursorPaginator(Content.objects.all(), 2))
+
+        # No empty last page
+        self.assertEqual(pages, [
+            ['Content 3', 'Content 2'],
+            ['Content 1', 'Content 0'],
+        ])
+
+    def test_ties_on_date(self):
+        # Rows sharing a date are ordered by id, none skipped or repeated
+        self.create_feed(5, created_date=timezone.now())
+
+        pages = self.walk(CursorPaginator(Content.objects.all(), 2))
+
+        self.assertEqual(pages, [
+            ['Content 4', 'Content 3'],
+            ['Content 2', 'Content 1'],
+            ['Content 0'],
+        ])
+
+    def test_previous_page(self):
+        self.create_feed(5)
+        paginator = CursorPaginator(Content.objects.all(), 2)
+
+        first = paginator.get_page(None)
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertFalse(third.has_next())
+        self.assertTrue(third.has_previous())
+
+        back = paginator.get_page(third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertTrue(back.has_next())
+        self.assertTrue(back.has_previous())
+
+        back = paginator.get_page(back.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_malformed_cursor(self):
+        self.create_feed(3)
+        paginator = CursorPaginator(Content.objects.all(), 2)
+        first = list(paginator.get_page(None))
+
+        bad_direction = encode_cursor('x', timezone.now(), 1)
+        for token in ('garbage', 'e30', bad_direction, '!!!'):
+            with self.subTest(token=token):
+                page = paginator.get_page(token)
+                self.assertEqual(list(page), first)
+                self.assertFalse(page.has_previous())
+
+    def test_querystring(self):
+        self.create_feed(3)
+        request = RequestFactory().get(
+            '/', {'content_type': 'academic_article', 'cursor': '', 'page': 2}
+        )
+
+        page = paginate(request, Content.objects.all(), 2)
+
+        self.assertTrue(page.is_cursor_page)
+        self.assertEqual(page.querystring, 'content_type=academic_article')
+
+
+class SearchIndexTests(TestCase):
+    """Contents are found through the full-text index."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+
+    def test_stopword_of_other_language(self):
+        # 'ben' is a Turkish stopword, but an English name
+        content = create_content(self.author, 'Ben and the sufis')
+
+        self.assertEqual(search_index.search('Ben', ['title']), [content.pk])
+        self.assertEqual(
+            search_index.search('the sufis', ['title']), [content.pk]
+        )
+        self.assertEqual(search_index.search('and the', ['title']), [])
+
+    def test_missing_table_looked_up_again(self):
+        self.addCleanup(setattr, backends, '_backend', None)
+
+        # The table was missing a moment ago
+        backends._backend = False
+        backends._checked_at = time.monotonic()
+        self.assertIsNone(backends.get_backend())
+
+        backends._checked_at -= backends.MISSING_TABLE_RECHECK_INTERVAL
+        self.assertIsNotNone(backends.get_backend())
+
+    def test_comments(self):
+        content = create_content(self.author)
+        other = create_content(self.author, 'Other', topic='sufis')
+        reader = User.objects.create_user('reader', 'reader@example.com')
+        comment = Comment.objects.create(
+            content=content, author=reader, text='Whirling dervishes'
+        )
+        Comment.objects.create(content=other, author=reader, text='Dervish')
+
+        self.assertEqual(
+            sorted(search_index.search('dervishes', ['comment'])),
+            sorted([content.pk, other.pk]),
+        )
+        self.assertEqual(
+            search_index.search('dervishes', ['comment'], topic='sufis'),
+            [other.pk],
+        )
+        self.assertEqual(search_index.search('dervishes', ['title']), [])
+
+        # Deleting the comment removes its entry only
+        comment.delete()
+        self.assertEqual(
+            search_index.search('dervishes', ['comment']), [other.pk]
+        )
+        self.assertEqual(search_index.search('title', ['title']), [content.pk])
+
+    def test_comment_write_touches_its_entry(self):
+        content = create_content(self.author)
+        Comment.objects.create(content=content, author=self.author, text='A')
+
+        with CaptureQueriesContext(connection) as queries:
+            Comment.objects.create(
+                content=content, author=self.author, text='Comment'
+            )
+
+        writes = [
+            query['sql'] for query in queries.captured_queries
+            if backends.INDEX_TABLE in query['sql']
+        ]
+        # One delete and one insert, of the new comment's entry
+        self.assertEqual(len(writes), 2)
+
+    def test_username_prefix(self):
+        content = create_content(self.author)
+        reader = User.objects.create_user('Şeyhmus', 'reader@example.com')
+        other = create_content(reader, 'Other')
+        Comment.objects.create(content=content, author=reader, text='Comment')
+
+        self.assertEqual(
+            search_index.search('auth', ['username']), [content.pk]
+        )
+        self.assertEqual(
+            sorted(search_index.search('seyh', ['username'])),
+            sorted([content.pk, other.pk]),
+        )
+        self.assertEqual(search_index.search('thor', ['username']), [])
+
+
+class ConditionalGetTests(TestCase):
+    """Content and topic pages answer 304 until what they show changes."""
+
+    def setUp(self):
+        cache.clear()
+        # Buffer views, as workers do, and write them back on cleanup
+        view_counter.flush_interval = 3600
+        self.addCleanup(setattr, view_counter, 'flush_interval', 0)
+        self.addCleanup(view_counter.stop)
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        self.content = create_content(self.author)
+        self.url = reverse('content_detail', args=[self.content.pk])
+
+    def assertNotModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_content_page(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertNotModified(self.url, etag)
+
+        self.content.title = 'New title'
+        self.content.save()
+        etag = self.assertModified(self.url, etag)
+        self.assertNotModified(self.url, etag)
+
+        Comment.objects.create(
+            content=self.content, author=self.reader, text='Comment'
+        )
+        etag = self.assertModified(self.url, etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.reader, 'content', self.content.pk)
+        etag = self.assertModified(self.url, etag)
+
+        # Views count once they are written back
+        self.assertNotModified(self.url, etag)
+        view_counter.flush()
+        self.assertModified(self.url, etag)
+
+    def test_not_modified_counts_view(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotModified(self.url, etag)
+
+        self.assertEqual(view_counter.pending(), {self.content.pk: 2})
+
+    def test_topic_page(self):
+        url = reverse('content_topic_list', args=['history'])
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, etag)
+
+        # Contents of other topics leave the listing as it is
+        create_content(self.author, topic='sufis')
+        self.assertNotModified(url, etag)
+
+        create_content(self.author)
+        etag = self.assertModified(url, etag)
+
+        self.content.title = 'New title'
+        self.content.save()
+        self.assertModified(url, etag)
+
+    def test_no_validators_for_users(self):
+        EmailVerification.objects.create(user=self.reader, is_verified=True)
+        self.client.force_login(self.reader)
+        topic_url = reverse('content_topic_list', args=['history'])
+
+        self.assertFalse(self.client.get(self.url).has_header('ETag'))
+        self.assertFalse(self.client.get(topic_url).has_header('ETag'))
+
+        with override_settings(HOLE_PUNCHING=True):
+            self.assertTrue(self.client.get(topic_url).has_header('ETag'))
+            response = self.client.get(
+                topic_url, {'show_following_content': 'true'}
+            )
+            self.assertFalse(response.has_header('ETag'))
+
+
+class ApplyRetentionTests(TestCase):
+    """apply_retention removes due rows and keeps the like counts."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        self.content = create_content(self.author)
+        self.comment = Comment.objects.create(
+            content=self.content, author=self.author, text='Comment'
+        )
+        self.old = timezone.now() - datetime.timedelta(days=400)
+
+    def apply_retention(self, **options):
+        out = StringIO()
+        call_command(
+            'apply_retention', batch_size=2, sleep=0, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_read_notifications(self):
+        old_read = Notification.objects.create(
+            user=self.author, notification_type='follow', is_read=True
+        )
+        old_unread = Notification.objects.create(
+            user=self.author, notification_type='follow', is_read=False
+        )
+        recent_read = Notification.objects.create(
+            user=self.author, notification_type='follow', is_read=True
+        )
+        Notification.objects.filter(
+            pk__in=[old_read.pk, old_unread.pk]
+        ).update(updated_date=self.old)
+
+        output = self.apply_retention(dry_run=True)
+        self.assertIn(
+            'Read notifications older than 90 days: 1 rows due', output
+        )
+        self.assertEqual(Notification.objects.count(), 3)
+
+        self.apply_retention(policy=['notifications'])
+        self.assertQuerySetEqual(
+            Notification.objects.order_by('pk'),
+            [old_unread, recent_read],
+        )
+
+    def test_dead_messages(self):
+        both = Message.objects.create(
+            sender=self.author, recipient=self.reader, subject='Subject',
+            message='Message', is_deleted_by_sender=True,
+            is_deleted_by_recipient=True,
+        )
+        one_side = Message.objects.create(
+            sender=self.author, recipient=self.reader, subject='Subject',
+            message='Message', is_deleted_by_sender=True,
+        )
+        Message.objects.update(created_date=self.old)
+
+        output = self.apply_retention(policy=['messages'])
+        self.assertIn('1 rows removed', output)
+        self.assertFalse(Message.objects.filter(pk=both.pk).exists())
+        self.assertTrue(Message.objects.filter(pk=one_side.pk).exists())
+
+    @override_settings(MESSAGE_RETENTION_DAYS=0)
+    def test_disabled_policy(self):
+        Message.objects.create(
+            sender=self.author, recipient=self.reader, subject='Subject',
+            message='Message', is_deleted_by_sender=True,
+            is_deleted_by_recipient=True,
+        )
+        Message.objects.update(created_date=self.old)
+
+        self.apply_retention(policy=['messages'])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_likes_of_deleted_users(self):
+        readers = [
+            User.objects.create_user(f'reader{i}', f'reader{i}@example.com')
+            for i in range(3)
+        ]
+        for reader in readers + [self.reader]:
+            toggle_like(reader, 'content', self.content.pk)
+            toggle_like(reader, 'comment', self.comment.pk)
+        for reader in readers:
+            reader.delete()
+
+        self.apply_retention()
+
+        # Folded into the counters, the counts are unchanged
+        self.assertEqual(ContentLike.objects.count(), 1)
+        self.assertEqual(CommentLike.objects.count(), 1)
+        self.assertEqual(self.content.like_count, 4)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.like_count, 4)
+
+        output = StringIO()
+        call_command('reconcile_counters', stdout=output)
+        self.assertIn('Contents: 0 like counts', output.getvalue())
+        self.assertIn('Comments: 0 like counts', output.getvalue())
+
+    def test_time_budget(self):
+        Notification.objects.create(
+            user=self.author, notification_type='follow', is_read=True
+        )
+        Notification.objects.update(updated_date=self.old)
+
+        output = self.apply_retention(max_seconds=0.000001)
+        self.assertIn('Time budget spent', output)
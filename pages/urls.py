@@ -14,6 +14,12 @@ urlpatterns = [
     path('pages/search/', views.search,
          name='search'),  # Path to the search page
 
+    path('pages/search/suggestions/', views.search_suggestions,
+         name='search_suggestions'),  # Path to search suggestions as JSON
+
+    path('pages/fragments/', views.page_fragments,
+         name='page_fragments'),  # Path to per-user parts of cached pages
+
     path('pages/contact/', views.contact_view,
          name='contact'),  # Path to the contact form page
 ]
@@ -1,31 +1,48 @@
 from django.conf import settings
 from django.contrib import messages
 from django.core.mail import send_mail
-from django.core.paginator import Paginator
 from django.db.models import Q
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
 
 from content.models import Content
 from user.models import Follow
+from . import search_index, suggestions
+from .facets import facet_counts
+from .fragments import fragment_response, render_navbar_user
+from .freshness import conditional_page, topic_fingerprint
 from .forms import ContactForm, ContentSearchForm
+from .page_cache import cached_page
+from .pagination import paginate, paginate_ranked
 
 
+@cached_page('static')
 def home(request):
     """Renders the home page."""
     return render(request, 'pages/home.html')
 
 
+@cached_page('static')
 def about(request):
     """Renders the about page."""
     return render(request, 'pages/about.html')
 
 
+@conditional_page(
+    topic_fingerprint, private_params=('show_following_content',)
+)
+@cached_page(
+    lambda topic: f'topic:{topic}',
+    private_params=('show_following_content',),
+)
 def content_topic_list(request, topic):
     """Displays content filtered by topic, content type, and
     optionally by followed authors."""
 
-    # Retrieve the content type and following filter from GET parameters.
+    # Retrieve the content type, language and following filter from GET
+    # parameters.
     content_type = request.GET.get('content_type', '')
+    language = request.GET.get('language', '')
     show_following_content = (
         request.GET.get('show_following_content', '') == 'true'
     )
@@ -62,28 +79,45 @@ def content_topic_list(request, topic):
             filter_criteria['author_id__in'] = []
             contents_topic_list = Content.objects.none()
 
+    # Count contents per topic, content type and language in one query.
+    # Counts filtered by followed authors are per user and not cached.
+    facet_base = Content.objects.filter(**{
+        key: value for key, value in filter_criteria.items() if key != 'topic'
+    })
+    facets = facet_counts(
+        facet_base,
+        {
+            'topic': filter_criteria.get('topic', ''),
+            'content_type': content_type,
+            'language': language,
+        },
+        signature=None if 'author_id__in' in filter_criteria else 'published',
+    )
+
     # Filter content by criteria and order by creation date.
-    contents_topic_list = Content.objects.filter(
+    contents_topic_list = Content.objects.for_listing().with_stats().filter(
         **filter_criteria
     ).order_by('-created_date')
 
-    # Further filter by content type if provided.
+    # Further filter by content type and language if provided.
     if content_type:
         contents_topic_list = contents_topic_list.filter(
             content_type=content_type
         ).order_by('-created_date')
+    if language:
+        contents_topic_list = contents_topic_list.filter(language=language)
 
     # Set up pagination for the filtered content, 10 items per page.
-    paginator = Paginator(contents_topic_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, contents_topic_list, 10)
 
     # Prepare context data for rendering the template.
     context = {
         "topic": topic,
         "page_obj": page_obj,
         'content_type': content_type,
-        'show_following_content': show_following_content
+        'language': language,
+        'show_following_content': show_following_content,
+        'facets': facets,
     }
     return render(request, 'pages/content_topic_list.html', context)
 
@@ -92,7 +126,9 @@ def search(request):
     """Handles multi-field search with filters and pagination."""
 
     content_form = ContentSearchForm(request.GET or None)
-    content_results = []
+    content_results = Content.objects.none()
+    ranked_ids = None
+    facets = None
 
     if content_form.is_valid():
         # Extract search query and fields to filter by.
@@ -100,6 +136,9 @@ def search(request):
         search_fields = content_form.cleaned_data.get('search_fields', [])
         content_topic = content_form.cleaned_data.get('content_topic', '')
         content_type = content_form.cleaned_data.get('content_type', '')
+        content_language = content_form.cleaned_data.get(
+            'content_language', ''
+        )
 
         # Validate the search input.
         if not search_query:
@@ -107,38 +146,58 @@ def search(request):
         elif not search_fields:
             messages.error(request, 'Please select at least one search field.')
         else:
-            # Build the search filters using Q objects.
-            filters = Q()
-            if 'title' in search_fields:
-                filters |= Q(title__icontains=search_query)
-            if 'introduction' in search_fields:
-                filters |= Q(introduction__icontains=search_query)
-            if 'text' in search_fields:
-                filters |= Q(text__icontains=search_query)
-            if 'comment' in search_fields:
-                filters |= Q(comments__text__icontains=search_query)
-            if 'username' in search_fields:
-                filters |= (
-                    Q(author__username__icontains=search_query) | 
-                    Q(comments__author__username__icontains=search_query)
-                )
+            # Look the query up in the full-text index, best matches first.
+            ranked_ids = search_index.search(
+                search_query, search_fields,
+                topic=content_topic, content_type=content_type,
+            )
 
-            # Apply additional filters based on content topic and type.
-            if content_topic:
-                filters &= Q(topic=content_topic)
-            if content_type:
-                filters &= Q(content_type=content_type)
+            if ranked_ids is not None:
+                # Keep the ranking order when filtering by language.
+                if content_language:
+                    allowed = set(Content.objects.filter(
+                        pk__in=ranked_ids, language=content_language
+                    ).values_list('pk', flat=True))
+                    ranked_ids = [pk for pk in ranked_ids if pk in allowed]
+
+                # Matches before topic, type and language filters, for
+                # the facet counts.
+                def facet_base():
+                    return Content.objects.filter(pk__in=search_index.search(
+                        search_query, search_fields
+                    ) or [])
+            else:
+                # Fall back to plain filters if no index is available.
+                content_results = _filter_contents(
+                    search_query, search_fields, content_topic,
+                    content_type, content_language,
+                )
 
-            # Retrieve and order the search results.
-            content_results = (
-                Content.objects.filter(filters).distinct()
-                .order_by('-created_date')
+                def facet_base():
+                    return Content.objects.filter(pk__in=_filter_contents(
+                        search_query, search_fields, '', '', ''
+                    ).values('pk'))
+
+            # Count the matches per topic, content type and language.
+            facets = facet_counts(
+                facet_base,
+                {
+                    'topic': content_topic,
+                    'content_type': content_type,
+                    'language': content_language,
+                },
+                signature=(
+                    f'search:{search_query}:{",".join(sorted(search_fields))}'
+                ),
             )
 
     # Set up pagination for the search results, 10 items per page.
-    paginator = Paginator(content_results, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if ranked_ids is not None:
+        page_obj = paginate_ranked(
+            request, ranked_ids, Content.objects.for_listing(), 10
+        )
+    else:
+        page_obj = paginate(request, content_results, 10)
 
     # Prepare context data for rendering the search results.
     context = {
@@ -148,10 +207,67 @@ def search(request):
         'search_fields': request.GET.getlist('search_fields'),
         'content_topic': request.GET.get('content_topic', ''),
         'content_type': request.GET.get('content_type', ''),
+        'content_language': request.GET.get('content_language', ''),
+        'facets': facets,
     }
     return render(request, 'pages/search.html', context)
 
 
+def page_fragments(request):
+    """Returns the current user's navbar items for hole-punched pages."""
+    return fragment_response(
+        request, {'navbar_user': render_navbar_user(request)}
+    )
+
+
+def search_suggestions(request):
+    """Returns title, topic and author suggestions for a search prefix."""
+
+    # Answer from the in-memory prefix index, without a database query.
+    query = request.GET.get('q', '')[:100]
+    results = suggestions.suggest(query, limit=5)
+
+    # Let browsers reuse answers while the user edits the query.
+    response = JsonResponse({'query': query, 'suggestions': results})
+    response['Cache-Control'] = 'max-age=60'
+    return response
+
+
+def _filter_contents(search_query, search_fields, content_topic,
+                     content_type, content_language):
+    """Search contents with plain icontains filters, newest first."""
+
+    # Build the search filters using Q objects.
+    filters = Q()
+    if 'title' in search_fields:
+        filters |= Q(title__icontains=search_query)
+    if 'introduction' in search_fields:
+        filters |= Q(introduction__icontains=search_query)
+    if 'text' in search_fields:
+        filters |= Q(text__icontains=search_query)
+    if 'comment' in search_fields:
+        filters |= Q(comments__text__icontains=search_query)
+    if 'username' in search_fields:
+        filters |= (
+            Q(author__username__icontains=search_query) | 
+            Q(comments__author__username__icontains=search_query)
+        )
+
+    # Apply additional filters based on content topic and type.
+    if content_topic:
+        filters &= Q(topic=content_topic)
+    if content_type:
+        filters &= Q(content_type=content_type)
+    if content_language:
+        filters &= Q(language=content_language)
+
+    # Retrieve and order the search results.
+    return (
+        Content.objects.for_listing().filter(filters).distinct()
+        .order_by('-created_date')
+    )
+
+
 def contact_view(request):
     """Processes contact form and sends notification email to admins."""
 
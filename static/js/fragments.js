@@ -0,0 +1,54 @@
+/*
+ * Fills in the per-user parts of hole-punched pages.
+ *
+ * Placeholders are marked with data-fragment="<name>"; one of them also
+ * names the endpoint to load with data-fragment-src. Each endpoint is
+ * fetched once and answers with {"user": {...}, "fragments": {name: html}}.
+ * Elements marked data-show-for="authenticated", "anonymous" or
+ * "user:<id>" are shown only to the matching visitors.
+ */
+(function () {
+    'use strict';
+
+    function replaceFragment(name, html) {
+        const placeholders = document.querySelectorAll('[data-fragment="' + name + '"]');
+        if (!placeholders.length) {
+            return;
+        }
+        placeholders[0].insertAdjacentHTML('beforebegin', html);
+        placeholders.forEach(function (placeholder) {
+            placeholder.remove();
+        });
+    }
+
+    function applyVisibility(user) {
+        document.querySelectorAll('[data-show-for]').forEach(function (element) {
+            const audience = element.dataset.showFor;
+            let visible = audience === 'user:' + user.id;
+            if (audience === 'authenticated') {
+                visible = user.authenticated;
+            } else if (audience === 'anonymous') {
+                visible = !user.authenticated;
+            }
+            element.classList.toggle('d-none', !visible);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        const sources = new Set();
+        document.querySelectorAll('[data-fragment-src]').forEach(function (element) {
+            sources.add(element.dataset.fragmentSrc);
+        });
+
+        sources.forEach(function (source) {
+            fetch(source, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    Object.keys(data.fragments).forEach(function (name) {
+                        replaceFragment(name, data.fragments[name]);
+                    });
+                    applyVisibility(data.user);
+                });
+        });
+    });
+})();
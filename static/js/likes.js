@@ -0,0 +1,57 @@
+/*
+ * Toggles likes without reloading the page.
+ *
+ * Like forms are marked with data-like-form="<kind>-<id>" and the
+ * matching counts with data-like-count="<kind>-<id>". The form is posted
+ * with fetch and the endpoint answers with {"liked": ..., "like_count": ...};
+ * on any failure the form is submitted the usual way instead.
+ */
+(function () {
+    'use strict';
+
+    function updateButton(form, liked) {
+        const button = form.querySelector('button[type="submit"]');
+        button.classList.toggle('btn-danger', liked);
+        button.classList.toggle('btn-primary', !liked);
+        button.innerHTML = liked
+            ? '<i class="fas fa-thumbs-up"></i> Unlike'
+            : '<i class="far fa-thumbs-up"></i> Like';
+    }
+
+    // Delegated, since hole-punched pages insert the forms later
+    document.addEventListener('submit', function (event) {
+        const form = event.target.closest('[data-like-form]');
+        if (!form || form.dataset.likeFallback) {
+            return;
+        }
+        event.preventDefault();
+
+        const target = form.dataset.likeForm;
+        const button = form.querySelector('button[type="submit"]');
+        button.disabled = true;
+
+        fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            credentials: 'same-origin',
+            headers: {'Accept': 'application/json'},
+        })
+            .then(function (response) {
+                if (!response.ok || !response.headers.get('Content-Type').includes('json')) {
+                    throw new Error('Like request failed');
+                }
+                return response.json();
+            })
+            .then(function (data) {
+                updateButton(form, data.liked);
+                document.querySelectorAll('[data-like-count="' + target + '"]').forEach(function (count) {
+                    count.textContent = data.like_count;
+                });
+                button.disabled = false;
+            })
+            .catch(function () {
+                form.dataset.likeFallback = 'true';
+                form.submit();
+            });
+    });
+})();
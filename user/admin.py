@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
+from . import unread
 from .models import EmailVerification, Follow, Message, Notification, Profile 
 
 
@@ -73,23 +74,29 @@ class NotificationAdmin(admin.ModelAdmin):
 
     list_display = (
         'user', 'notification_type', 'content', 'comment',
-        'like', 'from_user', 'created_date', 'is_read',
+        'from_user', 'actor_count', 'updated_date', 'is_read',
     )
     list_display_links = ('user', 'notification_type',)
     list_filter = (
-        'notification_type', 'created_date', 'is_read', 'user', 'from_user',
+        'notification_type', 'updated_date', 'is_read', 'user', 'from_user',
     )
     search_fields = (
         'user__username', 'from_user__username', 'content__title',
         'comment__text', 'notification_type',
     )
-    ordering = ('-created_date',)
+    ordering = ('-updated_date',)
     list_per_page = 20
     actions = ['mark_as_read', 'delete_selected']
 
     def mark_as_read(self, request, queryset):
         """Mark selected notifications as read."""
+
+        user_ids = set(queryset.values_list('user_id', flat=True))
         queryset.update(is_read=True)
+
+        # Recount the unread notifications of the users concerned
+        for user_id in user_ids - {None}:
+            unread.refresh(user_id)
     
     mark_as_read.short_description = "Mark selected notifications as read"
 
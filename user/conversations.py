@@ -0,0 +1,220 @@
+"""
+Per-user conversation summaries.
+
+Each user has one Conversation row per correspondent, holding the last
+message, its date, and the number of messages and unread messages the
+user has not deleted. The rows are adjusted where messages are sent,
+read and deleted, so listing conversations reads the user's rows only;
+compute() and rebuild() recount them from the messages, for existing
+messages and repairs.
+"""
+
+from collections import namedtuple
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Max, Q, Value, When
+from django.db.models.functions import Greatest
+
+from . import mailbox, unread
+from .models import Conversation, Message
+
+Summary = namedtuple(
+    'Summary', ['last_message_id', 'message_count', 'unread_count']
+)
+
+
+def _add(user_id, correspondent_id, message, unread_count):
+    """Add a message to a conversation, creating it if needed."""
+
+    conversation = Conversation.objects.filter(
+        user_id=user_id, correspondent_id=correspondent_id
+    )
+    # Messages saved out of order keep the newest as the last one
+    newer = Q(last_date__lte=message.created_date)
+    changes = {
+        'last_message_id': Case(
+            When(newer, then=Value(message.pk)),
+            default=F('last_message_id'),
+            output_field=models.BigIntegerField(),
+        ),
+        'last_date': Case(
+            When(newer, then=Value(message.created_date)),
+            default=F('last_date'),
+            output_field=models.DateTimeField(),
+        ),
+        'message_count': F('message_count') + 1,
+        'unread_count': F('unread_count') + unread_count,
+    }
+
+    if conversation.update(**changes):
+        return
+
+    try:
+        with transaction.atomic():
+            Conversation.objects.create(
+                user_id=user_id,
+                correspondent_id=correspondent_id,
+                last_message=message,
+                last_date=message.created_date,
+                message_count=1,
+                unread_count=unread_count,
+            )
+    except IntegrityError:
+        # Created by a concurrent message meanwhile
+        conversation.update(**changes)
+
+
+def record(message):
+    """
+    Add a new message to the conversations of its sender and recipient.
+
+    Call it in the transaction that saved the message.
+    """
+
+    if message.sender_id is None or message.recipient_id is None:
+        return
+
+    if not message.is_deleted_by_recipient:
+        _add(
+            message.recipient_id,
+            message.sender_id,
+            message,
+            int(unread.counts_message(message)),
+        )
+
+    # A message to oneself is a single message of a single conversation
+    if (
+        message.sender_id != message.recipient_id
+        and not message.is_deleted_by_sender
+    ):
+        _add(message.sender_id, message.recipient_id, message, 0)
+
+
+def read(message):
+    """Stop counting a message the recipient has just read as unread."""
+
+    if message.sender_id is None or message.recipient_id is None:
+        return
+
+    Conversation.objects.filter(
+        user_id=message.recipient_id, correspondent_id=message.sender_id
+    ).update(unread_count=Greatest(F('unread_count') - 1, 0))
+
+
+def remove(message, user_id, was_unread):
+    """
+    Remove a message the user has just deleted from their conversation.
+
+    was_unread tells whether the message counted as unread for the user
+    before it was deleted. Call it in the transaction that deleted it.
+    """
+
+    if user_id == message.sender_id:
+        correspondent_id = message.recipient_id
+    else:
+        correspondent_id = message.sender_id
+
+    if correspondent_id is None:
+        return
+
+    conversation = Conversation.objects.select_for_update().filter(
+        user_id=user_id, correspondent_id=correspondent_id
+    ).first()
+    if conversation is None:
+        return
+
+    # Nothing left to show: the conversation goes away
+    if conversation.message_count <= 1:
+        conversation.delete()
+        return
+
+    conversation.message_count -= 1
+    if was_unread:
+        conversation.unread_count = max(conversation.unread_count - 1, 0)
+
+    # The last message is gone: the one before it takes its place
+    if conversation.last_message_id == message.pk:
+        last = mailbox.thread(user_id, correspondent_id).only(
+            'pk', 'created_date'
+        ).first()
+        if last is None:
+            conversation.delete()
+            return
+        conversation.last_message = last
+        conversation.last_date = last.created_date
+
+    conversation.save(update_fields=[
+        'last_message', 'last_date', 'message_count', 'unread_count'
+    ])
+
+
+def compute(user_ids):
+    """
+    Summarize the users' conversations from scratch.
+
+    Returns a Summary per (user id, correspondent id) pair.
+    """
+
+    received = Message.objects.filter(
+        recipient_id__in=user_ids,
+        sender__isnull=False,
+        is_deleted_by_recipient=False,
+    ).order_by().values_list('recipient_id', 'sender_id').annotate(
+        last=Max('pk'),
+        total=Count('pk'),
+        unread=Count('pk', filter=Q(is_read=False)),
+    )
+    # Messages to oneself are counted once, as received
+    sent = Message.objects.filter(
+        sender_id__in=user_ids,
+        recipient__isnull=False,
+        is_deleted_by_sender=False,
+    ).exclude(
+        recipient_id=F('sender_id')
+    ).order_by().values_list('sender_id', 'recipient_id').annotate(
+        last=Max('pk'), total=Count('pk')
+    )
+
+    summaries = {}
+    for user_id, correspondent_id, last, total, unread_count in received:
+        summaries[user_id, correspondent_id] = Summary(
+            last, total, unread_count
+        )
+    for user_id, correspondent_id, last, total in sent:
+        summary = summaries.get(
+            (user_id, correspondent_id), Summary(last, 0, 0)
+        )
+        summaries[user_id, correspondent_id] = Summary(
+            max(summary.last_message_id, last),
+            summary.message_count + total,
+            summary.unread_count,
+        )
+
+    return summaries
+
+
+def rebuild(user_ids):
+    """Replace the users' conversations with a fresh summary."""
+
+    with transaction.atomic():
+        summaries = compute(user_ids)
+        last_dates = dict(
+            Message.objects.filter(pk__in=[
+                summary.last_message_id for summary in summaries.values()
+            ]).values_list('pk', 'created_date')
+        )
+
+        Conversation.objects.filter(user_id__in=user_ids).delete()
+        Conversation.objects.bulk_create([
+            Conversation(
+                user_id=user_id,
+                correspondent_id=correspondent_id,
+                last_message_id=summary.last_message_id,
+                last_date=last_dates[summary.last_message_id],
+                message_count=summary.message_count,
+                unread_count=summary.unread_count,
+            )
+            for (user_id, correspondent_id), summary in summaries.items()
+        ])
+
+    return len(summaries)
@@ -221,6 +221,22 @@ class UserUpdateForm(forms.ModelForm):
 class MessageForm(forms.ModelForm):
     """Form for sending messages."""
 
+    # A username or user id, suggested by the recipient lookup as the
+    # user types, instead of a list of every user
+    recipient = forms.CharField(
+        label='Recipient',
+        max_length=150,
+        widget=forms.TextInput(attrs={
+            'placeholder': 'Username',
+            'autocomplete': 'off',
+            'list': 'recipient-suggestions',
+        }),
+        help_text=(
+            'Enter the username of the user who will receive the message. '
+            'If not found, they may be unregistered or have deactivated.'
+        ),
+    )
+
     class Meta:
         model = Message
         fields = ['recipient', 'subject', 'message',]
@@ -231,6 +247,42 @@ class MessageForm(forms.ModelForm):
             ),
         }
 
+    def clean_recipient(self):
+        """Return the active user with the given username or id."""
+
+        recipient = self.cleaned_data.get('recipient', '').strip()
+        users = User.objects.filter(is_active=True)
+
+        # A username that looks like an id still names its own user
+        user = users.filter(username=recipient).first()
+        if user is None and recipient.isdigit():
+            user = users.filter(pk=int(recipient)).first()
+        if user is None:
+            # Ignore case, unless several usernames differ only by case
+            matches = list(users.filter(
+                profile__username_lower=recipient.lower()
+            )[:2])
+            if len(matches) == 1:
+                user = matches[0]
+
+        if user is None:
+            raise ValidationError("There is no active user with this name.")
+
+        return user
+
+
+class MessageSearchForm(forms.Form):
+    """Form for searching the user's inbox and outbox."""
+
+    search_query = forms.CharField(
+        label='Search Messages',
+        max_length=255,
+        required=False,
+        widget=forms.TextInput(attrs={
+            'placeholder': 'Search subjects and messages...',
+        }),
+    )
+
 
 class ProfileForm(forms.ModelForm):
     """Form for updating user profile."""
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+
+from user.models import Notification
+from user.notifications import avatar_url, target_url
+
+
+class Command(BaseCommand):
+    """
+    Command to copy the display fields into notifications written
+    before they were stored with the notification.
+    """
+
+    help = ('Fills in the actor name and avatar and the target title and '
+            'URL of notifications that have none, in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of notifications updated per batch.',
+        )
+
+    def _describe(self, notification):
+        """Set the display fields of a notification from its relations."""
+
+        actor = notification.from_user
+        if actor is not None:
+            notification.actor_name = actor.username
+            profile = getattr(actor, 'profile', None)
+            notification.actor_avatar = avatar_url(
+                profile.image if profile else None
+            )
+
+        # Comment likes show and lead to the commented content
+        content = notification.content
+        if notification.comment is not None:
+            content = notification.comment.content
+        if content is not None:
+            notification.target_title = content.title
+
+        notification.target_url = target_url(
+            notification.notification_type,
+            notification.actor_name,
+            content.pk if content is not None else None,
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        pending = Notification.objects.filter(target_url='').select_related(
+            'from_user__profile', 'content', 'comment__content'
+        ).order_by('pk')
+        filled = 0
+        last_id = 0
+
+        while True:
+            batch = list(pending.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+
+            for notification in batch:
+                self._describe(notification)
+
+            Notification.objects.bulk_update(
+                batch,
+                ['actor_name', 'actor_avatar', 'target_title', 'target_url'],
+            )
+            filled += len(batch)
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(f'{filled} notifications filled in.')
+        )
@@ -0,0 +1,167 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+
+from user import mailbox, unread
+from user.models import Message
+
+# Plan fragments telling whether a query is answered from an index
+# alone and whether its rows are sorted after being read
+INDEX_ONLY = ('Index Only Scan', 'COVERING INDEX')
+SORTED = ('Sort', 'TEMP B-TREE')
+
+# Column holding the user of each box, the only one its count reads
+BOX_FIELDS = ('recipient_id', 'sender_id')
+
+
+class Command(BaseCommand):
+    """
+    Command to show the query plans and timings of the mailbox queries:
+    the first inbox and outbox pages, their page counts and the unread
+    count.
+
+    With --seed, random messages are added first, in a transaction that
+    is rolled back at the end, to see how the queries hold up as
+    mailboxes grow.
+    """
+
+    help = ('Prints the query plan and median time of the inbox, outbox '
+            'and unread count queries of a user, optionally after adding '
+            'random messages that are rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            default=None,
+            help='Username to query; the user with most messages if unset.',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Number of random messages added before measuring.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of times each query is timed.',
+        )
+
+    def _get_user(self, username):
+        """Return the named user, or the one with most inbox messages."""
+
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'User "{username}" does not exist.')
+
+        user = User.objects.annotate(
+            total=Count('received_messages')
+        ).order_by('-total', 'pk').first()
+        if user is None:
+            raise CommandError('There are no users to query.')
+        return user
+
+    def _seed(self, user, total):
+        """Add total random messages to and from user and other users."""
+
+        user_ids = list(
+            User.objects.order_by('?').values_list('pk', flat=True)[:100]
+        )
+        if user.pk not in user_ids:
+            user_ids.append(user.pk)
+
+        messages = []
+        for number in range(total):
+            sender_id = random.choice(user_ids)
+            recipient_id = random.choice(user_ids)
+            # Half of the messages go to the measured user
+            if number % 2:
+                recipient_id = user.pk
+            messages.append(Message(
+                sender_id=sender_id,
+                recipient_id=recipient_id,
+                subject=f'Benchmark {number}',
+                message='<p>Benchmark message.</p>',
+                is_read=random.random() < 0.8,
+                is_deleted_by_sender=random.random() < 0.1,
+                is_deleted_by_recipient=random.random() < 0.1,
+            ))
+        Message.objects.bulk_create(messages, batch_size=1000)
+
+        # Let the planner see the new table statistics
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Message._meta.db_table}')
+
+    def _measure(self, label, queryset, run, repeat):
+        """Print the plan of queryset and the median time of run()."""
+
+        plan = queryset.explain()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        flags = []
+        if any(fragment in plan for fragment in INDEX_ONLY):
+            flags.append('index-only')
+        if any(fragment in plan for fragment in SORTED):
+            flags.append('sorted')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{label}: {statistics.median(timings):.2f} ms '
+            f'[{", ".join(flags) or "index scan"}]'
+        ))
+        self.stdout.write(plan)
+
+    def handle(self, *args, **kwargs):
+        repeat = kwargs['repeat']
+
+        with transaction.atomic():
+            user = self._get_user(kwargs['user'])
+            if kwargs['seed']:
+                self._seed(user, kwargs['seed'])
+
+            for box_type, field in zip(mailbox.BOX_TYPES, BOX_FIELDS):
+                box = mailbox.get_box(user, box_type)
+                page = box[:10]
+                self._measure(
+                    f'{box_type} page', page, lambda: list(page.all()),
+                    repeat,
+                )
+                # The count the numbered paginator runs for every page
+                count = box.order_by()
+                self._measure(
+                    f'{box_type} count', count.values(field), count.count,
+                    repeat,
+                )
+
+            unread_count = unread.unread_messages([user.pk]).order_by()
+            self._measure(
+                'unread count',
+                unread_count.values('recipient_id'),
+                unread_count.count,
+                repeat,
+            )
+
+            total = Message.objects.count()
+
+            # Leave the database as it was
+            transaction.set_rollback(True)
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Mailbox queries of {user.username} measured '
+                f'({total} messages, {kwargs["seed"]} of them seeded and '
+                f'rolled back).'
+            )
+        )
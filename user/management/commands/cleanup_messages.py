@@ -1,31 +1,188 @@
+import os
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Min
 from django.utils import timezone
-from user.models import Message
+
+from pages.retention import DeadMessagesPolicy
+
 
 class Command(BaseCommand):
     """
-    Command to delete expired messages marked as deleted 
+    Command to delete expired messages marked as deleted
     by both sender and recipient.
+
+    Messages are deleted by primary key ranges, one short transaction
+    per range, with a pause after each range that deleted messages.
+    Each range starts at the lowest expired id left, so gaps in the ids
+    are skipped. The next id to process is saved to the checkpoint file
+    after every range, so an interrupted run continues from there.
+
+    Nothing is deleted while MESSAGE_RETENTION_DAYS is 0 (keep forever),
+    unless --days is given.
     """
 
-    help = ('Deletes messages marked as deleted by both '
-            'sender and recipient if older than 30 days.')
+    help = ('Deletes messages marked as deleted by both sender and '
+            'recipient if older than --days (MESSAGE_RETENTION_DAYS by '
+            'default), in throttled id-range chunks, and reports the '
+            'throughput.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Age in days after which messages are deleted.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of ids covered by each delete.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between chunks.',
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            default=0,
+            help='Stop once this many seconds are spent; 0 for no limit.',
+        )
+        parser.add_argument(
+            '--checkpoint-file',
+            default='',
+            help='File keeping the next id to process between runs.',
+        )
+        parser.add_argument(
+            '--start-id',
+            type=int,
+            default=None,
+            help='Id to start from, instead of the checkpoint.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the messages that would be deleted.',
+        )
+
+    def _read_checkpoint(self, path):
+        """Return the id saved in the checkpoint file, if any."""
+
+        if not path or not os.path.exists(path):
+            return None
+
+        with open(path) as checkpoint:
+            value = checkpoint.read().strip()
+        return int(value) if value.isdigit() else None
+
+    def _write_checkpoint(self, path, next_id):
+        """Save next_id to the checkpoint file, or remove it when done."""
+
+        if not path:
+            return
+
+        if next_id is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+
+        # Replaced at once, so an interruption never leaves half a file
+        with open(f'{path}.tmp', 'w') as checkpoint:
+            checkpoint.write(str(next_id))
+        os.replace(f'{path}.tmp', path)
 
     def handle(self, *args, **kwargs):
-        # Calculate the expiration date (30 days ago).
-        expire_date = timezone.now() - timezone.timedelta(days=30)
+        chunk_size = kwargs['chunk_size']
+        checkpoint_file = kwargs['checkpoint_file']
+        dry_run = kwargs['dry_run']
+        policy = DeadMessagesPolicy(days=kwargs['days'])
+        if kwargs['days'] is None and not policy.is_enabled():
+            self.stdout.write(
+                self.style.WARNING(
+                    'Message retention is disabled (MESSAGE_RETENTION_DAYS '
+                    'is 0); pass --days to delete expired messages anyway.'
+                )
+            )
+            return
+        expired_messages = policy.due(timezone.now())
+
+        # Resume after the ranges already processed
+        start_id = kwargs['start_id']
+        if start_id is None:
+            start_id = self._read_checkpoint(checkpoint_file)
 
-        # Filter messages meeting deletion criteria.
-        expired_messages = Message.objects.filter(
-            is_deleted_by_sender=True,
-            is_deleted_by_recipient=True,
-            created_date__lt=expire_date
+        started = time.monotonic()
+        deadline = (
+            started + kwargs['max_seconds'] if kwargs['max_seconds'] else None
         )
+        total = 0
+        # Lowest id not processed yet, None once every range is done
+        next_id = start_id or 0
 
-        # Delete the filtered messages.
-        expired_messages.delete()
+        try:
+            while True:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
 
-        # Log success message to the console.
+                # Skip to the lowest expired id left
+                next_id = expired_messages.filter(pk__gte=next_id).aggregate(
+                    first=Min('pk')
+                )['first']
+                if next_id is None:
+                    break
+
+                chunk = expired_messages.filter(
+                    pk__range=(next_id, next_id + chunk_size - 1)
+                )
+                deleted = 0
+                if dry_run:
+                    total += chunk.count()
+                else:
+                    pks = list(chunk.values_list('pk', flat=True))
+                    if pks:
+                        with transaction.atomic():
+                            deleted = policy.apply(pks)
+                        total += deleted
+                    self._write_checkpoint(
+                        checkpoint_file, next_id + chunk_size
+                    )
+                next_id += chunk_size
+
+                if kwargs['verbosity'] > 1:
+                    self.stdout.write(
+                        f'Ids below {next_id}: {total} messages so far.'
+                    )
+
+                # Let readers and writers through after each delete
+                if deleted and kwargs['sleep']:
+                    time.sleep(kwargs['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Interrupted.'))
+
+        if not dry_run:
+            self._write_checkpoint(checkpoint_file, next_id)
+
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        action = 'would be deleted' if dry_run else 'deleted'
+
+        # Log the result to the console.
         self.stdout.write(
-            self.style.SUCCESS('Expired messages have been deleted.')
-        )
\ No newline at end of file
+            self.style.SUCCESS(
+                f'{total} expired messages {action} in {elapsed:.1f}s '
+                f'({rate:.0f} rows/s).'
+            )
+        )
+        if next_id is not None:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Stopped at id {next_id}; run again to continue '
+                    f'(or pass --start-id {next_id}).'
+                )
+            )
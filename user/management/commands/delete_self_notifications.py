@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from user.models import Notification
+
+
+class Command(BaseCommand):
+    """
+    Command to delete the notifications of users about their own comments
+    and likes, written before these were dropped when notifications are
+    written. It only needs to run once.
+    """
+
+    help = ('Deletes the comment and like notifications users received '
+            'about their own actions.')
+
+    def handle(self, *args, **kwargs):
+        # Never counted as unread, so deleted without the delete signals
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                DELETE FROM {Notification._meta.db_table}
+                WHERE notification_type IN (%s, %s) AND from_user_id = user_id
+                """,
+                [
+                    Notification.NotificationType.COMMENT,
+                    Notification.NotificationType.LIKE,
+                ],
+            )
+            deleted = cursor.rowcount
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} self-notifications.')
+        )
@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from user import conversations
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the conversation summaries of every user from
+    their messages, for messages sent before conversations were kept
+    and to repair summaries that drifted.
+    """
+
+    help = ('Recomputes the conversations of all users from their '
+            'messages and reports how many were written.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of users rebuilt per batch.',
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        written = 0
+        last_id = 0
+
+        while True:
+            batch = list(user_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            written += conversations.rebuild(batch)
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {written} conversations.')
+        )
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from user import message_index
+from user.models import Message
+
+
+class Command(BaseCommand):
+    """
+    Command to rebuild the mailbox search index from scratch.
+    """
+
+    help = ('Drops and rebuilds the mailbox search index for all messages '
+            'in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of messages indexed per batch (default: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        backend = message_index.create_schema()
+        if backend is None:
+            raise CommandError(
+                'The database has no supported full-text search engine.'
+            )
+
+        batch_size = options['batch_size']
+
+        # Recreate the index table so that stale entries are dropped.
+        backend.drop_schema()
+        backend.ensure_schema()
+
+        # Messages deleted on both sides are in no mailbox.
+        messages = Message.objects.exclude(
+            is_deleted_by_sender=True, is_deleted_by_recipient=True
+        ).order_by('pk')
+
+        # Index messages in batches, one transaction per batch.
+        indexed = 0
+        batch = []
+        for message in messages.iterator(chunk_size=batch_size):
+            batch.append(message)
+            if len(batch) >= batch_size:
+                with transaction.atomic():
+                    message_index.index_messages(batch)
+                indexed += len(batch)
+                batch = []
+
+        if batch:
+            with transaction.atomic():
+                message_index.index_messages(batch)
+            indexed += len(batch)
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(f'Mailbox index rebuilt for {indexed} messages.')
+        )
@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from user import unread
+from user.models import UnreadCounts
+
+
+class Command(BaseCommand):
+    """
+    Command to recompute the denormalized unread message and
+    notification counts of every user.
+    """
+
+    help = ('Recomputes the unread message and notification counts of '
+            'all users and reports how many were wrong.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users recounted per batch.',
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        repaired = 0
+        last_id = 0
+
+        while True:
+            batch = list(user_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            # Compare the stored counts with a recount of the batch
+            stored = {
+                user_id: unread.Counts(messages, notifications)
+                for user_id, messages, notifications
+                in UnreadCounts.objects.filter(pk__in=batch).values_list(
+                    'pk', 'messages', 'notifications'
+                )
+            }
+            wrong = [
+                UnreadCounts(user_id=user_id, **counts._asdict())
+                for user_id, counts in unread.compute(batch).items()
+                if stored.get(user_id, unread.Counts(0, 0)) != counts
+            ]
+
+            UnreadCounts.objects.bulk_create(
+                wrong,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['messages', 'notifications'],
+            )
+            repaired += len(wrong)
+
+        # Log success message to the console.
+        self.stdout.write(
+            self.style.SUCCESS(f'Repaired the unread counts of {repaired} users.')
+        )
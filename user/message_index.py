@@ -0,0 +1,376 @@
+"""
+Full-text search index for the users' mailboxes.
+
+Each message has one index entry per user whose inbox or outbox holds
+it, with the analyzed terms of its subject and of its text stripped of
+HTML. Searches are restricted to one user's entries inside the index,
+so they only touch that user's mailbox. Entries are added when a
+message is sent and removed when the user deletes it, and can be
+rebuilt in bulk with the `rebuild_message_index` management command.
+
+The index table is created on migrate by create_schema(), never on the
+write path, and the backend is only used once the table exists.
+"""
+
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from pages.search_index.analyzers import get_analyzer, query_terms
+
+# Name of the table holding the inverted index.
+INDEX_TABLE = 'user_message_search_index'
+
+# Side of the message an entry belongs to.
+RECIPIENT = 0
+SENDER = 1
+
+# Messages have no language; queries are analyzed in every language,
+# so words indexed the English way are matched as well.
+ANALYZER = get_analyzer('en')
+
+
+class MessageSearchBackend:
+    """Base class for database specific mailbox index backends."""
+
+    def ensure_schema(self):
+        """Create the index table and its indexes if they are missing."""
+
+        with connection.cursor() as cursor:
+            for statement in self.schema_statements():
+                cursor.execute(statement)
+
+    def drop_schema(self):
+        """Drop the index table so that it can be rebuilt from scratch."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+    def schema_statements(self):
+        raise NotImplementedError
+
+    def upsert(self, entries):
+        """Insert or replace index entries, given as dicts."""
+        raise NotImplementedError
+
+    def delete(self, message_id, owner_id, side):
+        """Remove the entry of a message in a user's mailbox."""
+        raise NotImplementedError
+
+    def search(self, owner_id, term_groups, limit=500):
+        """Return ids of the user's matching messages, best ranked first."""
+        raise NotImplementedError
+
+
+class PostgresBackend(MessageSearchBackend):
+    """
+    Index stored as one tsvector per entry, with a GIN index.
+
+    The subject terms get the highest weight class and the text terms
+    the lowest, so ts_rank_cd ranks subject matches first. The owner is
+    the leading primary key column, so the planner combines the user's
+    entries with the GIN matches in one bitmap scan.
+    """
+
+    def schema_statements(self):
+        return [
+            f'CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ('
+            f'owner_id integer NOT NULL, '
+            f'message_id bigint NOT NULL '
+            f'REFERENCES user_message (id) ON DELETE CASCADE, '
+            f'created_date timestamp with time zone NOT NULL, '
+            f'document tsvector NOT NULL, '
+            f'PRIMARY KEY (owner_id, message_id))',
+            f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document_gin '
+            f'ON {INDEX_TABLE} USING gin (document)',
+            f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_message_id '
+            f'ON {INDEX_TABLE} (message_id)',
+        ]
+
+    def upsert(self, entries):
+        if not entries:
+            return
+
+        sql = (
+            f'INSERT INTO {INDEX_TABLE} '
+            f'(owner_id, message_id, created_date, document) '
+            f"VALUES (%s, %s, %s, setweight(to_tsvector('simple', %s), 'A')"
+            f" || setweight(to_tsvector('simple', %s), 'D')) "
+            f'ON CONFLICT (owner_id, message_id) DO UPDATE SET '
+            f'created_date = EXCLUDED.created_date, '
+            f'document = EXCLUDED.document'
+        )
+        rows = [
+            [
+                entry['owner_id'], entry['message_id'],
+                entry['created_date'], entry['subject'], entry['message'],
+            ]
+            for entry in entries
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def delete(self, message_id, owner_id, side):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {INDEX_TABLE} '
+                f'WHERE owner_id = %s AND message_id = %s',
+                [owner_id, message_id],
+            )
+
+    def search(self, owner_id, term_groups, limit=500):
+        # Terms are plain word characters, safe to use as tsquery lexemes
+        tsquery = ' & '.join(
+            '(' + ' | '.join(sorted(group)) + ')' for group in term_groups
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT message_id FROM {INDEX_TABLE}, '
+                f"to_tsquery('simple', %s) query "
+                f'WHERE owner_id = %s AND document @@ query '
+                f'ORDER BY ts_rank_cd(document, query, 32) DESC, '
+                f'created_date DESC LIMIT %s',
+                [tsquery, owner_id, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteBackend(MessageSearchBackend):
+    """
+    Index stored in an FTS5 virtual table.
+
+    The owner is indexed as a token of its own column, so a search
+    matches the user's token and the query terms together. Each entry's
+    rowid is derived from the message id and its side, so an entry is
+    removed without a search.
+    """
+
+    # Relative weight of each field when ranking matches
+    weights = {
+        'subject': 5.0,
+        'message': 1.0,
+    }
+
+    def schema_statements(self):
+        return [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+            f'subject, message, owner, created_date UNINDEXED, '
+            f"tokenize = 'unicode61 remove_diacritics 2')"
+        ]
+
+    def upsert(self, entries):
+        if not entries:
+            return
+
+        rows = [
+            [
+                entry['message_id'] * 2 + entry['side'], entry['subject'],
+                entry['message'], f'u{entry["owner_id"]}',
+                entry['created_date'].isoformat(),
+            ]
+            for entry in entries
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s',
+                [[row[0]] for row in rows],
+            )
+            cursor.executemany(
+                f'INSERT INTO {INDEX_TABLE} '
+                f'(rowid, subject, message, owner, created_date) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def delete(self, message_id, owner_id, side):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s',
+                [message_id * 2 + side],
+            )
+
+    def search(self, owner_id, term_groups, limit=500):
+        expression = ' AND '.join(
+            '(' + ' OR '.join(f'"{term}"' for term in sorted(group)) + ')'
+            for group in term_groups
+        )
+        match = (
+            f'owner : "u{owner_id}" AND '
+            f'{{subject message}} : ({expression})'
+        )
+        weights = f'{self.weights["subject"]}, {self.weights["message"]}, 0'
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid / 2 FROM {INDEX_TABLE} '
+                f'WHERE {INDEX_TABLE} MATCH %s '
+                f'ORDER BY bm25({INDEX_TABLE}, {weights}), created_date DESC '
+                f'LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+# Seconds before looking again for an index table that was missing,
+# e.g. in a worker started before migrate.
+MISSING_TABLE_RECHECK_INTERVAL = 60
+
+_backend = None
+_checked_at = 0
+
+
+def _vendor_backend():
+    """Return a backend for the default database's engine, or None."""
+
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteBackend()
+    return None
+
+
+def create_schema():
+    """
+    Create the index table if it is missing and return its backend.
+
+    Called on migrate and by `rebuild_message_index`, outside the
+    transactions writing to the index. Returns None when the database
+    has no supported full-text engine.
+    """
+
+    global _backend
+
+    backend = _vendor_backend()
+    if backend is not None:
+        try:
+            backend.ensure_schema()
+        except DatabaseError:
+            # E.g. SQLite compiled without FTS5
+            backend = None
+
+    # Look the table up again on next use
+    _backend = None
+    return backend
+
+
+def get_backend():
+    """
+    Return the mailbox index backend for the default database.
+
+    Returns None when the database has no supported full-text engine or
+    the index table has not been created, in which case callers fall
+    back to plain queries. A missing table is looked up again once
+    MISSING_TABLE_RECHECK_INTERVAL seconds have passed.
+    """
+
+    global _backend, _checked_at
+
+    if _backend is None or (
+        _backend is False
+        and time.monotonic() - _checked_at >= MISSING_TABLE_RECHECK_INTERVAL
+    ):
+        _checked_at = time.monotonic()
+        backend = _vendor_backend()
+        if (
+            backend is not None
+            and INDEX_TABLE in connection.introspection.table_names()
+        ):
+            _backend = backend
+        else:
+            _backend = False
+
+    return _backend or None
+
+
+def owners(message):
+    """Return (user id, side) for each mailbox holding the message."""
+
+    sides = []
+    if (
+        message.recipient_id is not None
+        and not message.is_deleted_by_recipient
+    ):
+        sides.append((message.recipient_id, RECIPIENT))
+
+    # A message to oneself has a single entry, as received
+    if (
+        message.sender_id is not None
+        and message.sender_id != message.recipient_id
+        and not message.is_deleted_by_sender
+    ):
+        sides.append((message.sender_id, SENDER))
+
+    return sides
+
+
+def build_entries(message):
+    """Build the index entries of a message, one per mailbox holding it."""
+
+    subject = ANALYZER.analyze(message.subject)
+    text = ANALYZER.analyze(message.message)
+
+    return [
+        {
+            'owner_id': owner_id,
+            'side': side,
+            'message_id': message.pk,
+            'created_date': message.created_date,
+            'subject': subject,
+            'message': text,
+        }
+        for owner_id, side in owners(message)
+    ]
+
+
+def index_messages(messages):
+    """Add or refresh the index entries of messages in one batch."""
+
+    backend = get_backend()
+    if backend is not None:
+        backend.upsert([
+            entry for message in messages for entry in build_entries(message)
+        ])
+
+
+def remove_message(message, user_id):
+    """Remove a message from the index of a user who deleted it."""
+
+    backend = get_backend()
+    if backend is None:
+        return
+
+    if user_id == message.recipient_id:
+        side = RECIPIENT
+    else:
+        side = SENDER
+    backend.delete(message.pk, user_id, side)
+
+
+def search(user_id, query):
+    """
+    Return the ids of the user's messages matching query, best ranked
+    first.
+
+    Returns None when no index is available for the database, so the
+    caller can fall back to a plain query.
+    """
+
+    backend = get_backend()
+    if backend is None:
+        return None
+
+    term_groups = query_terms(query)
+    if not term_groups:
+        return []
+
+    try:
+        # In a savepoint, so a failed query leaves the transaction usable
+        with transaction.atomic():
+            return backend.search(
+                user_id, term_groups,
+                limit=getattr(settings, 'MESSAGE_SEARCH_MAX_RESULTS', 500),
+            )
+    except DatabaseError:
+        return None
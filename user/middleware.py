@@ -1,12 +1,64 @@
-import random
-import string
-
 from django.contrib import messages
 from django.contrib.auth import logout
+from django.core.cache import cache
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.crypto import (
+    constant_time_compare,
+    get_random_string,
+    salted_hmac
+)
+from django.utils.functional import SimpleLazyObject
+
+from . import unread
+
+
+# Session key of the token remembering a verified email address.
+VERIFIED_SESSION_KEY = 'email_verified'
+
+# Cache key of the per-user salt signed into verified tokens.
+VERIFIED_SALT_CACHE_KEY = 'user:verified_salt:{}'
+
+
+def _verified_salt(user_id):
+    """Return the user's verified token salt, adding one if missing."""
 
-from .models import EmailVerification, Message, Notification
+    key = VERIFIED_SALT_CACHE_KEY.format(user_id)
+    salt = cache.get(key)
+    if salt is None:
+        # Another worker may add one at the same time; keep the first
+        cache.add(key, get_random_string(12), None)
+        salt = cache.get(key)
+
+    return salt
+
+
+def revoke_verified_tokens(user_id):
+    """Make the user's verified tokens stale in every session."""
+
+    cache.set(
+        VERIFIED_SALT_CACHE_KEY.format(user_id), get_random_string(12), None
+    )
+
+
+def verified_token(user):
+    """
+    Return the session token remembering that a user's email is verified.
+
+    The token is signed over the user's id and email address, which are
+    loaded with the user on every request, and a per-user salt kept in
+    the cache, so checking it costs no query. Changing the address,
+    which asks for a new verification, or saving the EmailVerification
+    unverified (see revoke_verified_tokens) makes it stale in every
+    session at once. A salt evicted from the cache only makes sessions
+    check the verification again. Every worker must see the same salts,
+    so production needs a shared cache backend (see CACHES).
+    """
+
+    return salted_hmac(
+        'user.middleware.verified_token',
+        f'{user.pk}:{user.email}:{_verified_salt(user.pk)}',
+    ).hexdigest()
 
 
 class VerificationRequiredMiddleware:
@@ -16,67 +68,69 @@ class VerificationRequiredMiddleware:
     If the authenticated user's email is not verified, log them out
     and redirect to the verification page, except when accessing
     the verification or logout pages.
+
+    A verified status is remembered in the session as a token bound to
+    the verified email address (see verified_token), so verified users
+    cost no query and the session is written once. Superusers are always
+    let through; their EmailVerification is ensured when they log in.
     """
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self._exempt_paths = None
+
+    def exempt_paths(self):
+        """Return the paths unverified users may still access."""
+
+        if self._exempt_paths is None:
+            self._exempt_paths = (
+                reverse('request_verification'), reverse('logout'),
+            )
+        return self._exempt_paths
+
+    def is_verified(self, request):
+        """Check the user's verification, remembering a positive answer."""
+
+        user = request.user
+        token = verified_token(user)
+        if constant_time_compare(
+            request.session.get(VERIFIED_SESSION_KEY, ''), token
+        ):
+            return True
+
+        email_verification = getattr(user, 'emailverification', None)
+        if email_verification is None or not email_verification.is_verified:
+            return False
+
+        request.session[VERIFIED_SESSION_KEY] = token
+        return True
 
     def __call__(self, request):
-        if request.user.is_authenticated:
-            # Skip the verification check for superusers
-            if request.user.is_superuser:
-                # Check if EmailVerification exists
-                email_verification, created = (
-                    EmailVerification.objects.get_or_create(
-                        user=request.user,
-                        defaults={'is_verified': True}
-                    )
-                )
-
-                # If exists, update verification code
-                if not created:
-                    # If a verification code doesn't exist, generate a new one
-                    if not email_verification.verification_code:
-                        code = self.generate_verification_code()
-                        email_verification.verification_code = code
-                        email_verification.save()
-
-                return self.get_response(request)
-            
-            # If not a superuser, check email verification
-            email_verification = getattr(
-                request.user, 'emailverification', None
+        if (
+            request.user.is_authenticated
+            and not request.user.is_superuser
+            and not self.is_verified(request)
+            and request.path not in self.exempt_paths()
+        ):
+            logout(request)
+            messages.warning(
+                request,
+                'You need to verify your email address. '
+                'Please verify your email address to access this page.'
             )
-            # Check if user has a verified email
-            if (
-                email_verification is None
-                or not email_verification.is_verified
-            ):
-                if request.path not in [
-                    reverse('request_verification'),
-                    reverse('logout')
-                ]:
-                    logout(request)
-                    messages.warning(
-                        request,
-                        'You need to verify your email address. '
-                        'Please verify your email address to access this page.'
-                    )
-                    return redirect(reverse('request_verification'))
+            return redirect(reverse('request_verification'))
 
         response = self.get_response(request)
         return response
-    
-    def generate_verification_code(self):
-        """Generate a random verification code."""
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
 class UnreadMessagesMiddleware:
     """
     Middleware to add the count of unread messages to the request.
 
     Adds `request.unread_count` with the count of unread messages for
-    authenticated users, otherwise sets it to zero.
+    authenticated users, otherwise sets it to zero. The count comes from
+    the user's UnreadCounts row or its copy in the session, and is only
+    looked up when used.
     """
 
     def __init__(self, get_response):
@@ -84,13 +138,10 @@ class UnreadMessagesMiddleware:
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            # Count unread messages for the logged-in user
-            unread_count = Message.objects.filter(
-                recipient=request.user,
-                is_read=False,
-                is_deleted_by_recipient=False
-            ).count()
-            request.unread_count = unread_count
+            # Read the denormalized count of unread messages
+            request.unread_count = SimpleLazyObject(
+                lambda: unread.get_counts(request).messages
+            )
         else:
             request.unread_count = 0
 
@@ -104,7 +155,8 @@ class UnreadNotificationsMiddleware:
     Adds `request.unread_notifications_count` with the count of unread
     notifications for authenticated users, excluding 'comment' or 'like'
     notifications from the user themselves. Sets count to zero if user
-    is not authenticated.
+    is not authenticated. The count shares the lookup of
+    UnreadMessagesMiddleware and is only looked up when used.
     """
 
     def __init__(self, get_response):
@@ -112,15 +164,10 @@ class UnreadNotificationsMiddleware:
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            # Count unread notifications, exclude self-generated comments/likes
-            unread_notifications_count = Notification.objects.filter(
-                user=request.user,
-                is_read=False
-            ).exclude(
-                notification_type__in=['comment', 'like'],
-                from_user=request.user
-            ).count()
-            request.unread_notifications_count = unread_notifications_count
+            # Read the denormalized count of unread notifications
+            request.unread_notifications_count = SimpleLazyObject(
+                lambda: unread.get_counts(request).notifications
+            )
         else:
             request.unread_notifications_count = 0
 
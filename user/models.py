@@ -11,7 +11,7 @@ from django.utils.translation import gettext_lazy as _
 from cloudinary.models import CloudinaryField
 from django_ckeditor_5.fields import CKEditor5Field
 
-from content.models import Comment, Content, Like
+from content.models import Comment, Content
 
 
 class Message(models.Model):
@@ -69,9 +69,29 @@ class Message(models.Model):
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         ordering = ['-created_date']
+        # Partial indexes matching the mailbox queries; sender and
+        # recipient lookups of all messages use the foreign key indexes
         indexes = [
-            models.Index(fields=['sender']),
-            models.Index(fields=['recipient']),
+            # Inbox pages, newest first, without deleted messages
+            models.Index(
+                fields=['recipient', '-created_date', '-id'],
+                condition=models.Q(is_deleted_by_recipient=False),
+                name='message_inbox_idx',
+            ),
+            # Outbox pages, newest first, without deleted messages
+            models.Index(
+                fields=['sender', '-created_date', '-id'],
+                condition=models.Q(is_deleted_by_sender=False),
+                name='message_outbox_idx',
+            ),
+            # Unread counts, holding only the unread inbox messages
+            models.Index(
+                fields=['recipient'],
+                condition=models.Q(
+                    is_read=False, is_deleted_by_recipient=False
+                ),
+                name='message_unread_idx',
+            ),
         ]
 
     def __str__(self):
@@ -95,6 +115,66 @@ class Message(models.Model):
         return f"{self.subject} (Deleted User to Deleted User)"
 
 
+class Conversation(models.Model):
+    """
+    Model for one user's side of their conversation with a correspondent.
+
+    Summarizes the messages between the two users that the user has not
+    deleted, kept up to date as messages are sent, read and deleted, so
+    the conversation list reads one row per correspondent instead of
+    grouping the whole mailbox. Conversations with a deleted user are
+    dropped; their messages stay in the inbox and outbox.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name='conversations',
+        on_delete=models.CASCADE,  # Delete conversations if user is deleted
+        verbose_name='User',
+    )
+    correspondent = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,  # Drop conversations with deleted users
+        verbose_name='Correspondent',
+    )
+    last_message = models.ForeignKey(
+        Message,
+        related_name='+',
+        on_delete=models.SET_NULL,  # Keep summary if message is deleted
+        null=True,
+        blank=True,
+        verbose_name='Last Message',
+    )
+    last_date = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Last Message Date',
+    )
+    message_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Messages',
+    )
+    unread_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Unread Messages',
+    )
+
+    class Meta:
+        ordering = ['-last_date', '-id']
+        indexes = [
+            models.Index(fields=['user', '-last_date', '-id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'correspondent'], name='unique_conversation',
+            ),
+        ]
+
+    def __str__(self):
+        """String of the conversation with both usernames."""
+        return f'{self.user.username} with {self.correspondent.username}'
+
+
 class Profile(models.Model):
     """Model for user profiles with additional information."""
 
@@ -104,6 +184,14 @@ class Profile(models.Model):
         verbose_name='User',
         help_text='The user this profile belongs to.',
     )
+    # Lowercase copy of the username, indexed for recipient lookups
+    username_lower = models.CharField(
+        max_length=150,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name='Lowercase Username',
+    )
     birth_date = models.DateField(
         null=True,
         blank=True,
@@ -185,7 +273,18 @@ class Follow(models.Model):
 
 
 class Notification(models.Model):
-    """Model for notifications sent to users."""
+    """
+    Model for notifications sent to users.
+
+    Events of the same type on the same target within a time bucket are
+    gathered in one unread notification: from_user is the latest actor,
+    recent_actors the ids of the last few and actor_count the approximate
+    number of distinct actors ("X and 312 others liked your content").
+
+    The actor's name and avatar and the target's title and URL are copied
+    in when the notification is written, so listing notifications reads
+    no other table.
+    """
 
     class NotificationType(models.TextChoices):
         COMMENT = 'comment', _('Comment')
@@ -221,14 +320,6 @@ class Notification(models.Model):
         blank=True,              # Allow this field to be blank in forms
         verbose_name='Comment',
     )
-    like = models.ForeignKey(
-        Like,
-        related_name='notifications',
-        on_delete=models.CASCADE,  # Remove notifications if like is deleted
-        null=True,                # Allow this field to be NULL in the database
-        blank=True,              # Allow this field to be blank in forms
-        verbose_name='Like',
-    )
     from_user = models.ForeignKey(
         User,
         related_name='sent_notifications',
@@ -237,43 +328,105 @@ class Notification(models.Model):
         blank=True,               # Allow this field to be blank in forms
         verbose_name='From User',
     )
+    target_key = models.CharField(
+        max_length=32,
+        blank=True,
+        default='',
+        verbose_name='Target Key',  # e.g. 'content:12'; empty for follows
+    )
+    bucket = models.PositiveIntegerField(
+        null=True,              # Not gathered (notifications before buckets)
+        blank=True,
+        verbose_name='Time Bucket',
+    )
+    actor_count = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Actor Count',
+    )
+    recent_actors = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='Recent Actors',  # User ids, latest first
+    )
+    actor_name = models.CharField(
+        max_length=150,
+        blank=True,
+        default='',
+        verbose_name='Actor Name',  # Username of from_user when written
+    )
+    actor_avatar = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name='Actor Avatar URL',  # Empty for the default picture
+    )
+    target_title = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Target Title',  # Title of the content concerned
+    )
+    target_url = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name='Target URL',  # Page the notification leads to
+    )
     created_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Created Date',
     )
+    updated_date = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Updated Date',  # Time of the latest event
+    )
     is_read = models.BooleanField(
         default=False,
         verbose_name='Is Read',
     )
 
     class Meta:
-        ordering = ['-created_date']
+        ordering = ['-updated_date', '-id']
         indexes = [
-            models.Index(fields=['user']),
+            models.Index(fields=['user', '-updated_date']),
             models.Index(fields=['notification_type']),
             models.Index(fields=['content']),
             models.Index(fields=['comment']),
-            models.Index(fields=['like']),
             models.Index(fields=['from_user']),
         ]
+        constraints = [
+            # Events are gathered into the unread notification of their
+            # bucket; once read, new events start a new one
+            models.UniqueConstraint(
+                fields=['user', 'notification_type', 'target_key', 'bucket'],
+                condition=models.Q(is_read=False),
+                name='unique_unread_notification_bucket',
+            ),
+        ]
 
     def __str__(self):
         """String representation of notification."""
         
-        username = (
-            self.from_user.username if self.from_user else "Deleted User"
-        )
+        username = self.actor_name or 'Deleted User'
+        if self.other_actor_count:
+            username = f'{username} and {self.other_actor_count} others'
 
         if self.notification_type == Notification.NotificationType.COMMENT:
-            return f'Comment by {username} on {self.content.title}'
+            return f'Comment by {username} on {self.target_title}'
         elif self.notification_type == Notification.NotificationType.LIKE:
-            target = self.content if self.content else self.comment
-            return f'{username} liked your {target}'
+            if self.comment_id:
+                return f'{username} liked your comment on {self.target_title}'
+            return f'{username} liked your {self.target_title}'
         elif self.notification_type == Notification.NotificationType.FOLLOW:
             return f'{username} followed you'
         else:
             return 'Unknown Notification'
 
+    @property
+    def other_actor_count(self):
+        """Number of actors besides from_user."""
+        return max(self.actor_count - 1, 0)
+
 
 class EmailVerification(models.Model):
     """Model for managing email verification for users."""
@@ -323,3 +476,38 @@ class EmailVerification(models.Model):
             [self.user.email],           # Recipient's email address.
             fail_silently=False,        # Raise an error if sending fails.
         )
+
+
+class UnreadCounts(models.Model):
+    """
+    Model for the unread message and notification counts of a user.
+
+    Kept up to date by the code that creates or reads messages and
+    notifications, so the navbar badges need no COUNT queries.
+    """
+
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='unread_counts',
+        on_delete=models.CASCADE,  # Delete counts if user is deleted
+        verbose_name='User',
+    )
+    messages = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Unread Messages',
+    )
+    notifications = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Unread Notifications',
+    )
+
+    class Meta:
+        verbose_name_plural = 'Unread counts'
+
+    def __str__(self):
+        """String of the counts with the user's username."""
+        return (
+            f'{self.user.username}: {self.messages} messages, '
+            f'{self.notifications} notifications'
+        )
@@ -0,0 +1,491 @@
+"""
+Coalesced notifications, written in batches after commit.
+
+Instead of one row per comment, like or follow, events of the same type
+on the same target within NOTIFICATION_BUCKET_SECONDS are gathered in
+one unread notification per recipient. The row keeps its latest actor,
+the ids of the last NOTIFICATION_RECENT_ACTORS actors and the number of
+distinct actors, so the table grows with distinct events rather than
+raw actions. Once the notification is read, new events start a new one.
+
+Actors are only told apart within the recent actors, so the number is
+approximate: an actor who left the list and acts again is counted
+again. A retracted event takes one actor off the number, never below
+the actors listed.
+
+notify() only records an event: the events of a transaction are written
+once it commits, so the request's transaction holds no notification
+locks and rolled back events are never sent. Events of the same
+notification are merged, then every row is upserted with a single
+multi-row INSERT ... ON CONFLICT DO UPDATE on PostgreSQL and SQLite;
+other databases lock each unread row and use the ORM. Events of users on
+their own contents and comments are dropped here, so reads need no
+filtering.
+
+The batch also copies the display fields of each notification, the
+latest actor's name and avatar and the target's title and URL, with one
+query per related table, so listing notifications reads only their
+table.
+"""
+
+import json
+import threading
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from content.models import Comment, Content
+from . import unread
+from .models import Notification
+
+Event = namedtuple(
+    'Event',
+    ['recipient_id', 'notification_type', 'actor_id', 'content_id',
+     'comment_id'],
+)
+
+# Vendor SQL of the actor list of a new row, the number of its actors
+# the existing row already lists, and the merged list, latest first.
+ACTORS_SQL = {
+    'postgresql': {
+        'new': '%s::jsonb',
+        'seen': """(
+            SELECT COUNT(*)
+            FROM jsonb_array_elements(EXCLUDED.recent_actors) AS added(actor)
+            WHERE {table}.recent_actors @> jsonb_build_array(actor)
+        )""",
+        'merged': """(
+            SELECT jsonb_agg(actor ORDER BY position) FROM (
+                SELECT actor, position
+                FROM jsonb_array_elements(EXCLUDED.recent_actors)
+                    WITH ORDINALITY AS added(actor, position)
+                UNION ALL
+                SELECT actor,
+                    position + jsonb_array_length(EXCLUDED.recent_actors)
+                FROM jsonb_array_elements({table}.recent_actors)
+                    WITH ORDINALITY AS listed(actor, position)
+                WHERE NOT EXCLUDED.recent_actors @> jsonb_build_array(actor)
+                ORDER BY position LIMIT {keep}
+            ) AS actors
+        )""",
+    },
+    'sqlite': {
+        'new': 'json(%s)',
+        'seen': """(
+            SELECT COUNT(*) FROM json_each(EXCLUDED.recent_actors) AS added
+            WHERE added.value IN (
+                SELECT value FROM json_each({table}.recent_actors)
+            )
+        )""",
+        'merged': """(
+            SELECT json_group_array(actor) FROM (
+                SELECT value AS actor, key AS position
+                FROM json_each(EXCLUDED.recent_actors)
+                UNION ALL
+                SELECT value, key + json_array_length(EXCLUDED.recent_actors)
+                FROM json_each({table}.recent_actors)
+                WHERE value NOT IN (
+                    SELECT value FROM json_each(EXCLUDED.recent_actors)
+                )
+                ORDER BY position LIMIT {keep}
+            )
+        )""",
+    },
+}
+
+# Batch of events of the thread's current transaction.
+_pending = threading.local()
+
+
+def target_key(content_id=None, comment_id=None):
+    """Return the key of the notified content or comment, if any."""
+
+    if comment_id is not None:
+        return f'comment:{comment_id}'
+    if content_id is not None:
+        return f'content:{content_id}'
+    return ''
+
+
+def current_bucket(now):
+    """Return the index of the time bucket now falls in."""
+
+    seconds = getattr(settings, 'NOTIFICATION_BUCKET_SECONDS', 86400)
+    return int(now.timestamp()) // max(seconds, 1)
+
+
+def _recent_actor_limit():
+    return max(getattr(settings, 'NOTIFICATION_RECENT_ACTORS', 3), 1)
+
+
+def avatar_url(image):
+    """Return the URL of a profile image, or '' for the default picture."""
+    return image.url if image else ''
+
+
+def target_url(notification_type, actor_name, content_id):
+    """Return the URL of the page a notification leads to."""
+
+    if notification_type == Notification.NotificationType.FOLLOW:
+        return reverse('profile_view', args=[actor_name]) if actor_name else ''
+
+    return reverse('content_detail', args=[content_id]) if content_id else ''
+
+
+def _merge(events):
+    """
+    Group events by notification, dropping self-notifications.
+
+    Returns {(recipient_id, type, target_key): row} where row holds the
+    target ids and the distinct actors, latest first.
+    """
+
+    rows = {}
+    for event in events:
+        if event.recipient_id is None or event.actor_id is None:
+            continue
+        if event.recipient_id == event.actor_id:
+            continue
+
+        key = (
+            event.recipient_id,
+            event.notification_type,
+            target_key(event.content_id, event.comment_id),
+        )
+        row = rows.setdefault(key, {
+            'content_id': event.content_id,
+            'comment_id': event.comment_id,
+            'actors': [],
+        })
+        if event.actor_id in row['actors']:
+            row['actors'].remove(event.actor_id)
+        row['actors'].insert(0, event.actor_id)
+
+    return rows
+
+
+def _describe(rows):
+    """
+    Add the display fields to the merged rows, dropping those whose
+    latest actor or target was deleted in the meantime.
+    """
+
+    actors = {
+        pk: (username, avatar_url(image))
+        for pk, username, image in User.objects.filter(
+            pk__in={row['actors'][0] for row in rows.values()}
+        ).values_list('pk', 'username', 'profile__image')
+    }
+
+    content_ids = {
+        row['content_id'] for row in rows.values()
+        if row['content_id'] is not None
+    }
+    contents = dict(
+        Content.objects.filter(pk__in=content_ids).values_list('pk', 'title')
+    ) if content_ids else {}
+
+    comment_ids = {
+        row['comment_id'] for row in rows.values()
+        if row['comment_id'] is not None
+    }
+    comments = {
+        pk: (content_id, title)
+        for pk, content_id, title in Comment.objects.filter(
+            pk__in=comment_ids
+        ).values_list('pk', 'content_id', 'content__title')
+    } if comment_ids else {}
+
+    described = {}
+    for key, row in rows.items():
+        if row['actors'][0] not in actors:
+            continue
+        row['actor_name'], row['actor_avatar'] = actors[row['actors'][0]]
+
+        # Comment likes show and lead to the commented content
+        if row['comment_id'] is not None:
+            if row['comment_id'] not in comments:
+                continue
+            content_id, row['target_title'] = comments[row['comment_id']]
+        elif row['content_id'] is not None:
+            if row['content_id'] not in contents:
+                continue
+            content_id = row['content_id']
+            row['target_title'] = contents[content_id]
+        else:
+            content_id = None
+            row['target_title'] = ''
+
+        row['target_url'] = target_url(key[1], row['actor_name'], content_id)
+        described[key] = row
+
+    return described
+
+
+def _upsert_sql(sql, rows, now, bucket):
+    """Upsert the rows in one statement, returning the recipients added."""
+
+    table = Notification._meta.db_table
+    keep = _recent_actor_limit()
+    sql = {
+        name: part.format(table=table, keep=keep)
+        for name, part in sql.items()
+    }
+    created = connection.ops.adapt_datetimefield_value(now)
+
+    values = []
+    params = []
+    for (recipient_id, notification_type, key), row in rows.items():
+        values.append(
+            f"(%s, %s, %s, %s, %s, %s, %s, %s, {sql['new']}, "
+            f"%s, %s, %s, %s, %s, %s, FALSE)"
+        )
+        params += [
+            recipient_id, notification_type, row['content_id'],
+            row['comment_id'], row['actors'][0], key, bucket,
+            len(row['actors']), json.dumps(row['actors'][:keep]),
+            row['actor_name'], row['actor_avatar'], row['target_title'],
+            row['target_url'], created, created,
+        ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (
+                user_id, notification_type, content_id, comment_id,
+                from_user_id, target_key, bucket, actor_count,
+                recent_actors, actor_name, actor_avatar, target_title,
+                target_url, created_date, updated_date, is_read
+            )
+            VALUES {', '.join(values)}
+            ON CONFLICT (user_id, notification_type, target_key, bucket)
+                WHERE NOT is_read
+            DO UPDATE SET
+                actor_count = {table}.actor_count
+                    + EXCLUDED.actor_count - {sql['seen']},
+                recent_actors = {sql['merged']},
+                from_user_id = EXCLUDED.from_user_id,
+                actor_name = EXCLUDED.actor_name,
+                actor_avatar = EXCLUDED.actor_avatar,
+                target_title = EXCLUDED.target_title,
+                target_url = EXCLUDED.target_url,
+                updated_date = EXCLUDED.updated_date
+            RETURNING user_id, created_date = updated_date
+            """,
+            params,
+        )
+        return [user_id for user_id, added in cursor.fetchall() if added]
+
+
+def _upsert_orm(rows, now, bucket):
+    """Upsert the rows with the ORM, returning the recipients added."""
+
+    keep = _recent_actor_limit()
+    display = ['actor_name', 'actor_avatar', 'target_title', 'target_url']
+    added = []
+
+    for (recipient_id, notification_type, key), row in rows.items():
+        unique = {
+            'user_id': recipient_id,
+            'notification_type': notification_type,
+            'target_key': key,
+            'bucket': bucket,
+            'is_read': False,
+        }
+
+        for attempt in range(2):
+            notification = Notification.objects.select_for_update().filter(
+                **unique
+            ).first()
+
+            if notification is not None:
+                recent = notification.recent_actors
+                notification.actor_count += len(
+                    [actor for actor in row['actors'] if actor not in recent]
+                )
+                notification.recent_actors = (row['actors'] + [
+                    actor for actor in recent if actor not in row['actors']
+                ])[:keep]
+                notification.from_user_id = row['actors'][0]
+                for field in display:
+                    setattr(notification, field, row[field])
+                notification.updated_date = now
+                notification.save(update_fields=[
+                    'actor_count', 'recent_actors', 'from_user',
+                    'updated_date', *display,
+                ])
+                break
+
+            try:
+                # bulk_create sends no post_save, the caller counts the row
+                with transaction.atomic():
+                    Notification.objects.bulk_create([Notification(
+                        **unique,
+                        content_id=row['content_id'],
+                        comment_id=row['comment_id'],
+                        from_user_id=row['actors'][0],
+                        actor_count=len(row['actors']),
+                        recent_actors=row['actors'][:keep],
+                        updated_date=now,
+                        **{field: row[field] for field in display},
+                    )])
+                added.append(recipient_id)
+                break
+            except IntegrityError:
+                # Added concurrently: gather the events into it instead
+                if attempt:
+                    raise
+
+    return added
+
+
+def write(events):
+    """Write events at once, merged per notification."""
+
+    rows = _merge(events)
+    if rows:
+        rows = _describe(rows)
+    if not rows:
+        return
+
+    now = timezone.now()
+    bucket = current_bucket(now)
+
+    with transaction.atomic():
+        sql = ACTORS_SQL.get(connection.vendor)
+        if sql:
+            added = _upsert_sql(sql, rows, now, bucket)
+        else:
+            added = _upsert_orm(rows, now, bucket)
+
+        # New rows are unread; gathered events leave the counts as they are
+        for recipient_id, count in Counter(added).items():
+            unread.add(recipient_id, notifications=count)
+
+
+class _Batch:
+    """on_commit callback writing the events of a transaction at once."""
+
+    def __init__(self, savepoint_ids):
+        self.savepoint_ids = savepoint_ids
+        self.events = []
+        self.written = False
+
+    def __call__(self):
+        self.written = True
+        write(self.events)
+
+
+def _current_batch():
+    """
+    Return the batch of the current transaction, registering a new one
+    when there is none yet.
+
+    A batch belongs to a savepoint level, so that rolling back a savepoint
+    drops the events recorded in it along with its callback.
+    """
+
+    batch = getattr(_pending, 'batch', None)
+    if (
+        batch is None
+        or batch.written
+        or batch.savepoint_ids != connection.savepoint_ids
+        # Dropped by a rollback
+        or not any(
+            callback is batch
+            for _, callback, _ in connection.run_on_commit
+        )
+    ):
+        batch = _Batch(list(connection.savepoint_ids))
+        transaction.on_commit(batch)
+        _pending.batch = batch
+
+    return batch
+
+
+def notify(recipient_id, notification_type, actor_id,
+           content_id=None, comment_id=None):
+    """
+    Add actor_id's event to recipient_id's notification of the target
+    once the current transaction commits.
+    """
+
+    event = Event(
+        recipient_id, notification_type, actor_id, content_id, comment_id,
+    )
+
+    if not connection.in_atomic_block:
+        write([event])
+    else:
+        _current_batch().events.append(event)
+
+
+def retract(recipient_id, notification_type, actor_id,
+            content_id=None, comment_id=None):
+    """
+    Take actor_id's event back from recipient_id's notifications of the
+    target, e.g. after an unlike.
+
+    Only unread notifications can forget the actor; older ones stay as
+    they are. An actor not among the recent actors is assumed to be one
+    of those counted beyond them, if any.
+    """
+
+    target = (
+        {'comment_id': comment_id} if comment_id is not None
+        else {'content_id': content_id}
+    )
+
+    with transaction.atomic(savepoint=False):
+        notifications = Notification.objects.select_for_update().filter(
+            Q(bucket__isnull=True, from_user_id=actor_id)
+            | Q(bucket__isnull=False, is_read=False),
+            user_id=recipient_id,
+            notification_type=notification_type,
+            **target,
+        )
+
+        for notification in notifications:
+            # Notifications from before buckets hold a single event
+            if notification.bucket is None:
+                notification.delete()
+                continue
+
+            if actor_id in notification.recent_actors:
+                notification.recent_actors.remove(actor_id)
+            elif notification.actor_count <= len(notification.recent_actors):
+                # Every actor counted is listed, and the actor is not
+                continue
+
+            notification.actor_count = max(
+                notification.actor_count - 1, len(notification.recent_actors)
+            )
+            if not notification.recent_actors:
+                notification.delete()
+                continue
+
+            update_fields = ['actor_count', 'recent_actors']
+
+            # The previous actor becomes the latest one
+            if (
+                notification.from_user_id == actor_id
+                and notification.recent_actors
+            ):
+                latest = notification.recent_actors[0]
+                actor = User.objects.filter(pk=latest).values_list(
+                    'username', 'profile__image'
+                ).first()
+                if actor is not None:
+                    notification.from_user_id = latest
+                    notification.actor_name = actor[0]
+                    notification.actor_avatar = avatar_url(actor[1])
+                    update_fields += [
+                        'from_user', 'actor_name', 'actor_avatar',
+                    ]
+
+            notification.save(update_fields=update_fields)
@@ -1,5 +1,5 @@
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import connection, transaction
 
 from .models import Follow
 
@@ -72,3 +72,44 @@ def is_following(following_user, potential_followed_user):
         following_user=following_user,
         followed_user=potential_followed_user
     ).exists()
+
+
+def search_users(user, query, limit):
+    """
+    Find active users whose username starts with query, ignoring case.
+
+    Args:
+        user (User): The user searching, whose followed users come first.
+        query (str): The start of the username.
+        limit (int): The maximum number of users returned.
+
+    Returns:
+        list: Matching users, followed users first, each group ordered by
+              username.
+    """
+
+    prefix = query.strip().lower()
+    if not prefix or limit <= 0:
+        return []
+
+    lookup = {'profile__username_lower__startswith': prefix}
+    if connection.vendor == 'sqlite' and ord(prefix[-1]) < 0x10FFFF:
+        # SQLite's LIKE ignores case, so it cannot use the index; the
+        # range of usernames sharing the prefix can
+        lookup['profile__username_lower__gte'] = prefix
+        lookup['profile__username_lower__lt'] = (
+            prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        )
+
+    users = User.objects.filter(is_active=True, **lookup).order_by(
+        'profile__username_lower'
+    ).only('username')
+
+    following = list(
+        users.filter(pk__in=get_following(user).values('pk'))[:limit]
+    )
+    if len(following) == limit:
+        return following
+
+    others = users.exclude(pk__in=[followed.pk for followed in following])
+    return following + list(others[:limit - len(following)])
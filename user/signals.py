@@ -1,18 +1,54 @@
+import random
+import string
+
 import cloudinary
 
 from django.contrib.auth.models import User
-from django.db.models.signals import post_delete, post_save, pre_save
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import (
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_save
+)
 from django.dispatch import receiver
 
-from user.models import Follow, Message, Notification, Profile
+from user import conversations, message_index, notifications, unread
+from user.middleware import VERIFIED_SESSION_KEY, revoke_verified_tokens
+from user.models import (
+    EmailVerification,
+    Follow,
+    Message,
+    Notification,
+    Profile,
+    UnreadCounts
+)
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
-    """Create a Profile for each new User."""
+    """Create a Profile and unread counts for each new User."""
 
     if created:
-        Profile.objects.create(user=instance)
+        Profile.objects.create(
+            user=instance, username_lower=instance.username.lower()
+        )
+        UnreadCounts.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def update_username_lower(sender, instance, created, update_fields,
+                          **kwargs):
+    """Copy a changed username to the Profile's lowercase username."""
+
+    # Saves of other fields, such as last_login, leave the username
+    if created or (update_fields and 'username' not in update_fields):
+        return
+
+    username_lower = instance.username.lower()
+    Profile.objects.filter(user=instance).exclude(
+        username_lower=username_lower
+    ).update(username_lower=username_lower)
 
 
 @receiver(pre_save, sender=Profile)
@@ -72,15 +108,14 @@ def delete_profile_image_on_profile_delete(sender, instance, **kwargs):
 
 @receiver(post_save, sender=Follow)
 def create_notification_on_follow(sender, instance, created, **kwargs):
-    """Create a Notification when a Follow is created."""
-
-    # Only create notification for a new follow action
-    # if the followed user exists
-    if created and instance.followed_user:
-        Notification.objects.create(
-            user=instance.followed_user,
-            notification_type=Notification.NotificationType.FOLLOW,
-            from_user=instance.following_user
+    """Notify the followed user of a new Follow."""
+
+    # Only notify of a new follow action, gathered with other followers
+    if created:
+        notifications.notify(
+            instance.followed_user_id,
+            Notification.NotificationType.FOLLOW,
+            instance.following_user_id,
         )
 
 
@@ -91,3 +126,119 @@ def update_user_related_models_on_user_delete(sender, instance, **kwargs):
     Message.objects.filter(sender=instance).update(sender=None)
     Message.objects.filter(recipient=instance).update(recipient=None)
     Notification.objects.filter(from_user=instance).update(from_user=None)
+
+
+@receiver(post_save, sender=Message)
+def count_unread_message(sender, instance, created, **kwargs):
+    """Count a new Message as unread for its recipient."""
+
+    if created and unread.counts_message(instance):
+        unread.add(instance.recipient_id, messages=1)
+
+
+@receiver(post_save, sender=Message)
+def add_message_to_conversations(sender, instance, created, **kwargs):
+    """Add a new Message to the conversations of its two users."""
+
+    if created:
+        conversations.record(instance)
+
+
+@receiver(post_save, sender=Message)
+def index_new_message(sender, instance, created, **kwargs):
+    """Add a new Message to the mailbox search index of its users."""
+
+    if created:
+        message_index.index_messages([instance])
+
+
+@receiver(post_save, sender=Notification)
+def count_unread_notification(sender, instance, created, **kwargs):
+    """Count a new Notification as unread for its user."""
+
+    if created and unread.counts_notification(instance):
+        unread.add(instance.user_id, notifications=1)
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    """Stop counting an unread Notification once it is deleted."""
+
+    if unread.counts_notification(instance):
+        unread.add(instance.user_id, notifications=-1)
+
+
+@receiver(user_logged_in)
+def forget_remembered_verification(sender, request, user, **kwargs):
+    """Make a new login re-check the user's email verification."""
+    request.session.pop(VERIFIED_SESSION_KEY, None)
+
+
+@receiver(post_save, sender=EmailVerification)
+@receiver(post_delete, sender=EmailVerification)
+def revoke_remembered_verification(sender, instance, signal, **kwargs):
+    """
+    Make sessions re-check a verification that was deleted or saved
+    unverified.
+    """
+
+    if signal is post_delete or not instance.is_verified:
+        revoke_verified_tokens(instance.user_id)
+
+
+@receiver(user_logged_in)
+def ensure_superuser_verification(sender, request, user, **kwargs):
+    """Give a superuser logging in a verified EmailVerification."""
+
+    if not user.is_superuser:
+        return
+
+    email_verification, created = EmailVerification.objects.get_or_create(
+        user=user, defaults={'is_verified': True}
+    )
+
+    # Generate a verification code if the record has none
+    if not created and not email_verification.verification_code:
+        email_verification.verification_code = ''.join(
+            random.choices(string.ascii_uppercase + string.digits, k=6)
+        )
+        email_verification.save()
+
+
+@receiver(post_migrate)
+def fill_username_lower(sender, using, **kwargs):
+    """
+    Fill in the lowercase username of profiles created before it was
+    stored with the profile.
+    """
+
+    if sender.label != 'user':
+        return
+
+    profiles = Profile.objects.using(using).filter(
+        username_lower=''
+    ).select_related('user').only('user__username').order_by('pk')
+    last_id = 0
+
+    while True:
+        batch = list(profiles.filter(pk__gt=last_id)[:1000])
+        if not batch:
+            break
+        last_id = batch[-1].pk
+
+        for profile in batch:
+            profile.username_lower = profile.user.username.lower()
+        Profile.objects.using(using).bulk_update(batch, ['username_lower'])
+
+
+@receiver(post_migrate)
+def create_message_index(sender, using, **kwargs):
+    """
+    Create the mailbox search index table on migrate, outside the
+    transactions that write to it.
+    """
+
+    if sender.label != 'user':
+        return
+
+    message_index.create_schema()
@@ -1 +1,335 @@
-from django.test import TestCase
+import datetime
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from content.likes import toggle_like
+from content.models import Comment, Content, ContentLike
+from .middleware import VERIFIED_SESSION_KEY
+from .models import (
+    EmailVerification,
+    Follow,
+    Message,
+    Notification,
+    UnreadCounts
+)
+
+
+def create_content(author, title='Title'):
+    return Content.objects.create(
+        title=title,
+        introduction='Introduction',
+        text='Text',
+        topic='history',
+        content_type='academic_article',
+        author=author,
+    )
+
+
+class VerificationRequiredTests(TestCase):
+    """Verified users are remembered in the session until revoked."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.verification = EmailVerification.objects.create(
+            user=self.user, is_verified=True
+        )
+        self.client.force_login(self.user)
+        self.url = reverse('about')
+
+    def test_remembered(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertIn(VERIFIED_SESSION_KEY, self.client.session)
+
+        # Looked up no more once remembered
+        with self.assertNumQueries(3):  # Session, user and unread counts
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_saved_unverified(self):
+        self.client.get(self.url)
+
+        self.verification.is_verified = False
+        self.verification.save()
+
+        response = self.client.get(self.url)
+        self.assertRedirects(
+            response, reverse('request_verification'),
+            fetch_redirect_response=False,
+        )
+
+    def test_deleted(self):
+        self.client.get(self.url)
+
+        self.verification.delete()
+
+        response = self.client.get(self.url)
+        self.assertRedirects(
+            response, reverse('request_verification'),
+            fetch_redirect_response=False,
+        )
+
+
+class NotificationTests(TestCase):
+    """Events on the same target are gathered in one notification."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.readers = [
+            User.objects.create_user(f'reader{i}', f'reader{i}@example.com')
+            for i in range(5)
+        ]
+        self.content = create_content(self.author)
+
+    def toggle(self, user):
+        # Notifications are written once the toggle's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(user, 'content', self.content.pk)
+
+    def unread(self):
+        return UnreadCounts.objects.get(pk=self.author.pk).notifications
+
+    def test_coalesced_likes(self):
+        for reader in self.readers:
+            self.toggle(reader)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.from_user, self.readers[4])
+        self.assertEqual(
+            notification.recent_actors,
+            [reader.pk for reader in self.readers[:1:-1]],
+        )
+        self.assertEqual(self.unread(), 1)
+
+    def test_relike_counted_once(self):
+        self.toggle(self.readers[0])
+        self.toggle(self.readers[0])
+        self.toggle(self.readers[0])
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(self.unread(), 1)
+
+    def test_retract_latest_actor(self):
+        for reader in self.readers[:3]:
+            self.toggle(reader)
+
+        self.toggle(self.readers[2])
+
+        # The previous actor becomes the latest one
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.from_user, self.readers[1])
+        self.assertEqual(
+            notification.recent_actors,
+            [self.readers[1].pk, self.readers[0].pk],
+        )
+
+    def test_relike_out_of_recent_actors(self):
+        for reader in self.readers[:4]:
+            self.toggle(reader)
+
+        # The first reader is no longer listed, but is counted
+        self.toggle(self.readers[0])
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 3)
+
+        self.toggle(self.readers[0])
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor_count, 4)
+
+    def test_retract_never_below_listed_actors(self):
+        self.toggle(self.readers[0])
+        self.toggle(self.readers[1])
+        Notification.objects.update(actor_count=3)
+
+        # Likes from before the notification, taken back
+        for reader in self.readers[2:4]:
+            ContentLike.objects.create(content=self.content, user=reader)
+            self.toggle(reader)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(
+            notification.recent_actors,
+            [self.readers[1].pk, self.readers[0].pk],
+        )
+
+    def test_retract_last_actor(self):
+        self.toggle(self.readers[0])
+        self.toggle(self.readers[0])
+
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(self.unread(), 0)
+
+    def test_read_notification_kept(self):
+        self.toggle(self.readers[0])
+        Notification.objects.update(is_read=True)
+
+        # Unliking leaves read notifications; a new like starts a new one
+        self.toggle(self.readers[0])
+        self.toggle(self.readers[1])
+
+        self.assertEqual(Notification.objects.filter(is_read=True).count(), 1)
+        notification = Notification.objects.get(is_read=False)
+        self.assertEqual(notification.from_user, self.readers[1])
+        self.assertEqual(notification.actor_count, 1)
+
+    def test_own_events_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(
+                content=self.content, author=self.author, text='Comment'
+            )
+        self.toggle(self.author)
+
+        self.assertFalse(Notification.objects.exists())
+
+    def test_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for reader in self.readers:
+                    Follow.objects.create(
+                        following_user=reader, followed_user=self.author
+                    )
+                    Comment.objects.create(
+                        content=self.content, author=reader, text='Comment'
+                    )
+
+                # Nothing is written before the transaction commits
+                self.assertFalse(Notification.objects.exists())
+
+        self.assertEqual(
+            sorted(Notification.objects.values_list(
+                'notification_type', 'actor_count'
+            )),
+            [('comment', 5), ('follow', 5)],
+        )
+        self.assertEqual(self.unread(), 2)
+
+    def test_rolled_back_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(
+                following_user=self.readers[0], followed_user=self.author
+            )
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(
+                        following_user=self.readers[1],
+                        followed_user=self.author,
+                    )
+                    Follow.objects.create(
+                        following_user=self.author,
+                        followed_user=self.readers[0],
+                    )
+                    raise ValueError
+            except ValueError:
+                pass
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.user, self.author)
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(notification.recent_actors, [self.readers[0].pk])
+
+
+class CleanupMessagesTests(TestCase):
+    """cleanup_messages deletes expired messages by id ranges."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'user@example.com')
+        self.old = timezone.now() - datetime.timedelta(days=400)
+
+    def create_messages(self, count, deleted=True, old=True):
+        messages = [
+            Message.objects.create(
+                sender=self.user,
+                recipient=self.user,
+                subject='Subject',
+                message='Message',
+                is_deleted_by_sender=True,
+                is_deleted_by_recipient=deleted,
+            )
+            for _ in range(count)
+        ]
+        if old:
+            Message.objects.filter(
+                pk__in=[message.pk for message in messages]
+            ).update(created_date=self.old)
+        return [message.pk for message in messages]
+
+    def cleanup_messages(self, **options):
+        out = StringIO()
+        call_command(
+            'cleanup_messages', chunk_size=4, sleep=0, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_expired_messages(self):
+        expired = self.create_messages(10)
+        kept = (
+            self.create_messages(3, deleted=False)
+            + self.create_messages(3, old=False)
+        )
+
+        output = self.cleanup_messages(dry_run=True)
+        self.assertIn('10 expired messages would be deleted', output)
+        self.assertEqual(Message.objects.count(), 16)
+
+        output = self.cleanup_messages()
+        self.assertIn('10 expired messages deleted', output)
+        self.assertFalse(Message.objects.filter(pk__in=expired).exists())
+        self.assertEqual(Message.objects.filter(pk__in=kept).count(), 6)
+
+    def test_id_gaps(self):
+        first = self.create_messages(2)
+        self.create_messages(20, deleted=False)
+        last = self.create_messages(2)
+
+        output = self.cleanup_messages()
+        self.assertIn('4 expired messages deleted', output)
+        self.assertFalse(Message.objects.filter(pk__in=first + last).exists())
+        self.assertEqual(Message.objects.count(), 20)
+
+    def test_checkpoint(self):
+        expired = self.create_messages(12)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoint')
+
+            output = self.cleanup_messages(
+                checkpoint_file=path, max_seconds=0.000000001
+            )
+            self.assertIn('Stopped at id', output)
+            self.assertTrue(os.path.exists(path))
+
+            # Resume after the first eight messages
+            with open(path, 'w') as checkpoint:
+                checkpoint.write(str(expired[8]))
+            self.cleanup_messages(checkpoint_file=path)
+
+            self.assertFalse(os.path.exists(path))
+
+        self.assertQuerySetEqual(
+            Message.objects.order_by('pk').values_list('pk', flat=True),
+            expired[:8],
+        )
+
+    @override_settings(MESSAGE_RETENTION_DAYS=0)
+    def test_retention_disabled(self):
+        self.create_messages(2)
+
+        output = self.cleanup_messages()
+        self.assertIn('disabled', output)
+        self.assertEqual(Message.objects.count(), 2)
+
+        # An explicit age still applies
+        self.cleanup_messages(days=30)
+        self.assertFalse(Message.objects.exists())
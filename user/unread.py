@@ -0,0 +1,122 @@
+"""
+Denormalized unread message and notification counts.
+
+Each user has an UnreadCounts row that is adjusted where messages and
+notifications are created, read or deleted, so the navbar badges cost a
+primary key lookup instead of two COUNT queries, and always show the
+current counts without writing to the session.
+"""
+
+from collections import namedtuple
+
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Message, Notification, UnreadCounts
+
+Counts = namedtuple('Counts', ['messages', 'notifications'])
+
+
+def unread_messages(user_ids):
+    """Return the query of the users' unread inbox messages."""
+
+    return Message.objects.filter(
+        recipient_id__in=user_ids,
+        is_read=False,
+        is_deleted_by_recipient=False,
+    )
+
+
+def unread_notifications(user_ids):
+    """Return the query of the users' unread notifications."""
+
+    return Notification.objects.filter(user_id__in=user_ids, is_read=False)
+
+
+def counts_message(message):
+    """Tell whether a message counts as unread for its recipient."""
+
+    return (
+        message.recipient_id is not None
+        and not message.is_read
+        and not message.is_deleted_by_recipient
+    )
+
+
+def counts_notification(notification):
+    """Tell whether a notification counts as unread for its user."""
+
+    return notification.user_id is not None and not notification.is_read
+
+
+def compute(user_ids):
+    """Count the users' unread messages and notifications from scratch."""
+
+    messages = dict(
+        unread_messages(user_ids).order_by().values('recipient_id').annotate(
+            total=Count('pk')
+        ).values_list('recipient_id', 'total')
+    )
+    notifications = dict(
+        unread_notifications(user_ids).order_by().values('user_id').annotate(
+            total=Count('pk')
+        ).values_list('user_id', 'total')
+    )
+
+    return {
+        user_id: Counts(
+            messages.get(user_id, 0), notifications.get(user_id, 0)
+        )
+        for user_id in user_ids
+    }
+
+
+def refresh(user_id):
+    """Recompute and store a user's counts, returning them."""
+
+    counts = compute([user_id])[user_id]
+    UnreadCounts.objects.update_or_create(
+        user_id=user_id, defaults=counts._asdict()
+    )
+    return counts
+
+
+def add(user_id, messages=0, notifications=0):
+    """
+    Adjust a user's counts by the given deltas.
+
+    Call it in the transaction that changed the messages or
+    notifications, after the change.
+    """
+
+    if user_id is None or not (messages or notifications):
+        return
+
+    updated = UnreadCounts.objects.filter(user_id=user_id).update(
+        messages=Greatest(F('messages') + messages, 0),
+        notifications=Greatest(F('notifications') + notifications, 0),
+    )
+
+    # No row yet: count everything, including this change
+    if not updated:
+        refresh(user_id)
+
+
+def get_counts(request):
+    """Return the unread counts of the request's user."""
+
+    if hasattr(request, '_unread_counts'):
+        return request._unread_counts
+
+    row = UnreadCounts.objects.filter(pk=request.user.pk).values_list(
+        'messages', 'notifications'
+    ).first()
+    counts = Counts(*row) if row else refresh(request.user.pk)
+
+    request._unread_counts = counts
+    return counts
+
+
+def forget(request):
+    """Drop the counts read earlier in the request after a read or delete."""
+    request.__dict__.pop('_unread_counts', None)
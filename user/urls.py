@@ -38,9 +38,21 @@ urlpatterns = [
     path('send_message/', views.send_message,
          name='send_message'),  # Path for sending a message
 
+    path('send_message/recipients/', views.recipient_lookup,
+         name='recipient_lookup'),  # Path to recipient suggestions as JSON
+
+    path('conversations/', views.conversation_list,
+         name='conversation_list'),  # Path for listing conversations
+
+    path('conversations/<str:username>/', views.conversation_detail,
+         name='conversation_detail'),  # Path for a conversation's messages
+
     path('<str:box_type>/', views.message_list,
          name='message_list'),  # Path for listing messages by box type
 
+    path('message/search/', views.message_search,
+         name='message_search'),  # Path for searching messages
+
     path('message/<int:pk>/', views.message_detail,
          name='message_detail'),  # Path for message detail view
 
@@ -64,6 +76,9 @@ urlpatterns = [
          views.notification_redirect,  # Path for redirecting to a notification
          name='notification_redirect'),
 
+    path('user/notifications/mark_read/', views.mark_notifications_read,
+         name='mark_notifications_read'),  # Path for marking notifications read
+
 
     # Email verification URLs
     path('user/email_verification/', views.email_verification,
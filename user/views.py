@@ -5,26 +5,47 @@ from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
 from django.core.mail import send_mail
 from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Q
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 
 from content.models import Content
+from pages.pagination import paginate, paginate_ranked
 from .forms import (
     EmailVerificationForm,
     EmailVerificationRequestForm,
     MessageForm,
+    MessageSearchForm,
     ProfileForm,
     RegisterForm,
     UserUpdateForm
 )
-from .models import EmailVerification, Message, Notification, Profile
+from . import conversations, mailbox, message_index, unread
+from .models import (
+    Conversation,
+    EmailVerification,
+    Message,
+    Notification,
+    Profile
+)
 from .services import (
     follow_user,
     get_followers,
     get_following,
     is_following,
+    search_users,
     unfollow_user
 )
 
+# Fields read to list notifications, all stored on the notification.
+NOTIFICATION_DISPLAY_FIELDS = (
+    'notification_type', 'comment_id', 'actor_name', 'actor_avatar',
+    'actor_count', 'target_title', 'updated_date', 'is_read',
+)
+
 
 def register(request):
     """Handles user registration and sends email verification code."""
@@ -170,14 +191,14 @@ def dashboard(request):
 
     if content_type:
         # If content type is specified, filter the content by that type
-        contents = Content.objects.filter(
+        contents = Content.objects.for_listing().with_stats().filter(
             author=request.user, content_type=content_type
             ).order_by('-created_date')
     else:
         # If no content type is specified, retrieve all content by the user
-        contents = Content.objects.filter(author=request.user).order_by(
-            '-created_date'
-        )
+        contents = Content.objects.for_listing().with_stats().filter(
+            author=request.user
+        ).order_by('-created_date')
 
     # Paginate the content (10 items per page)
     paginator = Paginator(contents, 10)
@@ -288,7 +309,9 @@ def send_message(request):
             message = form.save(commit=False)
             # Set the sender as the current user
             message.sender = request.user
-            message.save()
+            # Saved with the unread count and conversation updates
+            with transaction.atomic():
+                message.save()
 
             # Display a success message after sending the message
             messages.success(
@@ -306,33 +329,41 @@ def send_message(request):
     return render(request, 'user/send_message.html', context)
 
 
+@login_required
+def recipient_lookup(request):
+    """Returns the users whose username starts with a prefix, as JSON."""
+
+    # Followed users first, capped so every lookup stays small
+    query = request.GET.get('q', '')[:150]
+    users = search_users(
+        request.user, query, settings.RECIPIENT_LOOKUP_LIMIT
+    )
+
+    # Let the browser reuse answers while the user edits the name
+    response = JsonResponse({
+        'query': query,
+        'results': [
+            {'id': user.pk, 'username': user.username} for user in users
+        ],
+    })
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
+
+
 @login_required
 def message_list(request, box_type):
     """Displays the list of messages in the user's inbox or outbox."""
 
-    if box_type == 'inbox':
-        # Retrieve inbox messages, filter by recipient and not deleted
-        messages_list = Message.objects.filter(
-            recipient=request.user, 
-            is_deleted_by_recipient=False
-        ).select_related('sender').order_by('-created_date')
-
-    elif box_type == 'outbox':
-        # Retrieve outbox messages, filter by sender and not deleted
-        messages_list = Message.objects.filter(
-            sender=request.user, 
-            is_deleted_by_sender=False
-        ).select_related('recipient').order_by('-created_date')
+    # Retrieve the box's messages that are not deleted on the user's side
+    messages_list = mailbox.get_box(request.user, box_type)
 
-    else:
+    if messages_list is None:
         # Handle invalid box type and redirect to inbox
         messages.error(request, 'Invalid box type.')
         return redirect('message_list', box_type='inbox')
     
     # Paginate the messages (10 items per page)
-    paginator = Paginator(messages_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, messages_list, 10)
     
      # Pass the paginated messages and box type to the template
     context = {
@@ -342,6 +373,90 @@ def message_list(request, box_type):
     return render(request, 'user/message_list.html', context)
 
 
+@login_required
+def message_search(request):
+    """Searches the subjects and texts of the user's messages."""
+
+    search_form = MessageSearchForm(request.GET or None)
+    search_query = ''
+    page_obj = None
+
+    if search_form.is_valid():
+        search_query = search_form.cleaned_data['search_query'].strip()
+
+    if search_query:
+        # Only messages the user has not deleted, from either box
+        messages_list = mailbox.messages(request.user).select_related(
+            'sender', 'recipient'
+        )
+
+        # Look the query up in the user's part of the index, best first
+        ranked_ids = message_index.search(request.user.pk, search_query)
+
+        if ranked_ids is not None:
+            page_obj = paginate_ranked(request, ranked_ids, messages_list, 10)
+        else:
+            # Fall back to plain filters if no index is available
+            page_obj = paginate(request, messages_list.filter(
+                Q(subject__icontains=search_query)
+                | Q(message__icontains=search_query)
+            ), 10)
+
+    # Pass the form, query and matching messages to the template
+    context = {
+        "search_form": search_form,
+        "search_query": search_query,
+        "page_obj": page_obj,
+    }
+    return render(request, 'user/message_search.html', context)
+
+
+@login_required
+def conversation_list(request):
+    """Displays the user's conversations, most recently active first."""
+
+    # Read the user's summary rows with their last message subjects
+    conversations_list = Conversation.objects.filter(
+        user=request.user
+    ).select_related(
+        'correspondent__profile', 'last_message'
+    ).only(
+        'last_date', 'message_count', 'unread_count',
+        'correspondent__username', 'correspondent__profile__image',
+        'last_message__subject',
+    ).order_by('-last_date', '-id')
+
+    # Paginate the conversations (10 items per page)
+    page_obj = paginate(request, conversations_list, 10, 'last_date')
+
+    # Pass the paginated conversations to the template
+    context = {"page_obj": page_obj}
+    return render(request, 'user/conversation_list.html', context)
+
+
+@login_required
+def conversation_detail(request, username):
+    """Displays the user's messages with a correspondent, newest first."""
+
+    # Retrieve the correspondent or return 404 if not found
+    correspondent = get_object_or_404(User, username=username)
+
+    # Messages between the two users not deleted on the user's side
+    messages_list = mailbox.thread(
+        request.user.pk, correspondent.pk
+    ).select_related('sender')
+
+    # Paginate the messages (10 items per page)
+    page_obj = paginate(request, messages_list, 10)
+
+    # Pass the paginated messages and the correspondent to the template
+    context = {
+        "page_obj": page_obj,
+        "correspondent": correspondent,
+    }
+    return render(request, 'user/conversation_detail.html', context)
+
+
 @login_required
 def message_detail(request, pk):
     """Displays the details of a specific message."""
@@ -352,7 +467,15 @@ def message_detail(request, pk):
     # Mark message as read if in user's inbox and unread
     if message.recipient == request.user and not message.is_read:
         message.is_read = True
-        message.save(update_fields=['is_read'])
+        with transaction.atomic():
+            # Only the request that flips the flag adjusts the count
+            read = Message.objects.filter(pk=message.pk, is_read=False).update(
+                is_read=True
+            )
+            if read and not message.is_deleted_by_recipient:
+                unread.add(request.user.pk, messages=-1)
+                conversations.read(message)
+        unread.forget(request)
 
     # Redirect to inbox if user is not sender or recipient
     if request.user != message.sender and request.user != message.recipient:
@@ -383,17 +506,36 @@ def delete_message(request, message_id):
         return redirect('message_list', box_type='inbox')
     
     if request.method == 'POST':
-        # Mark the message as deleted by the sender and/or recipient
-        if is_sender and is_recipient:
-            message.is_deleted_by_sender = True
-            message.is_deleted_by_recipient = True
-        elif is_sender:
-            message.is_deleted_by_sender = True
-        elif is_recipient:
-            message.is_deleted_by_recipient = True
-
-        # Save the updated message and display a success message
-        message.save()
+        with transaction.atomic():
+            # Lock the message so its unread state cannot change meanwhile
+            message = Message.objects.select_for_update().get(pk=message.pk)
+
+            counted = is_recipient and unread.counts_message(message)
+
+            # Still shown to the user, unless deleted already
+            shown = (
+                (is_sender and not message.is_deleted_by_sender)
+                or (is_recipient and not message.is_deleted_by_recipient)
+            )
+
+            # Mark the message as deleted by the sender and/or recipient
+            if is_sender:
+                message.is_deleted_by_sender = True
+            if is_recipient:
+                message.is_deleted_by_recipient = True
+
+            # Save the updated message, no longer counted if it was unread
+            message.save(update_fields=[
+                'is_deleted_by_sender', 'is_deleted_by_recipient'
+            ])
+            if counted:
+                unread.add(request.user.pk, messages=-1)
+            if shown:
+                conversations.remove(message, request.user.pk, counted)
+                message_index.remove_message(message, request.user.pk)
+        unread.forget(request)
+
+        # Display a success message
         messages.success(request, 'Message deleted successfully.')
 
         # Redirect to the message list (inbox)
@@ -421,9 +563,9 @@ def profile_view(request, username):
         filter_kwargs['content_type'] = content_type
 
     # Fetch the content based on filter criteria, ordered by creation date
-    contents = Content.objects.filter(**filter_kwargs).order_by(
-        '-created_date'
-    )
+    contents = Content.objects.for_listing().with_stats().filter(
+        **filter_kwargs
+    ).order_by('-created_date')
 
      # Paginate the content (10 items per page)
     paginator = Paginator(contents, 10)
@@ -558,24 +700,17 @@ def follow_list(request, username, follow_type):
 def notification_list(request):
     """Displays a list of notifications for the logged-in user."""
 
-    # Retrieve notifications for the logged-in user, ordered by creation date
-    notifications = Notification.objects.filter(user=request.user).order_by(
-        '-created_date'
-    )
-
-    # Exclude comment/like notifications where user is sender
-    notifications = notifications.exclude(
-        notification_type__in=['comment', 'like'],
-        from_user=request.user
-    )
+    # Retrieve notifications for the logged-in user, latest activity first,
+    # with only the fields copied in for display
+    notifications = Notification.objects.filter(user=request.user).only(
+        *NOTIFICATION_DISPLAY_FIELDS
+    ).order_by('-updated_date', '-id')
     
-    # Count the unread notifications
-    unread_notifications_count = notifications.filter(is_read=False).count()
+    # Unread notifications, from the denormalized count
+    unread_notifications_count = unread.get_counts(request).notifications
 
     # Paginate notifications (10 items per page)
-    paginator = Paginator(notifications, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, notifications, 10, 'updated_date')
 
     # Pass the paginated notifications and unread count to the template context
     context = {
@@ -589,46 +724,61 @@ def notification_list(request):
 
 @login_required
 def notification_redirect(request, notification_id):
-    """Redirects user based on the notification type."""
+    """Marks a notification as read and redirects to its target page."""
 
     # Retrieve the notification or return a 404 error if not found
-    notification = get_object_or_404(Notification, id=notification_id)
+    notification = get_object_or_404(
+        Notification.objects.only('user_id', 'is_read', 'target_url'),
+        id=notification_id,
+    )
 
     # Ensure the notification belongs to the current user
-    if notification.user != request.user:
+    if notification.user_id != request.user.pk:
         raise PermissionDenied(
             "You are not authorized to view this notification."
         )
 
     # Mark the notification as read if it hasn't been already
     if not notification.is_read:
-        notification.is_read = True
-        notification.save()
-
-    # Redirect based on the notification type
-    if notification.notification_type == 'comment':
-        # Redirect to content detail page if notification is for comment
-        return redirect(
-            'content_detail', content_id=notification.comment.content.id
-        )
-    
-    elif notification.notification_type == 'like':
-        # Redirect to the content detail page if the notification is for a like
-        if notification.content:
-            return redirect(
-                'content_detail', content_id=notification.content.id
-            )
-        # If like is for a comment, redirect to the comment's content
-        elif notification.comment and notification.comment.content:
-            return redirect(
-                'content_detail', content_id=notification.comment.content.id
-            )
-    
-    elif notification.notification_type == 'follow' and notification.from_user:
-        # Redirect to profile view page if notification is for a follow action
-        return redirect(
-            'profile_view', username=notification.from_user.username
-        )
+        with transaction.atomic():
+            # Only the request that flips the flag adjusts the count
+            read = Notification.objects.filter(
+                pk=notification.pk, is_read=False
+            ).update(is_read=True)
+            if read:
+                unread.add(request.user.pk, notifications=-1)
+        unread.forget(request)
+
+    # Redirect to the page recorded with the notification, if any
+    return redirect(notification.target_url or 'notification_list')
+
+
+@login_required
+@require_POST
+def mark_notifications_read(request):
+    """Marks all notifications, or those of a page, as read."""
+
+    notifications = Notification.objects.filter(
+        user=request.user, is_read=False
+    )
 
-    # If no valid notification type, redirect to the notification list page
-    return redirect('notification_list')
+    # Only the listed notifications when marking a page
+    if request.POST.get('scope') == 'page':
+        ids = [
+            pk for pk in request.POST.getlist('notification_ids')
+            if pk.isdigit()
+        ]
+        notifications = notifications.filter(pk__in=ids)
+
+    # One UPDATE, and the count lowered by the rows it changed
+    with transaction.atomic():
+        read = notifications.update(is_read=True)
+        unread.add(request.user.pk, notifications=-read)
+    unread.forget(request)
+
+    messages.success(request, f'{read} notifications marked as read.')
+
+    # Back to the page the user was on
+    page = request.POST.get('page', '')
+    url = reverse('notification_list')
+    return redirect(f'{url}?page={page}' if page.isdigit() else url)